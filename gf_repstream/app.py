@@ -7,6 +7,7 @@ import pkg_resources
 from enum import Enum
 from systemd import journal
 from cli import SRepeater
+from metrics import CONTENT_TYPE, render_metrics
 
 __author__ = "Leonardo Hax Damiani"
 __date_created__ = "2020-12-02"
@@ -95,14 +96,15 @@ def start_rest_api(port, config_file):
 
     @app.route("/get_status", methods=["GET"])
     def get_status():
-        """Gets the configuration from the stream repeater object.
+        """Gets the configuration and the output stream statistics from the stream repeater object.
 
         Returns:
-            HTTP response with status of the request, configuration and state of the stream repeater.
+            HTTP response with status of the request, configuration, statistics and state of the stream repeater.
         """
 
         try:
             config = repeater.get_config()
+            stats = repeater.get_stats()
             state_return = (app.config["state"].name, app.config["state"].value)
             _logger.debug(f"Service Rest Stream Repeater: {state_return}")
         except BaseException as err:
@@ -113,10 +115,74 @@ def start_rest_api(port, config_file):
                 200,
             )
         return make_response(
-            jsonify({"response": "success", "state": state_return, "config": config}),
+            jsonify(
+                {
+                    "response": "success",
+                    "state": state_return,
+                    "config": config,
+                    "stats": stats,
+                }
+            ),
             200,
         )
 
+    @app.route("/get_gaps", methods=["GET"])
+    def get_gaps():
+        """GET request with the most recent gaps (missing frames) of the incoming stream.
+
+        Returns:
+            HTTP response with status of the request and the gaps as [first, last] missing frame numbers.
+        """
+        try:
+            gaps = repeater.get_gaps()
+        except BaseException as err:
+            return make_response(
+                jsonify(
+                    {"response": "error", "error": f"Unexpected {err=}, {type(err)=}"}
+                ),
+                200,
+            )
+        return make_response(
+            jsonify({"response": "success", "gaps": gaps}),
+            200,
+        )
+
+    @app.route("/get_latency", methods=["GET"])
+    def get_latency():
+        """GET request with the latency histograms of the output streams.
+
+        Returns:
+            HTTP response with status of the request and the latency summary of each stage per output stream.
+        """
+        try:
+            latency = repeater.get_latency()
+        except BaseException as err:
+            return make_response(
+                jsonify(
+                    {"response": "error", "error": f"Unexpected {err=}, {type(err)=}"}
+                ),
+                200,
+            )
+        return make_response(
+            jsonify({"response": "success", "latency": latency}),
+            200,
+        )
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        """GET request with the data plane counters in the Prometheus text format.
+
+        Returns:
+            HTTP response with the metrics page.
+        """
+        try:
+            page = render_metrics(repeater.get_stats())
+        except BaseException as err:
+            return make_response(f"# Unexpected {err=}, {type(err)=}\n", 500)
+        response = make_response(page, 200)
+        response.headers["Content-Type"] = CONTENT_TYPE
+        return response
+
     @app.route("/get_state", methods=["GET"])
     def get_state():
         """GET request to load the state from the stream repeater object.
@@ -1,22 +1,34 @@
 #!/usr/bin/env python
 
 import inspect
+import itertools
 import logging
 import os
 import zmq
 import sys
 import json
 from pathlib import Path
-from collections import deque
 from functools import partial
 from threading import Thread, Event
-from time import sleep
 from systemd import journal
 
 
 # from gf_repstream import __version__
+from dispatch import ADAPTIVE, SEND_OUTPUT_MODES, valid_output_param
+from compression import COMPRESSION_KEYS, codec_available, valid_compression
+from frame_pool import FramePool
+from frame_queue import FrameQueue, POLICIES
+from merger import Merger
+from pipeline import pipeline_config, valid_pipeline
+from process_engine import ProcessEngine
+from reactor import Reactor
 from receiver import Receiver
-from streamer import Streamer
+from recorder import RECORD_DEFAULTS
+from reorder import ReorderBuffer
+from shm_ring import MAX_CONSUMERS
+from streamer import SHM_DEFAULTS, Streamer
+from transform import TRANSFORM_KEYS, valid_transform
+from udp_ingest import UdpIngest, valid_udp
 from utils import (validate_zmq_mode, 
                     validate_network_address, 
                     validate_ip_address,
@@ -37,21 +49,37 @@ class RepStreamError(NoTraceBackWithLineNumber):
 
 _logger = logging.getLogger("RestStreamRepeater")
 
+# frames kept by the queue of each output stream
+BUFFER_SIZE = 100000
+
 
 class SRepeater(object):
     """The multithreaded stream repeater object class that receives
     an incoming stream and multiplexes it into multiple outputs with
     different characteristics.
     Args:
-            in_address (str, optional): Incoming ZMQ address. Defaults to "tcp://xbl-daq-23:9990".
+            in_address (str, optional): Incoming ZMQ address, or list of addresses of incoming streams to merge. Defaults to "tcp://xbl-daq-23:9990".
             in_zmq_mode (int, optional): Incoming ZMQ mode. Defaults to PULL.
             io_threads (int, optional): ZMQ IO threads. Defaults to 1.
-            buffer_size (int, optional): ZMQ buffer size. Defaults to 5000.
+            buffer_size (int, optional): Maximum number of frames of each output stream queue. Defaults to None (BUFFER_SIZE frames).
             n_output_streams (int, optional): Number of output streams. Defaults to None.
             send_output_mode (list, optional): List containing the ZMQ mode of the generated output streams. Defaults to None.
             send_output_param (list, optional): List containing the output streams configuration parameter. Defaults to None.
             config_file (str, optional): Path to the config file. Defaults to None.
             frame_block (int, optional): Total number of frames to create a block. Defaults to 15
+            zero_copy (bool, optional): Receives and forwards the payloads without copying them. Defaults to False.
+            memory_budget (int, optional): Maximum size in bytes of the frames held by all the output streams. Defaults to None (no limit).
+            timestamps (bool, optional): Stamps the frames at ingress to measure the latency of each stage. Defaults to False.
+            metrics (bool, optional): Counts the received and sent bytes for the /metrics endpoint. Defaults to True.
+            engine (str, optional): "threaded" (one thread per output stream), "reactor" (single threaded zmq poller loop, experimental) or "processes" (ingest and output streams in separate processes sharing a ring of frames). Defaults to "threaded".
+            merge_window (int, optional): Frames older than the newest frame minus the window are given up by the merge of several incoming streams. Defaults to 100.
+            merge_timeout_ms (float, optional): Time in ms a frame waits for its missing parts from the other incoming streams. Defaults to 1000.
+            reorder (dict, optional): Releases the frames in frame number order, with max_delay_ms, max_size and max_gaps (all optional). Defaults to None (disabled).
+            ring_slots (int, optional): Number of frame slots of the shared memory ring (processes engine). Defaults to 16.
+            ring_slot_size (int, optional): Maximum size in bytes of one frame in the shared memory ring (processes engine). Defaults to 16 MiB.
+            ring_policy (str, optional): "block" (waits for the slowest output process) or "drop_newest" when the ring is full (processes engine). Defaults to "block".
+            output_processes (int, optional): Number of output processes (processes engine). Defaults to None (one per output stream).
+            udp (dict, optional): Binds the UDP ports of the detector and assembles the frames from its packets instead of receiving an incoming zmq stream (see udp_ingest.valid_udp). Defaults to None.
 
         Raises:
             RuntimeError: The object can't go on if the configuration file is not defined.
@@ -63,13 +91,26 @@ class SRepeater(object):
         in_address="tcp://xbl-daq-33:9980",
         in_zmq_mode="PULL",
         io_threads=5,
-        buffer_size=100000,
+        buffer_size=None,
         n_output_streams=None,
         send_output_mode=None,
         send_output_param=None,
         config_file=None,
         writer_config={},
-        frame_block=15
+        frame_block=15,
+        zero_copy=False,
+        engine="threaded",
+        memory_budget=None,
+        metrics=True,
+        timestamps=False,
+        merge_window=100,
+        merge_timeout_ms=1000,
+        reorder=None,
+        ring_slots=16,
+        ring_slot_size=16 * 2**20,
+        ring_policy="block",
+        output_processes=None,
+        udp=None
     ):
         self._in_address = in_address
         self._in_zmq_mode = in_zmq_mode
@@ -79,16 +120,45 @@ class SRepeater(object):
         self._send_output_mode = send_output_mode
         self._send_output_param = send_output_param
         self._stream_ports = []
+        self._stream_addresses = []
+        self._shms = []
+        self._records = []
+        self._transforms = []
+        self._compressions = []
+        self._pipelines = []
         self._zmq_modes = []
         self._stream_names = []
+        self._spin_times = []
+        self._policies = []
+        self._max_ages = []
         self._config_file = config_file
         self._frame_block = frame_block
         self._writer_config = writer_config
+        self._zero_copy = zero_copy
+        self._engine = engine
+        self._memory_budget = memory_budget
+        self._metrics = metrics
+        self._timestamps = timestamps
+        self._inject_timestamps = []
+        self._merge_window = merge_window
+        self._merge_timeout_ms = merge_timeout_ms
+        self._reorder = reorder
+        self._ring_slots = ring_slots
+        self._ring_slot_size = ring_slot_size
+        self._ring_policy = ring_policy
+        self._output_processes = output_processes
+        self._udp = udp
         # not part of config
         self._r = None
         self._config_changed = False
         self._exit_event = Event()
         self._list_threads = []
+        self._streamers = []
+        self._pool = None
+        self._receiver = None
+        self._merger = None
+        self._process_engine = None
+        self._udp_ingest = None
         _logger.debug("RepStreamer.Cli initializing...")
         # load config file
         if self._config_file is not None:
@@ -102,7 +172,7 @@ class SRepeater(object):
         Yields:
             Prepares a list of the internal variables of the streamer object with name and value
         """
-        ignore_list = ["config_changed", "_r", "_exit_event", "_list_threads"]
+        ignore_list = ["config_changed", "_r", "_exit_event", "_list_threads", "_streamers", "_pool", "_receiver", "_merger", "_process_engine", "_udp_ingest"]
         # first start by grabbing the Class items
         iters = dict((x, y) for x, y in self.__dict__.items() if (x[:2] != "__"))
         # then update the class items with the instance items
@@ -112,6 +182,54 @@ class SRepeater(object):
             if x not in ignore_list:
                 yield x[1:], y
 
+    def get_stats(self):
+        """Gets the statistics of the output streams of the current run.
+
+        Returns:
+            dict: dictionary with the statistics of the incoming stream, of each output stream and of the memory budget.
+        """
+        if self._process_engine is not None:
+            return self._process_engine.get_stats()
+        dispatch = [{}] * len(self._streamers)
+        if self._receiver is not None:
+            dispatch = self._receiver.get_dispatch_stats()
+        stream_input = None
+        if self._udp_ingest is not None:
+            stream_input = self._udp_ingest.get_stats()
+        elif self._merger is not None:
+            stream_input = self._merger.get_stats()
+        elif self._receiver is not None:
+            stream_input = self._receiver.get_stats()
+        return {
+            "input": stream_input,
+            "outputs": {
+                name: dict(streamer.get_stats(), **dispatch_stats)
+                for name, streamer, dispatch_stats in zip(self._stream_names, self._streamers, dispatch)
+            },
+            "memory": None if self._pool is None else self._pool.get_stats(),
+        }
+
+    def get_latency(self):
+        """Gets the latency histograms of the output streams of the current run.
+
+        Returns:
+            dict: dictionary with the latency summary of each stage, per output stream.
+        """
+        return {
+            name: streamer.get_latency()
+            for name, streamer in zip(self._stream_names, self._streamers)
+        }
+
+    def get_gaps(self):
+        """Gets the most recent gaps (missing frames) of the incoming stream.
+
+        Returns:
+            list: the gaps as [first, last] missing frame numbers, empty without reorder buffer.
+        """
+        if self._receiver is None:
+            return []
+        return self._receiver.get_gaps()
+
     def get_config(self):
         """Gets the configuration of the streamer object.
 
@@ -142,29 +260,83 @@ class SRepeater(object):
                 self._send_output_mode = []
                 self._stream_names = []
                 self._stream_ports = []
+                self._stream_addresses = []
+                self._shms = []
+                self._records = []
+                self._transforms = []
+                self._compressions = []
+                self._pipelines = []
                 self._zmq_modes = []
                 self._send_output_mode = []
+                self._spin_times = []
+                self._policies = []
+                self._max_ages = []
+                self._inject_timestamps = []
                 try:
                     # prepares the input stream parameters
-                    self._in_address = json_config["in-stream"]["address"]
-                    self._in_zmq_mode = json_config["in-stream"]["zmq_mode"]
+                    # a udp input binds the ports of the detector instead of connecting to an address
+                    self._udp = json_config["in-stream"].get("udp")
+                    if self._udp is None:
+                        self._in_address = json_config["in-stream"]["address"]
+                        self._in_zmq_mode = json_config["in-stream"]["zmq_mode"]
+                    self._zero_copy = json_config["in-stream"].get("zero_copy", self._zero_copy)
+                    # several incoming streams are aligned by frame number
+                    self._merge_window = json_config["in-stream"].get("merge_window", self._merge_window)
+                    self._merge_timeout_ms = json_config["in-stream"].get("merge_timeout_ms", self._merge_timeout_ms)
+                    # optional reorder buffer for out of order frames
+                    self._reorder = json_config["in-stream"].get("reorder", self._reorder)
+                    self._engine = json_config.get("engine", self._engine)
+                    self._memory_budget = json_config.get("memory_budget", self._memory_budget)
+                    self._metrics = json_config.get("metrics", self._metrics)
+                    self._timestamps = json_config.get("timestamps", self._timestamps)
+                    # shared memory ring of the processes engine
+                    self._ring_slots = json_config.get("ring_slots", self._ring_slots)
+                    self._ring_slot_size = json_config.get("ring_slot_size", self._ring_slot_size)
+                    self._ring_policy = json_config.get("ring_policy", self._ring_policy)
+                    self._output_processes = json_config.get("output_processes", self._output_processes)
                     for i in json_config["out-streams"]:
 
                         out_dict = json_config["out-streams"][i]
                         self._stream_names.append(i)
                         self._send_output_param.append(out_dict["send_output_param"])
                         self._send_output_mode.append(out_dict["send_output_mode"])
-                        if out_dict["zmq_mode"].upper() == "PUSH":
+                        # a recording output only publishes the recorded frame numbers
+                        zmq_mode = out_dict.get("zmq_mode", "PUB" if "record" in out_dict else None)
+                        if zmq_mode is None:
+                            raise RepStreamError("Zmq mode of the output stream missing (PUSH or PUB).")
+                        if zmq_mode.upper() == "PUSH":
                             self._zmq_modes.append(zmq.PUSH)
-                        elif out_dict["zmq_mode"].upper() == "PUB":
+                        elif zmq_mode.upper() == "PUB":
                             self._zmq_modes.append(zmq.PUB)
                         else:
                             raise RepStreamError("Zmq mode not recognized (PUSH or PUB).")
-                        self._stream_ports.append(out_dict["port"])
+                        self._stream_ports.append(out_dict.get("port"))
+                        # optional bind address (e.g. ipc://) and shared memory transport for local consumers
+                        self._stream_addresses.append(out_dict.get("address"))
+                        self._shms.append(out_dict.get("shm"))
+                        # optional recording of the frames to local disk instead of sending them
+                        self._records.append(out_dict.get("record"))
+                        # optional ROI crop, binning and dtype downcast of the sent images
+                        self._transforms.append(out_dict.get("transform"))
+                        # optional payload compression, by a worker pool
+                        self._compressions.append(out_dict.get("compression"))
+                        # optional processing stages run by a worker pool (transform and compression included)
+                        self._pipelines.append(out_dict.get("pipeline"))
+                        # optional low latency mode: polls the queue before blocking
+                        self._spin_times.append(out_dict.get("spin_time", 0))
+                        # backpressure policy when the output stream can't keep up
+                        policy = out_dict.get("policy", "drop_oldest")
+                        if policy not in POLICIES:
+                            raise RepStreamError(f"Backpressure policy not recognized ({', '.join(POLICIES)}).")
+                        self._policies.append(policy)
+                        self._max_ages.append(out_dict.get("max_age_ms"))
+                        # adds the ingress time to the sent headers
+                        self._inject_timestamps.append(out_dict.get("inject_timestamp", False))
                 except Exception as e:
                     raise RepStreamError("Gf_repstream config file with problems.")
                 self._n_output_streams = len(json_config["out-streams"])
                 self._config_changed = False
+                self.validate_configuration()
         _logger.debug("RepStreamer.CLI load_config from streamer object properties ...")
         self._exit_event.clear()
         return self.get_config()
@@ -195,6 +367,18 @@ class SRepeater(object):
                 self._send_output_param = value
             elif key == "stream_ports":
                 self._stream_ports = value
+            elif key == "stream_addresses":
+                self._stream_addresses = value
+            elif key == "shms":
+                self._shms = value
+            elif key == "records":
+                self._records = value
+            elif key == "transforms":
+                self._transforms = value
+            elif key == "compressions":
+                self._compressions = value
+            elif key == "pipelines":
+                self._pipelines = value
             elif key == "zmq_modes":
                 self._zmq_modes = value
             elif key == "config_file":
@@ -203,6 +387,40 @@ class SRepeater(object):
                 self._buffer_size = value
             elif key == "frame_block":
                 self._frame_block = value
+            elif key == "spin_times":
+                self._spin_times = value
+            elif key == "policies":
+                self._policies = value
+            elif key == "max_ages":
+                self._max_ages = value
+            elif key == "zero_copy":
+                self._zero_copy = value
+            elif key == "engine":
+                self._engine = value
+            elif key == "memory_budget":
+                self._memory_budget = value
+            elif key == "metrics":
+                self._metrics = value
+            elif key == "timestamps":
+                self._timestamps = value
+            elif key == "inject_timestamps":
+                self._inject_timestamps = value
+            elif key == "merge_window":
+                self._merge_window = value
+            elif key == "merge_timeout_ms":
+                self._merge_timeout_ms = value
+            elif key == "reorder":
+                self._reorder = value
+            elif key == "ring_slots":
+                self._ring_slots = value
+            elif key == "ring_slot_size":
+                self._ring_slot_size = value
+            elif key == "ring_policy":
+                self._ring_policy = value
+            elif key == "output_processes":
+                self._output_processes = value
+            elif key == "udp":
+                self._udp = value
         if self.validate_configuration():
             self._config_changed = True
             self.load_config()
@@ -247,6 +465,40 @@ class SRepeater(object):
         q_list = []
         streamer_list = []
         receiver_tuples = []
+        self._pool = None
+        self._streamers = []
+        self._receiver = None
+        self._merger = None
+        self._process_engine = None
+        self._udp_ingest = None
+        # the configuration may have been changed since it was loaded
+        self.validate_configuration()
+        if self._engine == "processes":
+            # ingest and output streams in separate processes, connected by a shared memory ring
+            self._process_engine = ProcessEngine(
+                names=self._stream_names,
+                tuples_list=list(zip(self._send_output_mode, self._send_output_param)),
+                ports=self._stream_ports,
+                addresses=self._stream_addresses,
+                pipelines=self._pipeline_configs(),
+                zmq_modes=self._zmq_modes,
+                # a single incoming stream (validate_configuration)
+                in_address=self._in_address[0] if isinstance(self._in_address, list) else self._in_address,
+                in_zmq_mode=self._in_zmq_mode,
+                frame_block=self._frame_block,
+                io_threads=self._io_threads,
+                writer_config=self._writer_config,
+                zero_copy=self._zero_copy,
+                n_processes=self._output_processes,
+                n_slots=self._ring_slots,
+                slot_size=self._ring_slot_size,
+                block=self._ring_policy == "block"
+            )
+            self._process_engine.start()
+            return
+        if self._memory_budget is not None:
+            # one budget for the frames held by all the output streams
+            self._pool = FramePool(budget=self._memory_budget)
         if self._n_output_streams == 0:
             raise RepStreamError(
                 "Number of output streams must be greater than zero. Halting execution of gf_repstream."
@@ -260,19 +512,35 @@ class SRepeater(object):
                 "Problem with the number of output streams, modes and parameters. They must be identical."
             )
 
+        pipelines = self._pipeline_configs()
         for i in range(self._n_output_streams):
-            # deque for each output stream
-            q_list.append(deque(maxlen=self._buffer_size))
+            # queue for each output stream
+            spin_time = self._spin_times[i] if i < len(self._spin_times) else 0
+            policy = self._policies[i] if i < len(self._policies) else "drop_oldest"
+            max_age = self._max_ages[i] if i < len(self._max_ages) else None
+            q_list.append(FrameQueue(maxlen=BUFFER_SIZE if self._buffer_size is None else self._buffer_size,
+                                     spin_time=spin_time,
+                                     policy=policy,
+                                     max_age=None if max_age is None else max_age / 1000,
+                                     pool=self._pool))
             # stramer outputs the replicated zmq stream
             streamer_list.append(
                 Streamer(
                     name=self._stream_names[i],
-                    deque=q_list[-1],
+                    queue=q_list[-1],
                     sentinel=self._exit_event,
                     port=self._stream_ports[i],
                     zmq_mode=self._zmq_modes[i],
                     io_threads=self._io_threads,
-                    writer_config=self._writer_config
+                    writer_config=self._writer_config,
+                    zero_copy=self._zero_copy,
+                    metrics=self._metrics,
+                    inject_timestamp=(i < len(self._inject_timestamps)
+                                      and self._inject_timestamps[i]),
+                    address=self._stream_addresses[i] if i < len(self._stream_addresses) else None,
+                    shm=self._shms[i] if i < len(self._shms) else None,
+                    pipeline=pipelines[i],
+                    record=self._records[i] if i < len(self._records) else None
                 )
             )
             receiver_tuples.append(
@@ -280,22 +548,93 @@ class SRepeater(object):
                 (self._send_output_mode[i], self._send_output_param[i]))
             )
 
+        reorder = None
+        if self._reorder:
+            reorder_config = self._reorder if isinstance(self._reorder, dict) else {}
+            reorder = ReorderBuffer(
+                max_delay=reorder_config.get("max_delay_ms", 50) / 1000,
+                max_size=reorder_config.get("max_size", 1000),
+                max_gaps=reorder_config.get("max_gaps", 100)
+            )
         # Receiver object with the streamer and their queues
         receiver = Receiver(
             tuples_list=receiver_tuples,
             sentinel=self._exit_event,
             zmq_mode=self._in_zmq_mode,
-            frame_block=self._frame_block
+            frame_block=self._frame_block,
+            zero_copy=self._zero_copy,
+            pool=self._pool,
+            metrics=self._metrics,
+            timestamps=self._timestamps,
+            reorder=reorder
         )
+        self._receiver = receiver
+
+        # several incoming streams: one ingest receiver each and a merge stage
+        addresses = self._in_address
+        self._merger = None
+        if isinstance(addresses, list) and len(addresses) > 1:
+            inputs = [
+                Receiver(
+                    tuples_list=[],
+                    sentinel=self._exit_event,
+                    zmq_mode=self._in_zmq_mode,
+                    frame_block=self._frame_block,
+                    zero_copy=self._zero_copy,
+                    metrics=self._metrics,
+                    timestamps=self._timestamps
+                )
+                for _ in addresses
+            ]
+            self._merger = Merger(
+                receiver=receiver,
+                inputs=inputs,
+                sentinel=self._exit_event,
+                window=self._merge_window,
+                timeout=self._merge_timeout_ms / 1000
+            )
+        elif isinstance(addresses, list):
+            addresses = addresses[0]
+
+        if self._udp:
+            # the udp ports are bound now, a port in use fails the start
+            self._udp_ingest = UdpIngest(
+                receiver=receiver,
+                config=self._udp,
+                sentinel=self._exit_event,
+                timestamps=self._timestamps
+            )
+            try:
+                self._udp_ingest.bind()
+            except OSError as e:
+                self._udp_ingest.close()
+                raise RepStreamError(f"Failed to bind the udp ports ({e}).")
 
-        # Prepares receiver thread and starts it
-        start_receiver = partial(receiver.start, 
+        self._streamers = streamer_list
+        self._list_threads = []
+        if self._engine == "reactor":
+            # a single thread serves the incoming and all the output streams
+            reactor = Reactor(
+                receiver=receiver,
+                streamers=streamer_list,
+                sentinel=self._exit_event,
+                merger=self._merger
+            )
+            self._r = Thread(target=partial(reactor.start,
+                                            self._io_threads,
+                                            addresses), daemon=True)
+            self._r.start()
+            return
+
+        # Prepares receiver thread (or merge stage, or udp ingest) and starts it
+        start_receiver = partial(receiver.start if self._merger is None else self._merger.start,
                                  self._io_threads, 
-                                 self._in_address)
+                                 addresses)
+        if self._udp_ingest is not None:
+            start_receiver = self._udp_ingest.start
         self._r = Thread(target=start_receiver, daemon=True)
 
         # Prepares the streamers and starts them
-        self._list_threads = []
         for i in range(self._n_output_streams):
             self._list_threads.append(
                 Thread(target=partial(streamer_list[i].start), 
@@ -314,18 +653,52 @@ class SRepeater(object):
     def stop(self):
         """Signal that stops the receiver and streamer threads."""
         self._exit_event.set()
+        if self._process_engine is not None:
+            self._process_engine.stop()
+        for streamer in self._streamers:
+            streamer.stop()
+        if self._pool is not None:
+            self._pool.close()
+        if self._engine == "reactor" and self._r is not None:
+            # the reactor polls with a timeout, it always ends
+            self._r.join()
         return
 
+    def _pipeline_configs(self):
+        # the transform and compression keys are the shorthand of a pipeline
+        return [pipeline_config(pipeline, transform, compression)
+                for _, pipeline, transform, compression in itertools.zip_longest(
+                    self._stream_names, self._pipelines, self._transforms, self._compressions)]
+
     def validate_configuration(self):
         """Validate the configuration prepared using the set_config_from_dict method
         """
-        if not validate_network_address(self._in_address):
+        in_addresses = self._in_address if isinstance(self._in_address, list) else [self._in_address]
+        if self._udp is not None:
+            problem = valid_udp(self._udp)
+            if problem is not None:
+                raise RepStreamError(problem)
+            if self._engine != "threaded":
+                raise RepStreamError("The udp input is only supported by the threaded engine.")
+        elif not in_addresses or not all(validate_network_address(address) for address in in_addresses):
             raise RepStreamError("Problem with the in_address parameter.")
+        if not isinstance(self._merge_window, int) or self._merge_window < 1:
+            raise RepStreamError("Merge window must be a positive integer (frames).")
+        if not isinstance(self._merge_timeout_ms, (int, float)) or self._merge_timeout_ms <= 0:
+            raise RepStreamError("Merge timeout must be a positive number (ms).")
+        if isinstance(self._reorder, dict):
+            for key, value in self._reorder.items():
+                if key not in ["max_delay_ms", "max_size", "max_gaps"]:
+                    raise RepStreamError(f"Reorder parameter {key} not recognized.")
+                if not isinstance(value, (int, float)) or value <= 0:
+                    raise RepStreamError("Reorder parameters must be positive numbers.")
+        elif self._reorder not in [None, True, False]:
+            raise RepStreamError("Reorder must be a dictionary or a boolean.")
         if not validate_zmq_mode(self._in_zmq_mode):
             raise RepStreamError("Problem with the zmq mode address.")
         if self._io_threads < 1 or not isinstance(self._io_threads, int):
             raise RepStreamError("Io Threads must be an integer greater than 1.")
-        if self._buffer_size < 1000 or not isinstance(self._buffer_size, int):
+        if self._buffer_size is not None and (not isinstance(self._buffer_size, int) or self._buffer_size < 1000):
             raise RepStreamError("buffer size must be an integer greater than 1000.")
         if self._n_output_streams != len(self._send_output_mode):
             raise RepStreamError("n_output_streams != len(send_output_mode)") 
@@ -335,6 +708,105 @@ class SRepeater(object):
             raise RepStreamError("n_output_streams != len(stream_ports)") 
         if self._n_output_streams != len(self._stream_names):
             raise RepStreamError("n_output_streams != len(stream_names)")             
+        for port, address, record in itertools.zip_longest(self._stream_ports, self._stream_addresses,
+                                                           self._records):
+            if address is None and not isinstance(port, int) and not record:
+                raise RepStreamError("Every output stream needs a port or an address.")
+            if address is not None and not address.startswith(("tcp://", "ipc://")):
+                raise RepStreamError(f"Output address {address} must be tcp:// or ipc://.")
+        for shm in self._shms:
+            if isinstance(shm, dict):
+                for key, value in shm.items():
+                    if key not in SHM_DEFAULTS and key != "name":
+                        raise RepStreamError(f"Shared memory parameter {key} not recognized.")
+                    if key != "name" and (not isinstance(value, int) or value < 1):
+                        raise RepStreamError("Shared memory parameters must be positive integers.")
+                if shm.get("readers", 1) > MAX_CONSUMERS:
+                    raise RepStreamError(f"Shared memory transport supports up to {MAX_CONSUMERS} readers.")
+            elif shm not in [None, True, False]:
+                raise RepStreamError("Shm must be a dictionary or a boolean.")
+        for shm, record in zip(self._shms, self._records):
+            if shm and record:
+                raise RepStreamError("An output stream can't use the shared memory transport and record.")
+        for record in self._records:
+            if record is None:
+                continue
+            if not isinstance(record, dict) or not isinstance(record.get("directory"), str):
+                raise RepStreamError("Record must be a dictionary with the directory of the recording.")
+            for key, value in record.items():
+                if key not in RECORD_DEFAULTS and key != "directory":
+                    raise RepStreamError(f"Record parameter {key} not recognized.")
+            segment_size = record.get("segment_size", RECORD_DEFAULTS["segment_size"])
+            if not isinstance(segment_size, int) or segment_size < 4096:
+                raise RepStreamError("Record segment size must be an integer of at least 4096 (bytes).")
+            if not isinstance(record.get("sync", False), bool):
+                raise RepStreamError("Record sync must be a boolean.")
+        for transform in self._transforms:
+            if transform is not None and not valid_transform(transform):
+                raise RepStreamError(f"Transform {transform} not valid ({', '.join(TRANSFORM_KEYS)}).")
+        for compression in self._compressions:
+            if compression is None:
+                continue
+            if not valid_compression(compression):
+                raise RepStreamError(f"Compression {compression} not valid ({', '.join(COMPRESSION_KEYS)}).")
+        for pipeline, transform, compression in itertools.zip_longest(self._pipelines, self._transforms,
+                                                                     self._compressions):
+            if pipeline is not None and (transform or compression):
+                raise RepStreamError("An output stream has either a pipeline or transform and compression keys.")
+        for pipeline in self._pipeline_configs():
+            if pipeline is None:
+                continue
+            problem = valid_pipeline(pipeline)
+            if problem is not None:
+                raise RepStreamError(problem)
+            for stage in pipeline["stages"]:
+                if stage["type"] == "compression" and not codec_available(stage["codec"]):
+                    raise RepStreamError(f"The library of the {stage['codec']} codec is not installed.")
         if self._frame_block < 1 or not isinstance(self._frame_block, int):
             raise RepStreamError("Frame block size must be an integer greater than 1.")
+        for mode in self._send_output_mode:
+            if mode not in SEND_OUTPUT_MODES:
+                raise RepStreamError(f"Send output mode must be one of {', '.join(SEND_OUTPUT_MODES)}.")
+        for mode, param in zip(self._send_output_mode, self._send_output_param):
+            if not valid_output_param(mode, param):
+                raise RepStreamError(f"Send output param {param} not valid for the {mode} mode.")
+        for policy in self._policies:
+            if policy not in POLICIES:
+                raise RepStreamError(f"Backpressure policy must be one of {', '.join(POLICIES)}.")
+        if self._memory_budget is not None and (not isinstance(self._memory_budget, int) or self._memory_budget < 1):
+            raise RepStreamError("Memory budget must be a positive integer (bytes).")
+        if self._engine not in ["threaded", "reactor", "processes"]:
+            raise RepStreamError("Engine must be threaded, reactor or processes.")
+        if self._engine == "processes":
+            if len(in_addresses) > 1 or self._reorder:
+                raise RepStreamError("The processes engine does not merge nor reorder the incoming streams.")
+            if any(self._shms):
+                raise RepStreamError("The processes engine does not support the shared memory transport.")
+            if any(self._records):
+                raise RepStreamError("The processes engine does not support the recording output streams.")
+            if ADAPTIVE in self._send_output_mode:
+                raise RepStreamError(f"The processes engine does not support the {ADAPTIVE} mode.")
+            if (any(policy != "drop_oldest" for policy in self._policies) or any(self._max_ages)
+                    or any(self._spin_times)):
+                raise RepStreamError("The processes engine does not support per output stream policies, "
+                                     "max_age_ms nor spin_time (the ring policy applies to all the output streams).")
+            if self._memory_budget is not None:
+                raise RepStreamError("The processes engine does not support the memory budget "
+                                     "(the ring slots bound the memory).")
+            if self._buffer_size is not None:
+                raise RepStreamError("The processes engine has no output queues, buffer_size does not apply "
+                                     "(see ring_slots).")
+            if self._timestamps or any(self._inject_timestamps):
+                raise RepStreamError("The processes engine does not support timestamps nor inject_timestamp.")
+            if self._n_output_streams > MAX_CONSUMERS:
+                raise RepStreamError(f"The processes engine supports up to {MAX_CONSUMERS} output streams.")
+            if not isinstance(self._ring_slots, int) or self._ring_slots < 2:
+                raise RepStreamError("Ring slots must be an integer greater than 1.")
+            if not isinstance(self._ring_slot_size, int) or self._ring_slot_size < 1:
+                raise RepStreamError("Ring slot size must be a positive integer (bytes).")
+            if self._ring_policy not in ["block", "drop_newest"]:
+                raise RepStreamError("Ring policy must be block or drop_newest.")
+            if self._output_processes is not None and (not isinstance(self._output_processes, int)
+                                                       or self._output_processes < 1):
+                raise RepStreamError("Output processes must be a positive integer.")
         return True
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+import threading
+
+import numpy as np
+
+from frame import Frame
+
+# the codecs are optional, only the configured ones must be installed
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import bitshuffle
+except ImportError:
+    bitshuffle = None
+
+LZ4 = "lz4"
+ZSTD = "zstd"
+BITSHUFFLE_LZ4 = "bitshuffle-lz4"
+CODECS = [LZ4, ZSTD, BITSHUFFLE_LZ4]
+COMPRESSION_KEYS = ["codec", "level", "workers"]
+
+# header entries of a compressed payload
+CODEC_KEY = "compression"
+SIZE_KEY = "uncompressed_size"
+
+# zstd (de)compressors are not thread safe, one per thread
+_local = threading.local()
+
+
+def codec_available(codec):
+    """bool: True if the library of the codec is installed."""
+    return {LZ4: lz4_block, ZSTD: zstandard, BITSHUFFLE_LZ4: bitshuffle}.get(codec) is not None
+
+
+def valid_compression(config):
+    """Checks the compression configuration of an output stream.
+
+    Args:
+        config (dict): codec (lz4, zstd or bitshuffle-lz4), level (zstd) and
+            workers (size of the worker pool), codec mandatory.
+
+    Returns:
+        bool: True if the configuration is valid.
+    """
+    if not isinstance(config, dict) or config.get("codec") not in CODECS:
+        return False
+    if any(key not in COMPRESSION_KEYS for key in config):
+        return False
+    workers = config.get("workers", 2)
+    if not isinstance(workers, int) or workers < 0:
+        return False
+    return isinstance(config.get("level", 1), int)
+
+
+def element_type(header):
+    """Element type of the image of a frame, the one bitshuffle-lz4 shuffles.
+
+    Args:
+        header (dict): The decoded header of the frame.
+
+    Returns:
+        str: the ``type`` of the header, or of its ``image_attributes``, None without.
+    """
+    return header.get("type", (header.get("image_attributes") or {}).get("type"))
+
+
+def _zstd_compressor(level):
+    compressors = getattr(_local, "compressors", None)
+    if compressors is None:
+        compressors = _local.compressors = {}
+    if level not in compressors:
+        compressors[level] = zstandard.ZstdCompressor(level=level)
+    return compressors[level]
+
+
+def compress(codec, payload, dtype=None, level=1):
+    """Compresses a payload.
+
+    Args:
+        codec (str): lz4, zstd or bitshuffle-lz4.
+        payload: The payload (bytes like object).
+        dtype (str, optional): Element type, bitshuffle-lz4 shuffles the bits of
+            each element. Defaults to None (bytes).
+        level (int, optional): Compression level (zstd). Defaults to 1.
+
+    Returns:
+        bytes: the compressed payload.
+    """
+    if codec == LZ4:
+        return lz4_block.compress(payload, store_size=False)
+    if codec == ZSTD:
+        return _zstd_compressor(level).compress(payload)
+    if codec == BITSHUFFLE_LZ4:
+        return bitshuffle.compress_lz4(np.frombuffer(payload, dtype=dtype or np.uint8)).tobytes()
+    raise ValueError(f"Codec {codec} not recognized.")
+
+
+def decompress(codec, payload, size, dtype=None):
+    """Decompresses a payload compressed by compress.
+
+    Args:
+        codec (str): lz4, zstd or bitshuffle-lz4.
+        payload: The compressed payload (bytes like object).
+        size (int): Size in bytes of the uncompressed payload.
+        dtype (str, optional): Element type used by compress. Defaults to None (bytes).
+
+    Returns:
+        bytes: the payload.
+    """
+    if codec == LZ4:
+        return lz4_block.decompress(payload, uncompressed_size=size)
+    if codec == ZSTD:
+        decompressor = getattr(_local, "decompressor", None)
+        if decompressor is None:
+            decompressor = _local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor.decompress(payload, max_output_size=size)
+    if codec == BITSHUFFLE_LZ4:
+        dtype = np.dtype(dtype or np.uint8)
+        return bitshuffle.decompress_lz4(np.frombuffer(payload, dtype=np.uint8),
+                                         (size // dtype.itemsize,), dtype).tobytes()
+    raise ValueError(f"Codec {codec} not recognized.")
+
+
+class Compressor:
+    """Compresses the payload of the frames of an output stream.
+
+    The codec and the size of the uncompressed payload are appended to the
+    raw header (``compression`` and ``uncompressed_size``), the other parts
+    are sent as they are.
+
+    Args:
+        config (dict): codec (lz4, zstd or bitshuffle-lz4) and level (zstd).
+    """
+
+    def __init__(self, config):
+        self.codec = config["codec"]
+        self._level = config.get("level", 1)
+
+    def apply(self, data):
+        """Compresses the payload of a frame.
+
+        Args:
+            data (Frame): The envelope of the frame (not modified).
+
+        Returns:
+            Frame: a new envelope with the patched header and the compressed payload.
+
+        Raises:
+            ValueError: bitshuffle-lz4 and the header has no element type.
+        """
+        payload = memoryview(data.parts[1])
+        dtype = None
+        if self.codec == BITSHUFFLE_LZ4:
+            # the consumer shuffles the bits back with the same element size
+            dtype = element_type(data.header)
+            if dtype is None:
+                raise ValueError("The header has no image type, needed by bitshuffle-lz4.")
+        compressed = compress(self.codec, payload, dtype, self._level)
+        head = data.raw_header.rstrip()[:-1].rstrip()
+        # no separator after the opening brace of an empty header
+        separator = b"" if head.endswith(b"{") else b","
+        header = b'%s%s "%s": "%s", "%s": %d}' % (head, separator, CODEC_KEY.encode(), self.codec.encode(),
+                                                 SIZE_KEY.encode(), payload.nbytes)
+        compressed_frame = Frame([header, compressed] + data.parts[2:], data.frame)
+        compressed_frame.timestamps = data.timestamps
+        return compressed_frame
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+import math
+import time
+
+# output modes that only depend on the frame number
+SEND_EVERY_NTH = "send_every_nth"
+STRIDES = "strides"
+SEND_EVERY_NTH_FRAME = "send_every_nth_frame"
+# output modes that depend on the time
+SEND_EVERY_SEC = "send_every_sec"
+RATE_LIMIT = "rate_limit"
+# output mode that depends on the output stream
+ADAPTIVE = "adaptive"
+SEND_OUTPUT_MODES = [SEND_EVERY_NTH, STRIDES, SEND_EVERY_NTH_FRAME, SEND_EVERY_SEC, RATE_LIMIT, ADAPTIVE]
+# keys of the send_output_param of the rate_limit mode
+RATE_LIMIT_KEYS = ["fps", "mbps", "burst", "burst_mb"]
+# keys of the send_output_param of the adaptive mode
+ADAPTIVE_KEYS = ["n", "min_n", "max_n", "target_depth", "interval"]
+
+# largest precompiled table, longer periods are evaluated per frame
+MAX_PERIOD = 1 << 16
+
+
+def valid_output_param(mode, param):
+    """Checks the send_output_param of an output mode.
+
+    Args:
+        mode (str): The output mode.
+        param: The output mode parameter.
+
+    Returns:
+        bool: True if the parameter is valid for the mode.
+    """
+    def number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    if mode == ADAPTIVE and isinstance(param, dict):
+        return (set(param) <= set(ADAPTIVE_KEYS)
+                and all(number(value) and value > 0 for value in param.values())
+                and param.get("min_n", 1) <= param.get("max_n", float("inf")))
+    if mode != RATE_LIMIT:
+        return number(param) and param > 0
+    if not isinstance(param, dict) or not set(param) <= set(RATE_LIMIT_KEYS):
+        return False
+    if "fps" not in param and "mbps" not in param:
+        return False
+    if not all(number(param[key]) for key in param):
+        return False
+    return (param.get("fps", 1) > 0 and param.get("mbps", 1) > 0
+            and param.get("burst", 1) >= 1 and param.get("burst_mb", 0) >= 0)
+
+
+def periodic_rule(mode, param, frame_block):
+    """Frame number pattern of a deterministic output mode.
+
+    A frame is sent when ``frame % period < width``.
+
+    Args:
+        mode (str): The output mode.
+        param (int): The output mode parameter.
+        frame_block (int): Total number of frames to create a block.
+
+    Returns:
+        tuple: (period, width), None if the mode is not deterministic.
+    """
+    if mode == SEND_EVERY_NTH:
+        # sends 1 frame every nth
+        return param, 1
+    if mode == STRIDES:
+        # sends n frames and skips the next n frames
+        return 2 * param, param
+    if mode == SEND_EVERY_NTH_FRAME:
+        # sends frame_block frames every N frames, a block longer than N
+        # continues up to the next multiple of N
+        return param * -(-frame_block // param), frame_block
+    return None
+
+
+class EverySecond:
+    """Sends one frame, then skips the frames for the given number of seconds.
+
+    Args:
+        seconds (float): Minimum time between two sent frames.
+    """
+
+    def __init__(self, seconds):
+        self._seconds = seconds
+        self._last = None
+
+    def select(self, data):
+        now = time.monotonic()
+        if self._last is None or now - self._last >= self._seconds:
+            self._last = now
+            return True
+        return False
+
+    def get_stats(self):
+        return {}
+
+
+class TokenBucket:
+    """Sends the frames that fit in a frame rate and/or bandwidth budget.
+
+    Each limit is a token bucket refilled at its rate (monotonic clock). A
+    frame is sent when a frame token is available and the byte bucket is
+    not in deficit, the frame size is then taken from the byte bucket (so
+    frames larger than the burst are sent too, the following ones wait for
+    the deficit to be refilled). The other frames are skipped, the output
+    stays within its budget without queueing.
+
+    Args:
+        fps (float, optional): Maximum frame rate. Defaults to None (no limit).
+        mbps (float, optional): Maximum bandwidth in MB/s. Defaults to None (no limit).
+        burst (float, optional): Frames that can be sent back to back after an
+            idle time. Defaults to 1.
+        burst_mb (float, optional): Megabytes that can be sent above the bandwidth
+            after an idle time. Defaults to 0.
+    """
+
+    def __init__(self, fps=None, mbps=None, burst=1, burst_mb=0):
+        self._fps = fps
+        self._bytes_per_sec = None if mbps is None else mbps * 1e6
+        self._frame_capacity = burst
+        self._byte_capacity = burst_mb * 1e6
+        # starts full
+        self._frame_tokens = self._frame_capacity
+        self._byte_tokens = self._byte_capacity
+        self._last = time.monotonic()
+        self.sent = 0
+        self.skipped = 0
+
+    def get_stats(self):
+        return {"rate_limited": self.skipped}
+
+    def select(self, data):
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        # both buckets are refilled for the elapsed time, whether the frame is sent or not
+        if self._fps is not None:
+            self._frame_tokens = min(self._frame_capacity, self._frame_tokens + elapsed * self._fps)
+        if self._bytes_per_sec is not None:
+            self._byte_tokens = min(self._byte_capacity, self._byte_tokens + elapsed * self._bytes_per_sec)
+        if (self._fps is not None and self._frame_tokens < 1) or \
+                (self._bytes_per_sec is not None and self._byte_tokens < 0):
+            self.skipped += 1
+            return False
+        if self._fps is not None:
+            self._frame_tokens -= 1
+        if self._bytes_per_sec is not None:
+            self._byte_tokens -= data.nbytes
+        self.sent += 1
+        return True
+
+
+class AdaptiveDecimation:
+    """Sends evenly spaced frames, as many as the output stream can absorb.
+
+    The frames are decimated by an effective N (at least N frame numbers
+    between two sent frames) that is adjusted every control interval from
+    the depth of the output queue and the measured drain rate of the
+    output stream:
+
+    * queue deeper than the target: the output stream can't keep up, N is
+      set to the ratio of incoming frames to the drained frames left once
+      the backlog is drained within one second (at least N + 1 while the
+      queue grows);
+    * queue at most at the target and drained: N is lowered by an eighth
+      (at least 1) to probe for spare capacity.
+
+    Args:
+        queue (FrameQueue): Queue of the output stream.
+        n (int, optional): Initial N. Defaults to 1.
+        min_n (int, optional): Smallest N. Defaults to 1.
+        max_n (int, optional): Largest N. Defaults to None (no limit).
+        target_depth (int, optional): Queue depth above which the output stream
+            is considered as lagging. Defaults to 2.
+        interval (float, optional): Control interval in seconds. Defaults to 0.2.
+    """
+
+    def __init__(self, queue, n=1, min_n=1, max_n=None, target_depth=2, interval=0.2):
+        self._queue = queue
+        self._min_n = min_n
+        self._max_n = max_n
+        self._target_depth = target_depth
+        self._interval = interval
+        self.n = max(int(n), min_n)
+        self._last_frame = None
+        self._depth = 0
+        self._arrived = 0
+        self._taken = queue.taken
+        self._next_update = time.monotonic() + interval
+
+    def _update(self, now):
+        drained = self._queue.taken - self._taken
+        self._taken = self._queue.taken
+        depth = len(self._queue)
+        if depth > self._target_depth:
+            # leaves room to drain the backlog within one second
+            room = drained - (depth - self._target_depth) * self._interval
+            n = math.ceil(self._arrived / max(room, 1))
+            if depth >= self._depth:
+                n = max(n, self.n + 1)
+        elif drained:
+            n = self.n - max(1, self.n // 8)
+        else:
+            n = self.n
+        if self._max_n is not None:
+            n = min(n, self._max_n)
+        self.n = max(n, self._min_n)
+        self._depth = depth
+        self._arrived = 0
+        self._next_update = now + self._interval
+
+    def select(self, data):
+        self._arrived += 1
+        now = time.monotonic()
+        if now >= self._next_update:
+            self._update(now)
+        if self._last_frame is None or not 0 <= data.frame - self._last_frame < self.n:
+            self._last_frame = data.frame
+            return True
+        return False
+
+    def get_stats(self):
+        return {"decimation": self.n}
+
+
+class DispatchSchedule:
+    """Output streams of every frame, compiled from the output configuration.
+
+    The deterministic modes (send_every_nth, strides, send_every_nth_frame)
+    only depend on the frame number: their patterns are merged into one
+    table indexed by ``frame % period`` (the least common multiple of their
+    periods), so one lookup gives the targets of a frame whatever the number
+    of output streams. When the common period is longer than ``max_period``,
+    the patterns are evaluated per frame. The other modes keep their own
+    state and are asked for every frame.
+
+    Args:
+        tuples_list: List of tuples of an output queue and its (mode, param).
+        frame_block (int): Total number of frames to create a block.
+        max_period (int, optional): Largest precompiled table. Defaults to 65536.
+
+    Raises:
+        ValueError: Output mode not recognized.
+    """
+
+    def __init__(self, tuples_list, frame_block, max_period=MAX_PERIOD):
+        self._rules = []
+        self._selectors = []
+        self._output_selectors = []
+        for queue, (mode, param) in tuples_list:
+            rule = periodic_rule(mode, param, frame_block)
+            if rule is not None:
+                self._rules.append((queue,) + rule)
+            elif mode == SEND_EVERY_SEC:
+                self._selectors.append((queue, EverySecond(param)))
+            elif mode == RATE_LIMIT:
+                self._selectors.append((queue, TokenBucket(**param)))
+            elif mode == ADAPTIVE:
+                param = param if isinstance(param, dict) else {"n": param}
+                self._selectors.append((queue, AdaptiveDecimation(queue, **param)))
+            else:
+                raise ValueError(f"Output mode {mode} not recognized.")
+            self._output_selectors.append(None if rule is not None else self._selectors[-1][1])
+        period = 1
+        for _, rule_period, _ in self._rules:
+            period = period * rule_period // math.gcd(period, rule_period)
+            if period > max_period:
+                period = None
+                break
+        self._period = period
+        self._table = None
+        if period is not None:
+            self._table = [
+                tuple(queue for queue, rule_period, width in self._rules
+                      if frame % rule_period < width)
+                for frame in range(period)
+            ]
+
+    @property
+    def period(self):
+        """int: length of the precompiled table, None if evaluated per frame."""
+        return self._period
+
+    def get_stats(self):
+        """Dispatch statistics of the output streams with a stateful mode.
+
+        Returns:
+            list: one dictionary per output stream (empty for the other modes).
+        """
+        return [{} if selector is None else selector.get_stats() for selector in self._output_selectors]
+
+    def targets(self, data):
+        """Output queues that should send a frame.
+
+        Args:
+            data (Frame): The envelope of the received message.
+
+        Returns:
+            sequence: the output queues, the ones with a deterministic mode first.
+        """
+        frame = data.frame
+        if self._table is not None:
+            targets = self._table[frame % self._period]
+        else:
+            targets = tuple(queue for queue, period, width in self._rules if frame % period < width)
+        if self._selectors:
+            targets = list(targets)
+            for queue, selector in self._selectors:
+                if selector.select(data):
+                    targets.append(queue)
+        return targets
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+import json
+import re
+
+# matches a "frame" entry with an integer value of a gigafrost json header
+_FRAME_PATTERN = re.compile(rb'"frame"\s*:\s*(-?\d+)\s*[,}]')
+
+# indexes of Frame.timestamps
+INGRESS_TIME = 0
+RECV_START = 1
+RECEIVED = 2
+DECODED = 3
+DISPATCHED = 4
+
+# header entry with the ingress wall clock time (injected on demand)
+INGRESS_TIME_KEY = "repstream_ingress_time"
+
+
+def _top_level(raw_header, position):
+    # True if the position is in the top level object of the json header,
+    # the braces and brackets in strings are not counted
+    prefix = raw_header[:position]
+    if b"\\" in prefix:
+        # escaped quotes, left to the json decoder
+        return False
+    outside = b"".join(prefix.split(b'"')[::2])
+    return outside.count(b"{") - outside.count(b"}") == 1 and outside.count(b"[") == outside.count(b"]")
+
+
+class Frame:
+    """Envelope of one received multipart message that is shared by all
+    the output streams.
+
+    The header is decoded only when it is accessed for the first time, the
+    frame number is extracted once by the receiver.
+
+    The header part is always kept as bytes, the payload parts can be
+    ``zmq.Frame`` objects (zero copy mode) which are forwarded as they are
+    to all the output streams.
+
+    Args:
+        parts (list): Raw parts of the multipart message (header first).
+        frame (int): Frame number of the message.
+        header (dict, optional): Already decoded header. Defaults to None.
+    """
+
+    __slots__ = ("parts", "frame", "_header", "_nbytes", "refs", "timestamps")
+
+    def __init__(self, parts, frame, header=None):
+        self.parts = parts
+        self.frame = frame
+        self._header = header
+        self._nbytes = None
+        # number of output streams still holding the frame (see FramePool)
+        self.refs = 0
+        # ingress wall clock time followed by the perf_counter time of each
+        # receiver stage (see INGRESS_TIME...DISPATCHED), None if disabled
+        self.timestamps = None
+
+    @classmethod
+    def from_parts(cls, parts):
+        """Builds the envelope of a received multipart message.
+
+        The frame number is read directly from the raw header bytes, the
+        full json decoding only happens if the fast path is ambiguous (no
+        integer frame entry at the top level, or several frame entries).
+
+        Args:
+            parts (list): Raw parts of the multipart message (header first).
+
+        Returns:
+            Frame: the envelope of the message.
+
+        Raises:
+            KeyError: The header has no frame number.
+        """
+        raw_header = parts[0]
+        match = _FRAME_PATTERN.search(raw_header)
+        if (match is not None and raw_header.find(b'"frame"', match.end()) == -1
+                and _top_level(raw_header, match.start())):
+            return cls(parts, int(match.group(1)))
+        header = json.loads(raw_header.decode())
+        return cls(parts, header["frame"], header)
+
+    @property
+    def raw_header(self):
+        """bytes: the header as received, without any decoding."""
+        return self.parts[0]
+
+    @property
+    def header(self):
+        """dict: the decoded header (shared, must not be modified)."""
+        if self._header is None:
+            self._header = json.loads(self.parts[0].decode())
+        return self._header
+
+    @property
+    def nbytes(self):
+        """int: total size of the message parts."""
+        if self._nbytes is None:
+            self._nbytes = sum(map(len, self.parts))
+        return self._nbytes
+
+    def header_with_ingress_time(self):
+        """Raw header with the ingress wall clock time appended, without
+        decoding it.
+
+        Returns:
+            bytes: the patched header (the received one if there is no timestamp).
+        """
+        raw_header = self.parts[0]
+        if self.timestamps is None:
+            return raw_header
+        head = raw_header.rstrip()[:-1].rstrip()
+        # no separator after the opening brace of an empty header
+        separator = b"" if head.endswith(b"{") else b","
+        return b'%s%s "%s": %.6f}' % (head, separator, INGRESS_TIME_KEY.encode(),
+                                      self.timestamps[INGRESS_TIME])
+
+    def __len__(self):
+        return len(self.parts)
+
+    def __repr__(self):
+        return f"Frame(frame={self.frame}, parts={len(self.parts)})"
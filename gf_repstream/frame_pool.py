@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+from threading import Condition
+
+
+class FramePool:
+    """Global memory budget of the frames held by the output queues.
+
+    The receiver acquires every frame once for all the output streams that
+    will send it (one reference per output). Each output releases its
+    reference when the frame has been sent or dropped, the frame is freed
+    from the budget when the last reference is released.
+
+    A frame is admitted while the bytes in flight are below the budget, so
+    the budget is exceeded by at most one frame.
+
+    Args:
+        budget (int, optional): Memory budget in bytes. Defaults to None (no limit).
+    """
+
+    def __init__(self, budget=None):
+        self._budget = budget
+        self._not_full = Condition()
+        self._closed = False
+        self.bytes_in_flight = 0
+        self.frames_in_flight = 0
+        self.peak_bytes_in_flight = 0
+        self.dropped = 0
+
+    @property
+    def budget(self):
+        return self._budget
+
+    def has_room(self):
+        """bool: True if a new frame would be admitted without waiting."""
+        return self._budget is None or self.bytes_in_flight < self._budget
+
+    def acquire(self, frame, n_refs, block=False):
+        """Admits a frame that is going to be queued by n output streams.
+
+        Args:
+            frame (Frame): The frame envelope.
+            n_refs (int): Number of output streams the frame is queued to.
+            block (bool, optional): Waits for room in the budget instead of
+                dropping the frame. Defaults to False.
+
+        Returns:
+            bool: True if the frame was admitted, False if it must be dropped.
+        """
+        with self._not_full:
+            if not self.has_room():
+                if not block:
+                    self.dropped += 1
+                    return False
+                while not self.has_room() and not self._closed:
+                    self._not_full.wait()
+                if self._closed:
+                    self.dropped += 1
+                    return False
+            frame.refs = n_refs
+            self.bytes_in_flight += frame.nbytes
+            self.frames_in_flight += 1
+            if self.bytes_in_flight > self.peak_bytes_in_flight:
+                self.peak_bytes_in_flight = self.bytes_in_flight
+            return True
+
+    def release(self, frame):
+        """Releases the reference of one output stream to a frame.
+
+        Args:
+            frame (Frame): The frame envelope.
+        """
+        with self._not_full:
+            frame.refs -= 1
+            if frame.refs == 0:
+                self.bytes_in_flight -= frame.nbytes
+                self.frames_in_flight -= 1
+                self._not_full.notify_all()
+
+    def close(self):
+        """Wakes up a receiver waiting for room, the pool does not block anymore."""
+        with self._not_full:
+            self._closed = True
+            self._not_full.notify_all()
+
+    def get_stats(self):
+        return {
+            "budget": self._budget,
+            "bytes_in_flight": self.bytes_in_flight,
+            "frames_in_flight": self.frames_in_flight,
+            "peak_bytes_in_flight": self.peak_bytes_in_flight,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+import time
+from collections import deque
+from threading import Condition, Lock
+
+# backpressure policies of the output streams
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+DROP_OLDER_THAN = "drop_older_than"
+POLICIES = [DROP_OLDEST, DROP_NEWEST, BLOCK, DROP_OLDER_THAN]
+
+
+class FrameQueue:
+    """Bounded queue between the receiver and one streamer.
+
+    A put wakes up the waiting streamer immediately, so an idle streamer
+    blocks without polling. What happens when the queue is full depends on
+    the backpressure policy:
+
+    * ``drop_oldest``: the oldest queued frame is dropped (default).
+    * ``drop_newest``: the new frame is dropped.
+    * ``block``: the receiver waits until the streamer makes room (lossless).
+    * ``drop_older_than``: as ``drop_oldest``, and frames queued for longer
+      than ``max_age`` are dropped instead of being sent.
+
+    Args:
+        maxlen (int): Maximum number of frames kept in the queue.
+        spin_time (float, optional): Time in seconds a consumer keeps
+            polling the queue before blocking on it (low latency mode).
+            Defaults to 0 (block immediately).
+        policy (str, optional): Backpressure policy. Defaults to drop_oldest.
+        max_age (float, optional): Maximum time in seconds a frame can stay
+            queued with the drop_older_than policy. Defaults to None.
+        pool (FramePool, optional): Memory budget the queued frames belong to.
+            Frames are released from it when they are dropped or marked as
+            done. Defaults to None.
+    """
+
+    def __init__(self, maxlen, spin_time=0, policy=DROP_OLDEST, max_age=None, pool=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy {policy}.")
+        if policy == DROP_OLDER_THAN and max_age is None:
+            raise ValueError(f"Policy {policy} needs a maximum age.")
+        self._deque = deque()
+        self._maxlen = maxlen
+        self._spin_time = spin_time
+        self._policy = policy
+        self._max_age = max_age if policy == DROP_OLDER_THAN else None
+        self._lock = Lock()
+        self._not_empty = Condition(self._lock)
+        self._not_full = Condition(self._lock)
+        self._closed = False
+        self._pool = pool
+        # single writer counters: receiver thread (put) and streamer thread (get)
+        self._bytes_queued = 0
+        self._bytes_dropped = 0
+        self._bytes_done = 0
+        self.dropped_full = 0
+        self.dropped_stale = 0
+        self.dropped_budget = 0
+        self.taken = 0
+
+    def __len__(self):
+        return len(self._deque)
+
+    def __bool__(self):
+        return bool(self._deque)
+
+    @property
+    def maxlen(self):
+        return self._maxlen
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def dropped(self):
+        """int: total number of frames dropped for this output stream."""
+        return self.dropped_full + self.dropped_stale + self.dropped_budget
+
+    @property
+    def bytes_in_flight(self):
+        """int: size of the frames queued or being sent (only with a memory budget)."""
+        return self._bytes_queued - self._bytes_dropped - self._bytes_done
+
+    def full(self):
+        return len(self._deque) >= self._maxlen
+
+    def put(self, item, block=True):
+        """Appends an item stamped with its enqueue time and wakes up the consumer.
+
+        Args:
+            item: The item to be queued.
+            block (bool, optional): Waits for room with the block policy. Defaults
+                to True, without it a full queue returns None instead.
+
+        Returns:
+            bool: True if the item was queued, False if it was dropped, None if
+                the queue is full and block is False (the item is neither queued
+                nor released, it can be put again once the queue has room).
+        """
+        with self._lock:
+            if len(self._deque) >= self._maxlen:
+                if self._policy == BLOCK:
+                    if not block and not self._closed:
+                        return None
+                    while len(self._deque) >= self._maxlen and not self._closed:
+                        self._not_full.wait()
+                    if self._closed:
+                        self.dropped_full += 1
+                        self._release(item)
+                        return False
+                elif self._policy == DROP_NEWEST:
+                    self.dropped_full += 1
+                    self._release(item)
+                    return False
+                else:
+                    dropped = self._deque.popleft()[1]
+                    self._release(dropped)
+                    if self._pool is not None:
+                        self._bytes_dropped += dropped.nbytes
+                    self.dropped_full += 1
+            if self._pool is not None:
+                self._bytes_queued += item.nbytes
+            self._deque.append((time.perf_counter(), item))
+            self._not_empty.notify()
+            return True
+
+    def _release(self, item):
+        if self._pool is not None:
+            self._pool.release(item)
+
+    def done(self, item):
+        """Marks a frame returned by get as sent (or dropped by the consumer),
+        releasing its memory budget.
+
+        Args:
+            item: The item returned by get.
+        """
+        if self._pool is not None:
+            self._bytes_done += item.nbytes
+            self._pool.release(item)
+
+    def discard(self, item):
+        """Counts a frame that was not queued because of the memory budget.
+
+        Args:
+            item: The discarded item.
+        """
+        self.dropped_budget += 1
+
+    def _pop(self):
+        # deque.popleft is atomic, no lock needed unless the receiver waits
+        while True:
+            try:
+                entry = self._deque.popleft()
+            except IndexError:
+                return None
+            if self._max_age is not None and time.perf_counter() - entry[0] > self._max_age:
+                self.dropped_stale += 1
+                self.done(entry[1])
+                continue
+            if self._policy == BLOCK:
+                with self._lock:
+                    self._not_full.notify()
+            self.taken += 1
+            return entry
+
+    def get(self, timeout=None):
+        """Removes and returns the oldest item, waiting for one if needed.
+
+        Args:
+            timeout (float, optional): Maximum time in seconds to block.
+                Defaults to None (wait until an item arrives or the queue is closed).
+
+        Returns:
+            tuple: (enqueue time, item) or None if no item arrived in time.
+        """
+        entry = self._pop()
+        if entry is not None:
+            return entry
+        if self._spin_time > 0:
+            spin_until = time.perf_counter() + self._spin_time
+            while time.perf_counter() < spin_until:
+                entry = self._pop()
+                if entry is not None:
+                    return entry
+                # yields the GIL to the receiver thread
+                time.sleep(0)
+        with self._lock:
+            if not self._deque and not self._closed:
+                self._not_empty.wait(timeout)
+        return self._pop()
+
+    def get_nowait(self):
+        """Removes and returns the oldest item without waiting.
+
+        Returns:
+            tuple: (enqueue time, item) or None if the queue is empty.
+        """
+        return self._pop()
+
+    def wake(self):
+        """Wakes up all the consumers blocked in get."""
+        with self._lock:
+            self._not_empty.notify_all()
+
+    def close(self):
+        """Wakes up the blocked consumers and producers, a closed queue
+        does not block anymore."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def clear(self):
+        with self._lock:
+            while self._deque:
+                self.done(self._deque.popleft()[1])
+            self._not_full.notify_all()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+
+class LatencyHistogram:
+    """HDR style latency histogram with a fixed relative precision.
+
+    Values (in nanoseconds) are counted in log-linear buckets: every power
+    of two range is split into the same number of linear sub-buckets, so
+    the memory is fixed and the relative error of any reported value stays
+    below ``2 ** -(significant_bits - 1)`` (< 1.6% with the default 7 bits),
+    from nanoseconds to the largest trackable value.
+
+    Recording is a few integer operations and must be done by one thread
+    only; reading (percentiles, stats) can be done from any other thread.
+
+    Args:
+        significant_bits (int, optional): Number of bits of every recorded value
+            that are kept. Defaults to 7.
+        max_value (int, optional): Largest trackable value in nanoseconds, larger
+            values are counted as this one. Defaults to 60 s.
+    """
+
+    def __init__(self, significant_bits=7, max_value=60 * 10**9):
+        self._sub_bits = significant_bits
+        self._sub_count = 1 << significant_bits
+        self._half_count = 1 << (significant_bits - 1)
+        self._max_value = max_value
+        self._counts = [0] * (self._index(max_value) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self._sub_count:
+            return value
+        shift = value.bit_length() - self._sub_bits
+        return (shift << (self._sub_bits - 1)) + (value >> shift)
+
+    def _value(self, index):
+        # lowest value counted in the bucket
+        if index < self._sub_count:
+            return index
+        shift = (index >> (self._sub_bits - 1)) - 1
+        return (index - (shift << (self._sub_bits - 1))) << shift
+
+    def record(self, value):
+        """Counts one value.
+
+        Args:
+            value (int): Latency in nanoseconds.
+        """
+        value = min(max(int(value), 0), self._max_value)
+        self._counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def record_seconds(self, seconds):
+        """Counts one value given in seconds (e.g. a time.perf_counter difference)."""
+        self.record(seconds * 1e9)
+
+    def percentile(self, percent):
+        """Value (ns) below which the given percentage of the recorded values lie.
+
+        Args:
+            percent (float): Percentile between 0 and 100.
+
+        Returns:
+            int: the percentile, None if nothing was recorded.
+        """
+        count = self.count
+        if count == 0:
+            return None
+        target = max(1, int(round(percent / 100 * count)))
+        seen = 0
+        for index, bucket in enumerate(self._counts):
+            seen += bucket
+            if seen >= target:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    def get_stats(self, percentiles=(50, 90, 99, 99.9)):
+        """Summary of the histogram in milliseconds.
+
+        Returns:
+            dict: count, min, mean, max and the requested percentiles (ms).
+        """
+        stats = {"count": self.count, "min_ms": None, "mean_ms": None, "max_ms": None}
+        for percent in percentiles:
+            stats[f"p{percent}_ms"] = None
+        if self.count:
+            stats["min_ms"] = self.min / 1e6
+            stats["mean_ms"] = self.total / self.count / 1e6
+            stats["max_ms"] = self.max / 1e6
+            for percent in percentiles:
+                stats[f"p{percent}_ms"] = self.percentile(percent) / 1e6
+        return stats
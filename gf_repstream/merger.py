@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock, Thread
+
+import zmq
+
+from frame import Frame
+
+_logger = logging.getLogger("RestStreamRepeater")
+
+
+class Merger:
+    def __init__(self, receiver, inputs, sentinel, window=100, timeout=1.0, poll_timeout=100):
+        """Initialize the merge stage of several incoming streams.
+
+        Every incoming stream carries a part of the same frames (e.g. one
+        detector module or one DAQ node each). The messages are aligned by
+        frame number and, once a frame has arrived from all the incoming
+        streams, one combined multipart message is dispatched to the output
+        streams: the parts of every incoming stream, in the order of the
+        inputs (the header of the first incoming stream comes first).
+
+        Each incoming stream is received and decoded by its own ingest
+        thread (threaded engine) or socket (reactor engine), only the
+        alignment and the dispatch of the complete frames are serialized.
+
+        Args:
+            receiver: Receiver object that dispatches the merged frames to the output streams.
+            inputs: List of Receiver objects (without output streams), one per incoming stream.
+            sentinel: Flag object to halt execution.
+            window: Frames older than the newest frame minus the window are given up.
+            timeout: Time (s) a frame waits for its missing parts before it is given up.
+            poll_timeout: Maximum time (ms) an ingest thread waits for a message.
+        """
+        _logger.debug(f"RepStreamer.Merger __init__ ...")
+        self._receiver = receiver
+        self._inputs = inputs
+        self._sentinel = sentinel
+        self._window = window
+        self._timeout = timeout
+        self._poll_timeout = poll_timeout
+        self._lock = Lock()
+        # frame number -> [arrival time, parts per input]
+        self._pending = OrderedDict()
+        self._newest = None
+        self.merged = 0
+        self.incomplete = 0
+        self.late = 0
+        self.duplicates = 0
+
+    @property
+    def inputs(self):
+        return self._inputs
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+            self._newest = None
+
+    def add(self, index, data, block=True):
+        """Adds the message of one incoming stream, the frame is dispatched
+        when all its parts arrived.
+
+        Args:
+            index (int): Index of the incoming stream.
+            data (Frame): The envelope of the received message.
+            block (bool, optional): Waits for room in the memory budget if one
+                of the output streams is lossless. Defaults to True.
+        """
+        frame = data.frame
+        with self._lock:
+            if self._newest is not None and frame <= self._newest - self._window:
+                self.late += 1
+                return
+            entry = self._pending.get(frame)
+            if entry is None:
+                entry = self._pending[frame] = [time.monotonic(), [None] * len(self._inputs)]
+            if entry[1][index] is not None:
+                self.duplicates += 1
+            entry[1][index] = data
+            if self._newest is None or frame > self._newest:
+                self._newest = frame
+                self._give_up(lambda number, arrival: number <= frame - self._window)
+            if any(part is None for part in entry[1]):
+                return
+            del self._pending[frame]
+            self.merged += 1
+            # dispatches under the lock, the outputs get the frames in order
+            self._receiver.dispatch(self._combine(entry[1]), block=block)
+
+    def expire(self, block=True):
+        """Gives up the frames that waited longer than the timeout for their missing parts
+        and releases the merged frames held back by the reorder buffer of the receiver.
+
+        Args:
+            block (bool, optional): Waits for room in the memory budget if one
+                of the output streams is lossless. Defaults to True.
+        """
+        limit = time.monotonic() - self._timeout
+        with self._lock:
+            self._give_up(lambda number, arrival: arrival < limit)
+            self._receiver.flush(block=block)
+
+    def _give_up(self, condition):
+        # the pending frames are in arrival order, which is the frame order
+        # unless the incoming streams are shuffled (left to the timeout)
+        while self._pending:
+            number, (arrival, _) = next(iter(self._pending.items()))
+            if not condition(number, arrival):
+                break
+            del self._pending[number]
+            self.incomplete += 1
+            _logger.debug(f"RepStream.Merger frame {number} incomplete, given up...")
+
+    @staticmethod
+    def _combine(datas):
+        parts = []
+        for data in datas:
+            parts.extend(data.parts)
+        merged = Frame(parts, datas[0].frame)
+        timestamps = [data.timestamps for data in datas if data.timestamps is not None]
+        if timestamps:
+            # the latency of the merged frame starts with its first part
+            merged.timestamps = min(timestamps, key=lambda stamps: stamps[1])
+        return merged
+
+    def get_stats(self):
+        """Statistics of the incoming streams and of the merge stage.
+
+        Returns:
+            dict: received frames and bytes, messages that could not be decoded
+                (summed over the incoming streams), merged frames, frames given up
+                incomplete, late and duplicated messages, and the stats of each
+                incoming stream.
+        """
+        inputs = [receiver.get_stats() for receiver in self._inputs]
+        stats = {
+            "frames_received": self.merged,
+            "bytes_received": sum(stats["bytes_received"] for stats in inputs),
+            "decode_errors": sum(stats["decode_errors"] for stats in inputs),
+            "incomplete": self.incomplete,
+            "late": self.late,
+            "duplicates": self.duplicates,
+            "pending": len(self._pending),
+            "inputs": inputs,
+        }
+        merged_stats = self._receiver.get_stats()
+        if "reorder" in merged_stats:
+            stats["reorder"] = merged_stats["reorder"]
+        return stats
+
+    def ingest(self, index, zmq_socket):
+        """Receives one incoming stream until the end signal (ingest thread).
+
+        Args:
+            index (int): Index of the incoming stream.
+            zmq_socket (zmq.Socket): Socket of the incoming stream.
+        """
+        receiver = self._inputs[index]
+        while not self._sentinel.is_set():
+            if not zmq_socket.poll(self._poll_timeout):
+                self.expire()
+                continue
+            data = receiver.receive(zmq_socket)
+            if data is not None:
+                self.add(index, data)
+        _logger.debug(f"RepStream.Merger end signal received... finishing ingest thread {index}...")
+
+    def start(self, io_threads, addresses):
+        """Start one ingest thread per incoming stream and wait for them.
+
+        Args:
+            io_threads (int): The size of the zmq thread pool to handle I/O operations.
+            addresses (list): The address strings of the incoming streams.
+        """
+        _logger.debug(
+            f"RepStream.Merger start (io_threads {io_threads} and addresses {addresses})"
+        )
+        zmq_context = zmq.Context(io_threads=io_threads)
+        self._receiver.reset()
+        self.reset()
+        threads = []
+        for index, address in enumerate(addresses):
+            zmq_socket = self._inputs[index].connect(zmq_context, address)
+            threads.append(Thread(target=self.ingest, args=(index, zmq_socket), daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        _logger.debug(f"RepStream.Merger end signal received... finishing merge...")
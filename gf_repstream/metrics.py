@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+PREFIX = "gf_repstream"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class MetricFamily:
+    """One metric of the Prometheus text exposition format with its samples.
+
+    Args:
+        name (str): Metric name (without the gf_repstream prefix).
+        metric_type (str): counter, gauge or summary.
+        help_text (str): Description of the metric.
+    """
+
+    def __init__(self, name, metric_type, help_text):
+        self.name = f"{PREFIX}_{name}"
+        self.metric_type = metric_type
+        self.help_text = help_text
+        self.samples = []
+
+    def add(self, value, suffix="", **labels):
+        # suffix of the sample name, e.g. _count and _sum of a summary
+        if value is not None:
+            self.samples.append((suffix, labels, value))
+        return self
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        for suffix, labels, value in self.samples:
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {value}")
+        return "\n".join(lines)
+
+
+def render_metrics(stats):
+    """Formats the statistics of the stream repeater in the Prometheus text format.
+
+    Args:
+        stats (dict): Statistics as returned by SRepeater.get_stats.
+
+    Returns:
+        str: the metrics page.
+    """
+    families = []
+    stream_input = stats.get("input")
+    if stream_input is not None:
+        families += [
+            MetricFamily("frames_received_total", "counter",
+                         "Frames received from the incoming stream.")
+            .add(stream_input["frames_received"]),
+            MetricFamily("bytes_received_total", "counter",
+                         "Bytes received from the incoming stream.")
+            .add(stream_input["bytes_received"]),
+            MetricFamily("decode_errors_total", "counter",
+                         "Incoming messages skipped because their header could not be decoded.")
+            .add(stream_input["decode_errors"]),
+        ]
+        reorder = stream_input.get("reorder")
+        if reorder is not None:
+            families += [
+                MetricFamily("reorder_frames_held", "gauge", "Frames held by the reorder buffer.")
+                .add(reorder["held"]),
+                MetricFamily("reorder_gaps_total", "counter", "Gaps (runs of missing frames) of the incoming stream.")
+                .add(reorder["gaps"]),
+                MetricFamily("reorder_frames_missing_total", "counter", "Missing frames of the incoming stream.")
+                .add(reorder["missing_frames"]),
+                MetricFamily("reorder_frames_late_total", "counter",
+                             "Frames dropped because they arrived after their number was released or given up.")
+                .add(reorder["late"]),
+                MetricFamily("reorder_restarts_total", "counter",
+                             "Restarts of the frame numbering of the incoming stream (new acquisitions).")
+                .add(reorder["restarts"]),
+            ]
+        if "incomplete" in stream_input:
+            families += [
+                MetricFamily("merge_frames_incomplete_total", "counter",
+                             "Frames given up by the merge of the incoming streams because parts were missing.")
+                .add(stream_input["incomplete"]),
+                MetricFamily("merge_messages_late_total", "counter",
+                             "Messages that arrived after their frame was merged or given up.")
+                .add(stream_input["late"]),
+            ]
+        if "packets_received" in stream_input:
+            families += [
+                MetricFamily("udp_packets_received_total", "counter", "Packets received on the udp ports.")
+                .add(stream_input["packets_received"]),
+                MetricFamily("udp_frames_incomplete_total", "counter",
+                             "Frames given up by the udp input because packets were missing.")
+                .add(stream_input["frames_incomplete"]),
+                MetricFamily("udp_rows_missing_total", "counter", "Rows missing in the frames given up.")
+                .add(stream_input["missing_rows"]),
+                MetricFamily("udp_packets_late_total", "counter",
+                             "Packets that arrived after their frame was assembled or given up.")
+                .add(stream_input["packets_late"]),
+                MetricFamily("udp_packets_duplicate_total", "counter", "Packets repeating rows already received.")
+                .add(stream_input["packets_duplicate"]),
+                MetricFamily("udp_acquisitions_restarted_total", "counter",
+                             "Restarts of the frame numbering (or new scan ids) seen by the udp input.")
+                .add(stream_input["acquisitions_restarted"]),
+            ]
+
+    sent = MetricFamily("output_frames_sent_total", "counter", "Frames sent by the output stream.")
+    sent_bytes = MetricFamily("output_bytes_sent_total", "counter", "Bytes sent by the output stream.")
+    dropped = MetricFamily("output_frames_dropped_total", "counter",
+                           "Frames dropped for the output stream, by reason.")
+    depth = MetricFamily("output_queue_depth", "gauge", "Frames waiting in the output stream queue.")
+    in_flight = MetricFamily("output_bytes_in_flight", "gauge",
+                             "Bytes of the frames queued or being sent by the output stream.")
+    decimation = MetricFamily("output_decimation", "gauge",
+                              "Current N of the output streams in adaptive mode (1 frame every N).")
+    latency = MetricFamily("output_latency_seconds", "summary",
+                           "Enqueue-to-send latency quantiles of the sent frames.")
+    record_bytes = MetricFamily("output_record_bytes_total", "counter",
+                                "Bytes written to disk by the recording output stream.")
+    stage_frames = MetricFamily("output_stage_frames_total", "counter",
+                                "Frames processed by the pipeline stage of the output stream.")
+    stage_errors = MetricFamily("output_stage_errors_total", "counter",
+                                "Frames dropped because the pipeline stage failed.")
+    stage_busy = MetricFamily("output_stage_busy_seconds_total", "counter",
+                              "Time spent by the pipeline stage processing frames.")
+    stage_latency = MetricFamily("output_stage_latency_seconds", "summary",
+                                 "Processing time of the pipeline stage per frame.")
+    for name, output in stats.get("outputs", {}).items():
+        sent.add(output["sent"], output=name)
+        sent_bytes.add(output["bytes_sent"], output=name)
+        dropped.add(output["dropped_full"], output=name, reason="full")
+        dropped.add(output["dropped_stale"], output=name, reason="stale")
+        dropped.add(output["dropped_budget"], output=name, reason="budget")
+        dropped.add(output.get("dropped_readers"), output=name, reason="readers")
+        dropped.add(output.get("dropped_processing"), output=name, reason="processing")
+        dropped.add(output.get("dropped_record"), output=name, reason="record")
+        record_bytes.add(output.get("record_bytes"), output=name)
+        depth.add(output["queue_depth"], output=name)
+        in_flight.add(output["bytes_in_flight"], output=name)
+        decimation.add(output.get("decimation"), output=name)
+        for quantile in ("50", "99"):
+            value = output[f"latency_p{quantile}_ms"]
+            latency.add(None if value is None else value / 1e3,
+                        output=name, quantile=f"0.{quantile}")
+        for stage, stage_stats in output.get("stages", {}).items():
+            stage_frames.add(stage_stats["frames"], output=name, stage=stage)
+            stage_errors.add(stage_stats["errors"], output=name, stage=stage)
+            stage_busy.add(stage_stats["busy_s"], output=name, stage=stage)
+            stage_latency.add(None if stage_stats["p99_ms"] is None else stage_stats["p99_ms"] / 1e3,
+                              output=name, stage=stage, quantile="0.99")
+            stage_latency.add(stage_stats["frames"], "_count", output=name, stage=stage)
+            stage_latency.add(stage_stats["busy_s"], "_sum", output=name, stage=stage)
+    families += [sent, sent_bytes, dropped, depth, in_flight, decimation, latency]
+    if record_bytes.samples:
+        families.append(record_bytes)
+    if stage_frames.samples:
+        families += [stage_frames, stage_errors, stage_busy, stage_latency]
+
+    memory = stats.get("memory")
+    if memory is not None:
+        families += [
+            MetricFamily("memory_budget_bytes", "gauge", "Memory budget of the frames in flight.")
+            .add(memory["budget"]),
+            MetricFamily("memory_bytes_in_flight", "gauge", "Bytes of the frames held by the output streams.")
+            .add(memory["bytes_in_flight"]),
+            MetricFamily("memory_frames_in_flight", "gauge", "Frames held by the output streams.")
+            .add(memory["frames_in_flight"]),
+            MetricFamily("memory_frames_dropped_total", "counter",
+                         "Frames dropped because the memory budget was exceeded.")
+            .add(memory["dropped"]),
+        ]
+    return "\n".join(family.render() for family in families) + "\n"
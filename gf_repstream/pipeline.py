@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+import time
+
+from compression import Compressor, valid_compression
+from frame import Frame
+from histogram import LatencyHistogram
+from transform import FrameTransform, valid_transform
+from workers import OrderedPool
+
+# stage types of the output stream pipelines: (class, configuration check),
+# the classes are built with the stage configuration and provide apply(frame)
+STAGE_TYPES = {
+    "transform": (FrameTransform, valid_transform),
+    "compression": (Compressor, valid_compression),
+}
+PIPELINE_KEYS = ["stages", "workers", "pool", "max_in_flight"]
+POOLS = ["thread", "process"]
+# entries of a stage configuration that are not given to the stage class
+STAGE_KEYS = ["type", "name"]
+# per stage counters (see Pipeline.get_stats)
+STAGE_STATS = ["frames", "errors", "busy_ns", "bytes_in", "bytes_out"]
+
+
+def stage_params(stage):
+    """dict: the configuration of a stage without its type and name."""
+    return {key: value for key, value in stage.items() if key not in STAGE_KEYS}
+
+
+def stage_names(stages):
+    """Names of the stages of a pipeline, the given ones or the stage type
+    (followed by its position if the type is used several times).
+
+    Args:
+        stages (list): Stage configurations.
+
+    Returns:
+        list: one name per stage.
+    """
+    types = [stage["type"] for stage in stages]
+    return [stage.get("name") or (stage["type"] if types.count(stage["type"]) == 1 else f"{stage['type']}{i}")
+            for i, stage in enumerate(stages)]
+
+
+def pipeline_config(pipeline=None, transform=None, compression=None):
+    """Pipeline configuration of an output stream.
+
+    The ``transform`` and ``compression`` keys of an output stream are the
+    shorthand of a pipeline with a transform stage followed by a compression
+    stage, run by the worker pool of the compression (inline for a transform
+    alone).
+
+    Args:
+        pipeline (dict, optional): The pipeline key of the output stream.
+        transform (dict, optional): The transform key of the output stream.
+        compression (dict, optional): The compression key of the output stream.
+
+    Returns:
+        dict: the pipeline configuration, None if the output stream has no stage.
+    """
+    if pipeline:
+        return pipeline
+    stages = []
+    if transform:
+        stages.append(dict(transform, type="transform"))
+    if compression:
+        stages.append({key: value for key, value in compression.items() if key != "workers"})
+        stages[-1]["type"] = "compression"
+    if not stages:
+        return None
+    return {"stages": stages, "workers": compression.get("workers", 2) if compression else 0}
+
+
+def valid_pipeline(config):
+    """Checks the pipeline configuration of an output stream.
+
+    Args:
+        config (dict): stages (list of stage configurations with their type,
+            an optional name and the parameters of the stage type), workers
+            (size of the pool, 0 runs the stages in the thread of the output
+            stream), pool (thread or process) and max_in_flight.
+
+    Returns:
+        str: the problem of the configuration, None if it is valid.
+    """
+    if not isinstance(config, dict) or any(key not in PIPELINE_KEYS for key in config):
+        return f"Pipeline parameters must be {', '.join(PIPELINE_KEYS)}."
+    stages = config.get("stages")
+    if not isinstance(stages, list) or not stages:
+        return "A pipeline needs a list of stages."
+    for stage in stages:
+        if not isinstance(stage, dict) or stage.get("type") not in STAGE_TYPES:
+            return f"Stage {stage} must have a type ({', '.join(STAGE_TYPES)})."
+        if not STAGE_TYPES[stage["type"]][1](stage_params(stage)):
+            return f"Stage {stage} not valid."
+    names = stage_names(stages)
+    if len(set(names)) != len(names):
+        return f"Stage names {names} must be unique."
+    workers = config.get("workers", 2)
+    if not isinstance(workers, int) or workers < 0:
+        return "Pipeline workers must be a non negative integer."
+    if config.get("pool", "thread") not in POOLS:
+        return f"Pipeline pool must be {' or '.join(POOLS)}."
+    # without workers the stages run inline, nothing is in flight
+    max_in_flight = config.get("max_in_flight", 2 * workers)
+    if workers and (not isinstance(max_in_flight, int) or max_in_flight < workers):
+        return "Pipeline max_in_flight must be an integer not smaller than workers."
+    return None
+
+
+class StageError(Exception):
+    """A stage of a pipeline failed on a frame.
+
+    Args:
+        stage (int): Index of the stage.
+        message (str): Description of the failure.
+    """
+
+    def __init__(self, stage, message):
+        # the arguments are kept for pickling (process pool)
+        super().__init__(stage, message)
+        self.stage = stage
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+class Pipeline:
+    """Chain of per frame processing stages of an output stream (e.g. a
+    transform followed by a compression).
+
+    The stages run in the thread of the output stream or on a bounded pool
+    of threads (stages that release the GIL, numpy and the codecs) or of
+    processes (stages that hold it, the frames are copied to and from the
+    workers), see create_pool. The frames still leave in order and the
+    output stream stops taking frames from its queue while the pool is
+    full, so a slow pipeline fills the queue and its backpressure policy
+    applies.
+
+    run measures the time and the bytes in and out of every stage where it
+    runs, the output stream accumulates them with record (one thread only),
+    get_stats shows which stage is the bottleneck.
+
+    Args:
+        config (dict): stages, workers, pool and max_in_flight (see valid_pipeline).
+    """
+
+    def __init__(self, config):
+        self._config = config
+        stages = config["stages"]
+        self.names = stage_names(stages)
+        self.workers = config.get("workers", 2)
+        self.pool = config.get("pool", "thread")
+        self.max_in_flight = config.get("max_in_flight", 2 * self.workers)
+        self._stages = [STAGE_TYPES[stage["type"]][0](stage_params(stage)) for stage in stages]
+        # written only by the thread of the output stream
+        self._time = [LatencyHistogram() for _ in stages]
+        self._errors = [0] * len(stages)
+        self._bytes_in = [0] * len(stages)
+        self._bytes_out = [0] * len(stages)
+
+    def run(self, data):
+        """Runs the stages on a frame.
+
+        Args:
+            data (Frame): The envelope of the frame (not modified).
+
+        Returns:
+            tuple: the processed frame and the (time in ns, bytes in, bytes
+                out) of each stage.
+
+        Raises:
+            StageError: A stage failed.
+        """
+        timings = []
+        for index, stage in enumerate(self._stages):
+            start = time.perf_counter_ns()
+            size = data.nbytes
+            try:
+                data = stage.apply(data)
+            except Exception as err:
+                raise StageError(index, f"{self.names[index]}: {err}") from err
+            timings.append((time.perf_counter_ns() - start, size, data.nbytes))
+        return data, timings
+
+    def create_pool(self, name):
+        """Worker pool of the pipeline.
+
+        Args:
+            name (str): Prefix of the names of the worker threads.
+
+        Returns:
+            OrderedPool: the pool (its function takes a Frame and returns the
+                result of run), None if the stages run in the thread of the
+                output stream.
+        """
+        if not self.workers:
+            return None
+        if self.pool == "process":
+            return OrderedPool(_run_in_worker, self.workers, self.max_in_flight, name,
+                               processes=True, initializer=_init_worker, initargs=(self._config,),
+                               prepare=_worker_frame)
+        return OrderedPool(self.run, self.workers, self.max_in_flight, name)
+
+    def record(self, timings):
+        """Accumulates the timings of a frame returned by run."""
+        for index, (elapsed, size_in, size_out) in enumerate(timings):
+            self._time[index].record(elapsed)
+            self._bytes_in[index] += size_in
+            self._bytes_out[index] += size_out
+
+    def record_error(self, err):
+        """Counts a failed frame (the stage is known for a StageError)."""
+        if isinstance(err, StageError):
+            self._errors[err.stage] += 1
+
+    def get_stats(self):
+        """Statistics of the stages.
+
+        Returns:
+            dict: per stage name the processed frames, the failed ones, the
+                busy time (s), the mean and p99 time per frame (ms), the bytes
+                in and out and their ratio (e.g. the compression ratio).
+        """
+        stats = {}
+        for index, name in enumerate(self.names):
+            histogram = self._time[index]
+            stats[name] = stage_stats(histogram.count, self._errors[index], histogram.total,
+                                      self._bytes_in[index], self._bytes_out[index])
+            if histogram.count:
+                stats[name]["p99_ms"] = histogram.percentile(99) / 1e6
+        return stats
+
+
+def stage_stats(frames, errors, busy_ns, bytes_in, bytes_out):
+    """dict: statistics of a stage from its counters (see Pipeline.get_stats)."""
+    return {
+        "frames": frames,
+        "errors": errors,
+        "busy_s": busy_ns / 1e9,
+        "mean_ms": busy_ns / frames / 1e6 if frames else None,
+        "p99_ms": None,
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "size_ratio": bytes_in / bytes_out if bytes_out else None,
+    }
+
+
+# pipeline of a process of a process pool
+_worker_pipeline = None
+
+
+def _init_worker(config):
+    global _worker_pipeline
+    _worker_pipeline = Pipeline(config)
+
+
+def _worker_frame(data):
+    # zero copy payloads (zmq.Frame) can't be pickled, the timestamps stay with the queued frame
+    return Frame([bytes(part) for part in data.parts], data.frame)
+
+
+def _run_in_worker(data):
+    return _worker_pipeline.run(data)
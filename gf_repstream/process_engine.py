@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+import itertools
+import logging
+import multiprocessing
+
+import zmq
+
+from dispatch import DispatchSchedule
+from frame import Frame
+from receiver import Receiver
+from pipeline import STAGE_STATS, Pipeline, StageError, stage_names, stage_stats
+from shm_ring import FrameRing
+from writer_header import WriterHeader
+
+_logger = logging.getLogger("RestStreamRepeater")
+
+# counters shared by the processes (one writer each)
+INPUT_STATS = ["frames_received", "bytes_received", "decode_errors", "dropped", "oversized"]
+OUTPUT_STATS = ["sent", "bytes_sent", "dropped_full", "dropped_processing"]
+
+
+def run_ingest(ring_name, input_stats, output_stats, tuples_list, frame_block, zmq_mode, address,
+               io_threads, zero_copy, block, stop_event, poll_timeout=100):
+    """Ingest process: receives the incoming stream, chooses the output streams
+    of every frame and copies it once into the shared memory ring.
+
+    Args:
+        ring_name (str): Name of the shared memory ring.
+        input_stats: Shared array of the INPUT_STATS counters.
+        output_stats: Shared array of the OUTPUT_STATS counters of every output stream.
+        tuples_list: List of the (mode, param) of every output stream.
+        frame_block (int): Total number of frames to create a block.
+        zmq_mode (str): Zmq socket mode of the incoming stream (SUB, PULL).
+        address (str): The address string of the incoming stream.
+        io_threads (int): The size of the zmq thread pool to handle I/O operations.
+        zero_copy (bool): Receives the payloads without copying them before the ring.
+        block (bool): Waits for the slowest output process when the ring is full
+            (otherwise the frame is dropped).
+        stop_event: Event that stops the process.
+        poll_timeout (int, optional): Maximum time (ms) between two checks of the stop event.
+    """
+    ring = FrameRing.attach(ring_name)
+    receiver = Receiver(tuples_list=[], sentinel=stop_event, zmq_mode=zmq_mode,
+                        frame_block=frame_block, zero_copy=zero_copy)
+    # the outputs are identified by their bit in the target mask of the slots
+    schedule = DispatchSchedule([(1 << index, mode) for index, mode in enumerate(tuples_list)],
+                                frame_block)
+    zmq_context = zmq.Context(io_threads=io_threads)
+    zmq_socket = receiver.connect(zmq_context, address)
+    n_stats = len(OUTPUT_STATS)
+    dropped_full = OUTPUT_STATS.index("dropped_full")
+    try:
+        while not stop_event.is_set():
+            if not zmq_socket.poll(poll_timeout):
+                continue
+            data = receiver.receive(zmq_socket)
+            input_stats[0:3] = [receiver.frames_received, receiver.bytes_received, receiver.decode_errors]
+            if data is None:
+                continue
+            mask = sum(schedule.targets(data))
+            if not mask:
+                continue
+            try:
+                published = ring.put(data.parts, data.frame, mask, block=block, timeout=poll_timeout / 1000)
+                while not published and block and not stop_event.is_set() and not ring.closed:
+                    published = ring.put(data.parts, data.frame, mask, timeout=poll_timeout / 1000)
+            except ValueError as err:
+                input_stats[INPUT_STATS.index("oversized")] += 1
+                _logger.error(f"RepStream.ProcessEngine frame {data.frame} skipped: {err}")
+                continue
+            if not published:
+                input_stats[INPUT_STATS.index("dropped")] += 1
+                for index in range(len(tuples_list)):
+                    if mask >> index & 1:
+                        output_stats[index * n_stats + dropped_full] += 1
+    finally:
+        zmq_context.destroy(linger=0)
+        ring.detach()
+
+
+def run_outputs(ring_name, consumer, outputs, output_stats, stage_stats, io_threads, writer_config, stop_event,
+                idle_time=0.1):
+    """Output process: sends the frames of the shared memory ring to a group
+    of output streams.
+
+    Args:
+        ring_name (str): Name of the shared memory ring.
+        consumer (int): Index of the process as consumer of the ring.
+        outputs: List of (index, name, address, zmq_mode, pipeline, first stage index) of the
+            output streams of the process.
+        output_stats: Shared array of the OUTPUT_STATS counters of every output stream.
+        stage_stats: Shared array of the STAGE_STATS counters of every pipeline stage.
+        io_threads (int): The size of the zmq thread pool to handle I/O operations.
+        writer_config (dict): Writer configuration (std-det-writer output stream).
+        stop_event: Event that stops the process.
+        idle_time (float, optional): Maximum time to wait for a frame before
+            checking the stop event.
+    """
+    ring = FrameRing.attach(ring_name)
+    zmq_context = zmq.Context(io_threads=io_threads)
+    sockets = []
+    for index, name, address, zmq_mode, pipeline, first_stage in outputs:
+        zmq_socket = zmq_context.socket(zmq_mode)
+        zmq_socket.setsockopt(zmq.LINGER, 1000)
+        zmq_socket.bind(address)
+        # the pipeline of each output stream runs inline, the process is its worker
+        sockets.append((index, name, zmq_socket, None if not pipeline else Pipeline(pipeline), first_stage))
+    writer_header = None
+    n_stats = len(OUTPUT_STATS)
+    n_stage_stats = len(STAGE_STATS)
+    dropped_processing = OUTPUT_STATS.index("dropped_processing")
+    errors = STAGE_STATS.index("errors")
+    try:
+        while not stop_event.is_set():
+            slot = ring.wait(consumer, timeout=idle_time)
+            if slot is None:
+                continue
+            for index, name, zmq_socket, pipeline, first_stage in sockets:
+                if not slot.mask >> index & 1:
+                    continue
+                counter = output_stats[index * n_stats]
+                # copied by zmq, the slot is reused once released
+                parts = slot.parts
+                if name == "std-det-writer" or pipeline is not None:
+                    data = Frame([bytes(slot.parts[0])] + slot.parts[1:], slot.frame)
+                    if pipeline is not None:
+                        try:
+                            data, timings = pipeline.run(data)
+                        except StageError as err:
+                            output_stats[index * n_stats + dropped_processing] += 1
+                            stage_stats[(first_stage + err.stage) * n_stage_stats + errors] += 1
+                            _logger.error(f"RepStream.ProcessEngine {name} frame {slot.frame} skipped: {err}")
+                            continue
+                        for stage, (elapsed, size_in, size_out) in enumerate(timings, first_stage):
+                            offset = stage * n_stage_stats
+                            stage_stats[offset] += 1
+                            stage_stats[offset + 2] += elapsed
+                            stage_stats[offset + 3] += size_in
+                            stage_stats[offset + 4] += size_out
+                    parts = data.parts
+                    if name == "std-det-writer":
+                        if writer_header is None:
+                            writer_header = WriterHeader(writer_config)
+                        parts = [writer_header.render(data, counter), data.parts[1]]
+                zmq_socket.send_multipart(parts)
+                output_stats[index * n_stats] = counter + 1
+                output_stats[index * n_stats + 1] += sum(len(part) for part in parts)
+            ring.release(consumer, slot)
+    finally:
+        zmq_context.destroy(linger=1000)
+        ring.detach()
+
+
+class ProcessEngine:
+    def __init__(self, names, tuples_list, ports, zmq_modes, in_address, in_zmq_mode, frame_block,
+                 io_threads, writer_config, zero_copy=False, n_processes=None, n_slots=16,
+                 slot_size=16 * 2**20, block=True, addresses=None, pipelines=None):
+        """Initialize the multi-process repeater engine.
+
+        One ingest process receives the incoming stream and copies every
+        frame once into a ring of frame slots in shared memory; the output
+        streams are split in groups, each served by its own process that
+        reads the frames in place from the ring. No payload is pickled or
+        copied between the processes and the GIL of each process only
+        serializes its own outputs.
+
+        Args:
+            names: List of the names of the output streams.
+            tuples_list: List of the (mode, param) of every output stream.
+            ports: List of the ports of the output streams.
+            zmq_modes: List of the zmq modes of the output streams.
+            in_address: The address string of the incoming stream.
+            in_zmq_mode: Zmq socket mode of the incoming stream (SUB, PULL).
+            frame_block: Total number of frames to create a block.
+            io_threads: The size of the zmq thread pool of each process.
+            writer_config: Writer configuration (std-det-writer output stream).
+            zero_copy: Receives the payloads without copying them before the ring.
+            n_processes: Number of output processes. Defaults to one per output stream.
+            n_slots: Number of frame slots of the ring.
+            slot_size: Maximum size in bytes of one frame (all its parts).
+            block: Waits for the slowest output process when the ring is full,
+                otherwise the new frame is dropped.
+            addresses: List of the bind addresses of the output streams, None
+                (or a None entry) for tcp://*:port.
+            pipelines: List of the pipeline configurations of the output streams
+                (None or a None entry for none), run inline by the output
+                processes (the pool settings are ignored).
+        """
+        _logger.debug(f"RepStreamer.ProcessEngine __init__ ...")
+        self._names = names
+        self._tuples_list = tuples_list
+        self._addresses = [
+            address or f"tcp://*:{port}"
+            for port, address in itertools.zip_longest(ports, addresses or [])
+        ]
+        self._zmq_modes = zmq_modes
+        self._pipelines = [pipeline for _, pipeline in itertools.zip_longest(names, pipelines or [])]
+        # names of the stages of each output stream, their counters follow each other
+        self._stage_names = [[] if not pipeline else stage_names(pipeline["stages"]) for pipeline in self._pipelines]
+        self._first_stages = list(itertools.accumulate((len(names) for names in self._stage_names), initial=0))
+        self._in_address = in_address
+        self._in_zmq_mode = in_zmq_mode
+        self._frame_block = frame_block
+        self._io_threads = io_threads
+        self._writer_config = writer_config
+        self._zero_copy = zero_copy
+        self._n_processes = min(n_processes or len(names), len(names))
+        self._n_slots = n_slots
+        self._slot_size = slot_size
+        self._block = block
+        self._context = multiprocessing.get_context("spawn")
+        self._ring = None
+        self._processes = []
+        self._stop_event = None
+        self._input_stats = None
+        self._output_stats = None
+        self._stage_stats = None
+
+    def _groups(self):
+        # output streams assigned round robin to the output processes
+        return [list(range(consumer, len(self._names), self._n_processes))
+                for consumer in range(self._n_processes)]
+
+    def start(self):
+        """Creates the shared memory ring and starts the processes."""
+        _logger.debug(f"RepStream.ProcessEngine start ({self._n_processes} output processes)")
+        self._ring = FrameRing.create(self._n_slots, self._slot_size, self._n_processes)
+        self._stop_event = self._context.Event()
+        self._input_stats = self._context.Array("Q", len(INPUT_STATS), lock=False)
+        self._output_stats = self._context.Array("Q", len(OUTPUT_STATS) * len(self._names), lock=False)
+        self._stage_stats = self._context.Array("Q", len(STAGE_STATS) * max(self._first_stages[-1], 1), lock=False)
+        self._processes = [self._context.Process(
+            target=run_ingest,
+            args=(self._ring.name, self._input_stats, self._output_stats, self._tuples_list,
+                  self._frame_block, self._in_zmq_mode, self._in_address, self._io_threads,
+                  self._zero_copy, self._block, self._stop_event),
+            name="gf_repstream-ingest", daemon=True)]
+        for consumer, group in enumerate(self._groups()):
+            outputs = [(index, self._names[index], self._addresses[index], self._zmq_modes[index],
+                        self._pipelines[index], self._first_stages[index])
+                       for index in group]
+            self._processes.append(self._context.Process(
+                target=run_outputs,
+                args=(self._ring.name, consumer, outputs, self._output_stats, self._stage_stats, self._io_threads,
+                      self._writer_config, self._stop_event),
+                name=f"gf_repstream-output-{consumer}", daemon=True))
+        for process in self._processes:
+            process.start()
+
+    def stop(self, timeout=5):
+        """Stops the processes and removes the shared memory ring."""
+        if self._ring is None:
+            return
+        self._stop_event.set()
+        self._ring.close()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                _logger.error(f"RepStream.ProcessEngine {process.name} did not stop, terminating it...")
+                process.terminate()
+                process.join()
+        self._ring.detach()
+        self._ring = None
+
+    def get_stats(self):
+        """Statistics of the incoming stream and of the output streams.
+
+        Returns:
+            dict: same structure as SRepeater.get_stats.
+        """
+        if self._input_stats is None:
+            return {"input": None, "outputs": {}, "memory": None}
+        stream_input = dict(zip(INPUT_STATS, self._input_stats))
+        outputs = {}
+        n_stats = len(OUTPUT_STATS)
+        write_seq = self._ring.write_seq if self._ring is not None else None
+        for consumer, group in enumerate(self._groups()):
+            depth = None if write_seq is None else write_seq - self._ring.read_seq(consumer)
+            for index in group:
+                stats = dict(zip(OUTPUT_STATS, self._output_stats[index * n_stats:(index + 1) * n_stats]))
+                stats.update({
+                    "dropped": stats["dropped_full"] + stats["dropped_processing"],
+                    "dropped_stale": 0,
+                    "dropped_budget": 0,
+                    "bytes_in_flight": 0,
+                    "policy": "block" if self._block else "drop_newest",
+                    "queue_depth": depth,
+                    "latency_p50_ms": None,
+                    "latency_p99_ms": None,
+                })
+                if self._pipelines[index]:
+                    n_stage_stats = len(STAGE_STATS)
+                    stats["stages"] = {
+                        name: stage_stats(*self._stage_stats[stage * n_stage_stats:(stage + 1) * n_stage_stats])
+                        for stage, name in enumerate(self._stage_names[index], self._first_stages[index])
+                    }
+                outputs[self._names[index]] = stats
+        memory = {
+            "budget": self._n_slots * self._slot_size,
+            "bytes_in_flight": None,
+            "frames_in_flight": None if write_seq is None else
+            write_seq - min(self._ring.read_seq(consumer) for consumer in range(self._n_processes)),
+            "peak_bytes_in_flight": None,
+            "dropped": stream_input["dropped"],
+        }
+        return {"input": stream_input, "outputs": outputs, "memory": memory}
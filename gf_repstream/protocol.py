@@ -1,108 +1,170 @@
 #!/usr/bin/env python
-from _ctypes import Structure
-from ctypes import c_uint64, c_uint32, c_uint16, c_uint8, c_byte, c_int, c_bool
+from ctypes import LittleEndianStructure, c_uint8, c_uint16, c_uint32
 
+import numpy as np
 
-class RowPerFrame(Structure):
-    _pack_ = 1
-    _fields_ = [
-        ("rpf0", c_bool),  # 1 bit
-        ("rpf1", c_bool),  # 1 bit
-    ]
-
-    def as_dict(self):
-        return dict((f, getattr(self, f)) for f, _ in self._fields_)
-
-
-class ExposureTime(Structure):
-    _pack_ = 1
-    _fields_ = [
-        ("exptime0", c_uint8),  # 1 bytes
-        ("exptime0", c_uint16),  # 2 bytes | 3 bytes
-    ]
-
-    def as_dict(self):
-        return dict((f, getattr(self, f)) for f, _ in self._fields_)
-
-
-class Timestamp(Structure):
-    _pack_ = 1
-    _fields_ = [
-        ("timestamp0", c_uint32),    # 4 bytes
-        ("timestamp1", c_uint8),     # 1 bytes  | 5 bytes
-    ]
-
-    def as_dict(self):
-        return dict((f, getattr(self, f)) for f, _ in self._fields_)
-
-
-class RowsPerFramePerQuadrant(Structure):
-    _pack_ = 1
-    _fields_ = [
-        ("rpfpq0", c_bool),  # 1 bit
-        ("rpfpq1", c_bool),  # 1 bit
-        ("rpfpq2", c_bool),  # 1 bit
-        ("rpfpq3", c_bool),  # 1 bit
-        ("rpfpq4", c_bool),  # 1 bit
-        ("rpfpq5", c_bool),  # 1 bit
-        ("rpfpq6", c_bool),  # 1 bit  | 7 bits
-    ]
-
-    def as_dict(self):
-        return dict((f, getattr(self, f)) for f, _ in self._fields_)
-
-
-class CorrectionMode(Structure):
-    _pack_ = 1
-    _fields_ = [
-        ("corr_mode0", c_bool),  # 1 bit
-        ("corr_mode1", c_bool),  # 1 bit
-        ("corr_mode2", c_bool),  # 1 bit  | 3 bits
-    ]
-
-    def as_dict(self):
-        return dict((f, getattr(self, f)) for f, _ in self._fields_)
-
-
-class FlagsHeader(Structure):
-    _pack_ = 1
-    _fields_ = [
-        ("do_not_store", c_bool),    # 1 bit
-        ("zero", c_bool),            # 1 bit
-        ("trigger", c_bool),         # 1 bit
-        ("enable", c_bool),          # 1 bit
-        ("status0", c_bool),         # 1 bit
-        ("status1", c_bool),         # 1 bit
-        ("status2", c_bool),         # 1 bit
-        ("status3", c_bool),         # 1 bit
-        ("status4", c_uint8)         # 8 bits |  16 bits
-    ]
-
-    def as_dict(self):
-        return dict((f, getattr(self, f)) for f, _ in self._fields_)
 
+class GFHeader(LittleEndianStructure):
+    """Header of a GigaFRoST UDP packet (32 bytes), one packet at a time
+    (see decode_headers for batches of packets).
 
-class GFHeader(Structure):
+    The bit fields are allocated from the least significant bit of their
+    16 bit word, as C bit fields on a little endian host.
+    """
     _pack_ = 1
     _fields_ = [
         ("protocol_id", c_uint8),        # 1 byte        | 1 byte
-        ("row_legth", c_uint8),          # 1 byte        | 2 bytes
-        ("rpfpq", RowsPerFramePerQuadrant),  # 7 bits
-        ("swap", c_bool),                # 1 bits        | 3 bytes
-        ("N", c_bool),                   # 1 bit
-        ("E", c_bool),                   # 1 bit
-        ("link", c_bool),                # 1 bit
-        ("correction_mode", CorrectionMode),  # 3 bits
-        ("rpf", RowPerFrame),                # 2 bits   | 4 bytes
+        ("row_length", c_uint8),         # 1 byte        | 2 bytes
+        ("rpfpq", c_uint16, 7),          # 7 bits
+        ("swap", c_uint16, 1),           # 1 bit         | 3 bytes
+        ("N", c_uint16, 1),              # 1 bit
+        ("E", c_uint16, 1),              # 1 bit
+        ("link", c_uint16, 1),           # 1 bit
+        ("correction_mode", c_uint16, 3),  # 3 bits
+        ("rpf", c_uint16, 2),            # 2 bits        | 4 bytes
         ("scan_id", c_uint32),           # 4 bytes       | 8 bytes
         ("frame_number", c_uint32),      # 4 bytes       | 12 bytes
-        ("flags", FlagsHeader),         # 2 bytes       | 14 bytes
+        ("do_not_store", c_uint16, 1),   # 1 bit
+        ("zero", c_uint16, 1),           # 1 bit
+        ("trigger", c_uint16, 1),        # 1 bit
+        ("enable", c_uint16, 1),         # 1 bit
+        ("status0", c_uint16, 1),        # 1 bit
+        ("status1", c_uint16, 1),        # 1 bit
+        ("status2", c_uint16, 1),        # 1 bit
+        ("status3", c_uint16, 1),        # 1 bit
+        ("status4", c_uint16, 8),        # 8 bits        | 14 bytes
         ("starting_row", c_uint16),      # 2 bytes       | 16 bytes
-        ("timestamp", Timestamp),        # 5 bytes       | 21 bytes
-        ("exposure_time", ExposureTime),  # 3 bytes       | 24 bytes
+        ("timestamp0", c_uint32),        # 4 bytes
+        ("timestamp1", c_uint8),         # 1 byte        | 21 bytes
+        ("exptime0", c_uint8),           # 1 byte
+        ("exptime1", c_uint16),          # 2 bytes       | 24 bytes
         ("sync_time", c_uint32),         # 4 bytes       | 28 bytes
         ("scan_time", c_uint32),         # 4 bytes       | 32 bytes (TOTAL)
     ]  # 32 bytes
 
     def as_dict(self):
-        return dict((f, getattr(self, f)) for f, _ in self._fields_)
+        return dict((field[0], getattr(self, field[0])) for field in self._fields_)
+
+
+# GFHeader as numpy structured type, the bit fields kept in their 16 bit words
+GF_HEADER_DTYPE = np.dtype([
+    ("protocol_id", "u1"),
+    ("row_length", "u1"),
+    ("geometry", "<u2"),
+    ("scan_id", "<u4"),
+    ("frame_number", "<u4"),
+    ("flags", "<u2"),
+    ("starting_row", "<u2"),
+    ("timestamp0", "<u4"),
+    ("timestamp1", "u1"),
+    ("exptime0", "u1"),
+    ("exptime1", "<u2"),
+    ("sync_time", "<u4"),
+    ("scan_time", "<u4"),
+])
+GF_HEADER_SIZE = GF_HEADER_DTYPE.itemsize
+# bit field: (word of GF_HEADER_DTYPE, first bit, number of bits)
+GF_BIT_FIELDS = {
+    "rpfpq": ("geometry", 0, 7),
+    "swap": ("geometry", 7, 1),
+    "N": ("geometry", 8, 1),
+    "E": ("geometry", 9, 1),
+    "link": ("geometry", 10, 1),
+    "correction_mode": ("geometry", 11, 3),
+    "rpf": ("geometry", 14, 2),
+    "do_not_store": ("flags", 0, 1),
+    "zero": ("flags", 1, 1),
+    "trigger": ("flags", 2, 1),
+    "enable": ("flags", 3, 1),
+    "status0": ("flags", 4, 1),
+    "status1": ("flags", 5, 1),
+    "status2": ("flags", 6, 1),
+    "status3": ("flags", 7, 1),
+    "status4": ("flags", 8, 8),
+}
+# fields split over two words: (low word, its number of bits, high word)
+GF_SPLIT_FIELDS = {
+    "timestamp": ("timestamp0", 32, "timestamp1"),
+    "exposure_time": ("exptime0", 8, "exptime1"),
+}
+# decoded fields (columns of decode_headers), in header order
+GF_FIELDS = ["protocol_id", "row_length", "rpfpq", "swap", "N", "E", "link", "correction_mode", "rpf",
+             "scan_id", "frame_number", "do_not_store", "zero", "trigger", "enable", "status0", "status1",
+             "status2", "status3", "status4", "starting_row", "timestamp", "exposure_time", "sync_time",
+             "scan_time"]
+
+
+def header_view(packets):
+    """Structured view of the headers of a batch of packets, without copying them.
+
+    Args:
+        packets: Consecutive headers (bytes like object), or a two dimensional
+            uint8 array with one packet per row (e.g. a receive buffer).
+
+    Returns:
+        numpy.ndarray: one GF_HEADER_DTYPE element per packet.
+    """
+    if isinstance(packets, np.ndarray) and packets.ndim == 2:
+        # the rows can be longer than a header, only the last axis must be contiguous
+        return packets[:, :GF_HEADER_SIZE].view(GF_HEADER_DTYPE)[:, 0]
+    return np.frombuffer(packets, dtype=GF_HEADER_DTYPE)
+
+
+def decode_headers(packets, fields=None):
+    """Decodes the headers of a batch of packets into columns.
+
+    Args:
+        packets: Consecutive headers or one packet per row (see header_view).
+        fields (list, optional): Names of the fields to decode (GF_FIELDS).
+            Defaults to None (all of them).
+
+    Returns:
+        dict: one array per field (copies, the packets can be reused).
+    """
+    headers = header_view(packets)
+    columns = {}
+    for name in fields or GF_FIELDS:
+        if name in GF_BIT_FIELDS:
+            word, shift, width = GF_BIT_FIELDS[name]
+            values = (headers[word] >> shift) & ((1 << width) - 1)
+            columns[name] = values.astype(np.uint8 if width <= 8 else np.uint16)
+        elif name in GF_SPLIT_FIELDS:
+            low, bits, high = GF_SPLIT_FIELDS[name]
+            columns[name] = headers[low].astype(np.uint64) | (headers[high].astype(np.uint64) << bits)
+        else:
+            columns[name] = np.ascontiguousarray(headers[name])
+    return columns
+
+
+def encode_headers(columns, n=None):
+    """Encodes the headers of a batch of packets (the inverse of decode_headers).
+
+    Args:
+        columns (dict): Values of the fields (GF_FIELDS), arrays or scalars;
+            the missing fields are zero.
+        n (int, optional): Number of headers. Defaults to None (length of the
+            first array of the columns).
+
+    Returns:
+        numpy.ndarray: the headers (GF_HEADER_DTYPE), ``tobytes()`` gives the packet headers.
+
+    Raises:
+        KeyError: A column is not a header field.
+    """
+    if n is None:
+        n = next(len(values) for values in columns.values() if np.ndim(values))
+    headers = np.zeros(n, dtype=GF_HEADER_DTYPE)
+    for name, values in columns.items():
+        if name in GF_BIT_FIELDS:
+            word, shift, width = GF_BIT_FIELDS[name]
+            headers[word] |= (np.asarray(values, dtype=np.uint16) & ((1 << width) - 1)) << shift
+        elif name in GF_SPLIT_FIELDS:
+            low, bits, high = GF_SPLIT_FIELDS[name]
+            values = np.asarray(values, dtype=np.uint64)
+            headers[low] = values & ((1 << bits) - 1)
+            headers[high] = (values >> bits) & np.iinfo(GF_HEADER_DTYPE[high]).max
+        elif name in GF_HEADER_DTYPE.names and name not in ["geometry", "flags"]:
+            headers[name] = values
+        else:
+            raise KeyError(f"{name} is not a GFHeader field.")
+    return headers
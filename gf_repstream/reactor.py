@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+import logging
+import zmq
+from functools import partial
+
+_logger = logging.getLogger("RestStreamRepeater")
+
+
+class Reactor:
+    def __init__(self, receiver, streamers, sentinel, poll_timeout=100, batch_size=64, linger=1000, merger=None):
+        """Initialize the single threaded repeater engine (experimental).
+
+        The incoming stream, the dispatch of the frames and all the output
+        streams are served from one zmq poller loop over one zmq context,
+        instead of one receiver thread plus one thread per output stream.
+        It has not shown a consistent gain over the threaded engine yet,
+        only with many output streams (see ``benchmark.py engines``).
+
+        Args:
+            receiver: Receiver object that prepares the input socket and dispatches the frames.
+            streamers: List of Streamer objects, one per output stream.
+            sentinel: Flag object to halt execution.
+            poll_timeout: Maximum time (ms) between two checks of the sentinel.
+            batch_size: Maximum number of messages handled per socket and poll.
+            linger: Time (ms) given to the pending messages to be sent on stop.
+            merger: Merger object aligning several incoming streams (optional).
+        """
+        _logger.debug(f"RepStreamer.Reactor __init__ ...")
+        self._receiver = receiver
+        self._streamers = streamers
+        self._sentinel = sentinel
+        self._poll_timeout = poll_timeout
+        self._batch_size = batch_size
+        self._linger = linger
+        self._merger = merger
+
+    def _ready(self):
+        return self._receiver.ready() and all(streamer.ready() for streamer in self._streamers)
+
+    def start(self, io_threads, address):
+        """Start the reactor loop.
+
+        Args:
+            io_threads (int): The size of the zmq thread pool to handle I/O operations.
+            address (str): The address string of the incoming stream, e.g. 'tcp://127.0.0.1:9001',
+                or the list of addresses of the incoming streams to merge.
+        """
+        _logger.debug(
+            f"RepStream.Reactor start (io_threads {io_threads} and address {address})"
+        )
+        zmq_context = zmq.Context(io_threads=io_threads)
+        if self._merger is None:
+            # (socket, receiver, handler of the received frames)
+            inputs = [(self._receiver.connect(zmq_context, address), self._receiver,
+                       partial(self._receiver.dispatch, block=False))]
+        else:
+            self._receiver.reset()
+            self._merger.reset()
+            inputs = [(receiver.connect(zmq_context, in_address), receiver,
+                       partial(self._merger.add, index, block=False))
+                      for index, (receiver, in_address) in enumerate(zip(self._merger.inputs, address))]
+        out_sockets = [streamer.bind(zmq_context) for streamer in self._streamers]
+
+        poller = zmq.Poller()
+        for in_socket, _, _ in inputs:
+            poller.register(in_socket, zmq.POLLIN)
+        # the worker pools (compression) wake the loop up when a frame is processed
+        notifiers = [(streamer, streamer.fileno()) for streamer in self._streamers
+                     if streamer.fileno() is not None]
+        for _, fd in notifiers:
+            poller.register(fd, zmq.POLLIN)
+        receiving = True
+        waiting = [False] * len(out_sockets)
+        try:
+            while not self._sentinel.is_set():
+                # queues the frames released at once (reorder buffer, merge) that did not fit
+                self._receiver.unpark()
+                # the input is not read while a blocking output queue or the memory budget is full
+                ready = self._ready()
+                if ready != receiving:
+                    for in_socket, _, _ in inputs:
+                        if ready:
+                            poller.register(in_socket, zmq.POLLIN)
+                        else:
+                            poller.unregister(in_socket)
+                    receiving = ready
+                # outputs are polled for POLLOUT only when they have pending frames
+                for idx, streamer in enumerate(self._streamers):
+                    pending = streamer.pending()
+                    if pending != waiting[idx]:
+                        if pending:
+                            poller.register(out_sockets[idx], zmq.POLLOUT)
+                        else:
+                            poller.unregister(out_sockets[idx])
+                        waiting[idx] = pending
+                events = dict(poller.poll(self._poll_timeout))
+                for streamer, fd in notifiers:
+                    if events.get(fd, 0) & zmq.POLLIN:
+                        streamer.clear_notifications()
+
+                for in_socket, receiver, handle in inputs:
+                    if not events.get(in_socket, 0) & zmq.POLLIN:
+                        continue
+                    for _ in range(self._batch_size):
+                        try:
+                            data = receiver.receive(in_socket, flags=zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        if data is not None:
+                            handle(data)
+                        if not self._ready():
+                            break
+                # releases the frames held back by missing parts or frames
+                if self._merger is not None:
+                    self._merger.expire(block=False)
+                else:
+                    self._receiver.flush(block=False)
+
+                for idx, streamer in enumerate(self._streamers):
+                    if events.get(out_sockets[idx], 0) & zmq.POLLOUT:
+                        for _ in range(self._batch_size):
+                            if not streamer.send_next(out_sockets[idx]):
+                                break
+                            if not out_sockets[idx].getsockopt(zmq.EVENTS) & zmq.POLLOUT:
+                                break
+        finally:
+            zmq_context.destroy(linger=self._linger)
+            for streamer in self._streamers:
+                streamer.close()
+            _logger.debug(f"RepStream.Reactor end signal received... finishing reactor thread...")
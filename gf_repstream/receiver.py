@@ -1,19 +1,34 @@
 #!/usr/bin/env python
 import logging
-import json
 import zmq
 import time
+from collections import deque
 from systemd import journal
 
+from dispatch import DispatchSchedule
+from frame import Frame
+from frame_queue import BLOCK
+
 _logger = logging.getLogger("RestStreamRepeater")
 
+# maximum time (ms) the frames held by the reorder buffer wait for a new message
+REORDER_POLL_TIMEOUT = 10
+
 class Receiver:
-    def __init__(self, tuples_list, sentinel, zmq_mode, frame_block):
+    def __init__(self, tuples_list, sentinel, zmq_mode, frame_block, zero_copy=False, pool=None, metrics=True,
+                 timestamps=False, reorder=None):
         """Initialize a gigafrost receiver.
 
         Args:
             tuples_list: List of touples containing an Streamer class object and the send_every_nth parameter of this class.
             sentinel: Flag object to halt execution.
+            zmq_mode: Zmq socket mode of the incoming stream (SUB, PULL)
+            frame_block: Total number of frames to create a block.
+            zero_copy: Receives the payload as zmq frames, without copying it into bytes objects.
+            pool: FramePool with the memory budget of the queued frames (optional).
+            metrics: Counts the received bytes (the frame and error counters are always kept).
+            timestamps: Stamps every frame with its ingress time and the time of each receiver stage.
+            reorder: ReorderBuffer releasing the frames in frame number order before the dispatch (optional).
 
         """
         _logger.debug(
@@ -23,24 +38,199 @@ class Receiver:
         self._sentinel = sentinel
         self._zmq_mode = zmq_mode
         self._frame_block = frame_block
+        self._zero_copy = zero_copy
+        self._pool = pool
+        self._schedule = DispatchSchedule(tuples_list, frame_block)
+        self._metrics = metrics
+        self._timestamps = timestamps
+        self._reorder = reorder
+        # (frame, output queues) not queued yet by a non blocking dispatch, in frame order
+        self._parked = deque()
+        # counters written only by the receiver thread
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.decode_errors = 0
 
-    def timePassed(self, oldtime, seconds):
-        """_summary_
+    def connect(self, zmq_context, address):
+        """Prepares the zmq socket that receives the incoming stream.
 
         Args:
-            oldtime (float): original time
-            seconds (int): time in seconds that should be waited 
-                            until return
+            zmq_context (zmq.Context): Context in which the socket is created.
+            address (str): The address string, e.g. 'tcp://127.0.0.1:9001'.
 
         Returns:
-            bool: True if the time between original time and now is 
-                    greater than seconds, otherwise False
+            zmq.Socket: the connected socket.
+
+        Raises:
+            RuntimeError: Input zmq mode not recognized.
         """
-        currenttime = time.time()
-        if currenttime - oldtime > seconds:
-            return True
+        if self._zmq_mode.upper() == "SUB":
+            zmq_socket = zmq_context.socket(zmq.SUB)
+            zmq_socket.setsockopt_string(zmq.SUBSCRIBE, u"")
+        elif self._zmq_mode.upper() == "PULL":
+            zmq_socket = zmq_context.socket(zmq.PULL)
         else:
-            return False
+            raise RuntimeError(
+                "Receiver input zmq mode not recognized (SUB/PULL).")
+
+        zmq_socket.connect(address)
+        zmq_socket.setsockopt(zmq.LINGER, -1)
+        self.reset()
+        return zmq_socket
+
+    def reset(self):
+        """Compiles the dispatch schedule of the output streams (resets their state)."""
+        self._schedule = DispatchSchedule(self._streamer_tuples, self._frame_block)
+        if self._reorder is not None:
+            self._reorder.reset()
+
+    def receive(self, zmq_socket, flags=0):
+        """Receives one message from the incoming stream.
+
+        Args:
+            zmq_socket (zmq.Socket): Socket returned by connect.
+            flags (int, optional): zmq receive flags. Defaults to 0 (blocking).
+
+        Returns:
+            Frame: the envelope of the received message, None if its header
+                could not be decoded (the message is skipped).
+
+        Raises:
+            zmq.Again: No message available in non blocking mode.
+        """
+        if self._timestamps:
+            if not flags & zmq.NOBLOCK:
+                # the receive time must not include the time waiting for a message
+                zmq_socket.poll()
+            recv_start = time.perf_counter()
+        if self._zero_copy:
+            parts = zmq_socket.recv_multipart(flags=flags, copy=False)
+            # only the (small) header is copied
+            parts[0] = parts[0].bytes
+        else:
+            parts = zmq_socket.recv_multipart(flags=flags)
+        if self._timestamps:
+            received = time.perf_counter()
+            ingress_time = time.time()
+        try:
+            data = Frame.from_parts(parts)
+            if self._timestamps:
+                data.timestamps = [ingress_time, recv_start, received, time.perf_counter()]
+        except Exception:
+            self.decode_errors += 1
+            _logger.error(f"RepStream.Receiver problem decoding the Metadata, message skipped...")
+            return None
+        _logger.debug(f"RepStream.Receiver received frame: {data.frame}")
+        self.frames_received += 1
+        if self._metrics:
+            self.bytes_received += data.nbytes
+        return data
+
+    def get_stats(self):
+        """Statistics of the incoming stream.
+
+        Returns:
+            dict: received frames and bytes, and messages that could not be decoded.
+        """
+        stats = {
+            "frames_received": self.frames_received,
+            "bytes_received": self.bytes_received,
+            "decode_errors": self.decode_errors,
+        }
+        if self._reorder is not None:
+            stats["reorder"] = self._reorder.get_stats()
+        return stats
+
+    def get_dispatch_stats(self):
+        """Dispatch statistics of the output streams (e.g. current decimation).
+
+        Returns:
+            list: one dictionary per output stream, in the configuration order.
+        """
+        return self._schedule.get_stats()
+
+    def ready(self):
+        """bool: False if the memory budget would hold back a new frame, or if
+        frames are parked waiting for room in a lossless output stream."""
+        return not self._parked and (self._pool is None or self._pool.has_room())
+
+    def unpark(self):
+        """Queues the frames parked by a non blocking dispatch into the output
+        streams that have room again, in order.
+
+        Returns:
+            bool: True if no frame is parked anymore.
+        """
+        parked = self._parked
+        while parked:
+            data, targets = parked[0]
+            remaining = self._put(data, targets, block=False)
+            if remaining:
+                parked[0] = (data, remaining)
+                return False
+            parked.popleft()
+        return True
+
+    def get_gaps(self):
+        """list: the most recent gaps of the incoming stream, as [first, last] missing frame numbers."""
+        return [] if self._reorder is None else self._reorder.get_gaps()
+
+    def dispatch(self, data, block=True):
+        """Queues a received frame into the output streams that should send it,
+        through the reorder buffer if any.
+
+        Args:
+            data (Frame): The envelope of the received message.
+            block (bool, optional): Waits for room in the memory budget and in
+                the queues of the lossless output streams. Defaults to True,
+                without it the frames that do not fit are parked (see unpark).
+        """
+        if self._reorder is None:
+            self._dispatch(data, block)
+            return
+        for released in self._reorder.add(data):
+            self._dispatch(released, block)
+
+    def flush(self, block=True):
+        """Dispatches the frames of the reorder buffer that waited too long for
+        the missing frames before them.
+
+        Args:
+            block (bool, optional): Waits for room in the memory budget and in
+                the queues of the lossless output streams. Defaults to True.
+        """
+        if self._reorder is not None:
+            for released in self._reorder.flush():
+                self._dispatch(released, block)
+
+    def _dispatch(self, data, block):
+        targets = self._schedule.targets(data)
+        if not targets:
+            return
+        if data.timestamps is not None:
+            data.timestamps.append(time.perf_counter())
+        if self._pool is not None:
+            # one reference per output stream, released once sent or dropped
+            lossless = block and any(queue.policy == BLOCK for queue in targets)
+            if not self._pool.acquire(data, len(targets), block=lossless):
+                for queue in targets:
+                    queue.discard(data)
+                return
+        if self._parked:
+            # the frames before it wait for room, the outputs get the frames in order
+            self._parked.append((data, targets))
+            return
+        remaining = self._put(data, targets, block)
+        if remaining:
+            self._parked.append((data, remaining))
+
+    @staticmethod
+    def _put(data, targets, block):
+        # returns the output queues that were full (only without block)
+        for index, queue in enumerate(targets):
+            if queue.put(data, block=block) is None:
+                return targets[index:]
+        return None
 
     def start(self, io_threads, address):
         """Start the receiver loop.
@@ -49,88 +239,22 @@ class Receiver:
             io_threads (int): The size of the zmq thread pool to handle I/O operations.
             address (str): The address string, e.g. 'tcp://127.0.0.1:9001'.
 
-        Raises:
-            RuntimeError: Unknown metadata format.
         """
         _logger.debug(
             f"GF_repstream.Receiver start (io_threads {io_threads} and address {address} (zmq mode {self._zmq_mode}))"
         )
 
         # prepares the zmq socket to receive data
-        zmq_context = zmq.Context(io_threads=5)
-        if self._zmq_mode.upper() == "SUB":
-            zmq_socket = zmq_context.socket(zmq.SUB)
-            zmq_socket.setsockopt_string(zmq.SUBSCRIBE, u"")
-        elif self._zmq_mode.upper() == "PULL":
-            zmq_socket = zmq_context.socket(zmq.PULL)
-        else:
-            raise RuntimeError(
-                "Receiver input zmq mode not recognized (SUB/PULL).")
-
-        zmq_socket.connect(address)
-        zmq_socket.setsockopt(zmq.LINGER, -1)
-        send_flag = [False for i in range(len(self._streamer_tuples))]
-        frame_counter = 0
-        stride_counter = 0
-        send_every_sec_counter = [0 for i in range(len(self._streamer_tuples))]
+        zmq_context = zmq.Context(io_threads=io_threads)
+        zmq_socket = self.connect(zmq_context, address)
         while not self._sentinel.is_set():
+            if self._reorder is not None and not zmq_socket.poll(REORDER_POLL_TIMEOUT):
+                # releases the frames held back by missing frames
+                self.flush()
+                continue
             # receives the data
-            try:
-                data = zmq_socket.recv_multipart()
-                metadata = json.loads(data[0].decode())
-                image_frame = metadata["frame"]
-                _logger.debug(f"RepStream.Receiver received frame: {image_frame}")
-                frame_counter += 1
-            except BaseException:
-                raise RuntimeError("Problem decoding the Metadata...")
-
-            for idx, stream in enumerate(self._streamer_tuples):
-                # stream output mode
-                stream_mode = stream[1][0]
-                # stream output param
-                stream_param = stream[1][1]
-                if stream_mode == "send_every_nth":
-                    # mode strides: sends 1 frame every nth
-                    if image_frame % stream_param == 0:
-                        stream[0].append(data)
-                elif stream_mode == "strides":
-                    # mode strides: sends n frames and skip the next n frames
-                    # n = send_output_param
-                    if send_flag[idx]:
-                        stride_counter += 1
-                        if stride_counter <= stream_param:
-                            stream[0].append(data)
-                        elif stride_counter == 2 * stream_param:
-                            send_flag[idx] = False
-                    else:
-                        if image_frame % stream_param == 0:
-                            send_flag[idx] = True
-                            stride_counter = 1
-                            stream[0].append(data)
-                elif stream_mode == "send_every_nth_frame":
-                    # mode send_every_nth_frame: sends Y frames every N frames
-                    # Y: self._frame_block (defined on the init for now)
-                    # N: send_output_param
-                    if send_flag[idx]:
-                        frame_counter += 1
-                        stream[0].append(data)
-                        if frame_counter == self._frame_block:
-                            send_flag[idx] = False
-                            frame_counter = 0
-                    else:
-                        if image_frame % stream_param == 0:
-                            send_flag[idx] = True
-                            frame_counter = 1
-                            stream[0].append(data)
-                elif stream_mode == "send_every_sec":
-                    # wait for seconds
-                    if send_flag[idx]:
-                        if self.timePassed(
-                                send_every_sec_counter[idx], stream_param):
-                            send_flag[idx] = False
-                    else:
-                        send_every_sec_counter[idx] = time.time()
-                        send_flag[idx] = True
-                        stream[0].append(data)
+            data = self.receive(zmq_socket)
+            if data is not None:
+                self.dispatch(data)
 
         _logger.debug(f"End signal received... finishing receiver thread...")
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+import errno
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+# record header: frame number, number of parts, then the size of each part;
+# the records are 8 byte aligned
+_RECORD = struct.Struct("<qI4x")
+_SIZE = struct.Struct("<Q")
+_ALIGN = 8
+# index entry of a record: frame number, segment number, number of parts, offset in the segment
+_INDEX_ENTRY = struct.Struct("<qIIQ")
+INDEX_DTYPE = np.dtype([("frame", "<i8"), ("segment", "<u4"), ("n_parts", "<u4"), ("offset", "<u8")])
+INDEX_FILE = "index.dat"
+SEGMENT_FILE = "segment_%06d.dat"
+RECORD_DEFAULTS = {"segment_size": 2**30, "sync": False}
+# maximum time (s) the index entries of the current segment wait to be visible to the readers
+INDEX_FLUSH_INTERVAL = 1.0
+
+
+def _segment_numbers(directory):
+    return sorted(int(name[8:14]) for name in os.listdir(directory)
+                  if name.startswith("segment_") and name.endswith(".dat"))
+
+
+class FrameRecorder:
+    """Append log of the frames of an output stream on local disk.
+
+    The multipart messages (headers and payloads) are copied one after the
+    other into preallocated segment files mapped in memory, so a frame is
+    one memcpy and the kernel writes the segments back with large
+    sequential writes. A segment that is full is truncated to its used size
+    and the next one is allocated. Every record gets a fixed size entry in
+    ``index.dat`` (frame number, segment, number of parts and offset), so
+    a frame is found by its number without scanning the segments (see
+    RecordReader).
+
+    A directory that already holds a recording is continued: the new
+    segments follow the existing ones and the index is appended. The index
+    is written out at least every second, so the frames of the current
+    segment are visible to the readers (and survive a crash) shortly after
+    they are recorded.
+
+    Args:
+        directory (str): Directory of the recording (created if needed).
+        segment_size (int, optional): Size in bytes of a segment, the largest
+            frame that can be recorded. Defaults to 1 GiB.
+        sync (bool, optional): Waits for a full segment to be on disk before
+            allocating the next one. Defaults to False.
+    """
+
+    def __init__(self, directory, segment_size=RECORD_DEFAULTS["segment_size"], sync=RECORD_DEFAULTS["sync"]):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._segment_size = segment_size
+        self._sync = sync
+        existing = _segment_numbers(directory)
+        self._segment = existing[-1] if existing else -1
+        self._file = None
+        self._map = None
+        self._offset = 0
+        self._index = open(os.path.join(directory, INDEX_FILE), "ab", buffering=2**20)
+        self._index_flushed = time.monotonic()
+        self.frames = 0
+        self.bytes_written = 0
+        self.segments = 0
+
+    def _next_segment(self):
+        self._close_segment()
+        self._segment += 1
+        path = os.path.join(self.directory, SEGMENT_FILE % self._segment)
+        self._file = open(path, "w+b")
+        # reserves the blocks now, not page by page while writing
+        try:
+            os.posix_fallocate(self._file.fileno(), 0, self._segment_size)
+        except OSError as err:
+            if err.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                # a sparse segment on a full disk would fail the writes with SIGBUS
+                self._file.close()
+                self._file = None
+                os.remove(path)
+                self._segment -= 1
+                raise
+            # the file system can't preallocate
+            os.ftruncate(self._file.fileno(), self._segment_size)
+        self._map = mmap.mmap(self._file.fileno(), self._segment_size)
+        self._map.madvise(mmap.MADV_SEQUENTIAL)
+        self._offset = 0
+        self.segments += 1
+
+    def _close_segment(self):
+        if self._map is None:
+            return
+        if self._sync:
+            self._map.flush()
+        self._map.close()
+        self._file.truncate(self._offset)
+        self._file.close()
+        self._map = None
+        self._file = None
+        # the records of a closed segment are all visible to the readers
+        self._flush_index()
+
+    def _flush_index(self):
+        self._index.flush()
+        self._index_flushed = time.monotonic()
+
+    def write(self, parts, frame):
+        """Appends a frame to the recording.
+
+        Args:
+            parts (list): The message parts (bytes like objects).
+            frame (int): Frame number.
+
+        Raises:
+            ValueError: The frame is larger than a segment.
+            OSError: The next segment can't be allocated (e.g. disk full).
+        """
+        sizes = [len(part) for part in parts]
+        header_size = _RECORD.size + _SIZE.size * len(parts)
+        size = header_size + sum(sizes)
+        size += -size % _ALIGN
+        if size > self._segment_size:
+            raise ValueError(f"Frame of {size} bytes larger than the segments ({self._segment_size} bytes).")
+        if self._map is None or self._offset + size > self._segment_size:
+            self._next_segment()
+        offset = self._offset
+        buf = self._map
+        _RECORD.pack_into(buf, offset, frame, len(parts))
+        position = offset + _RECORD.size
+        for part_size in sizes:
+            _SIZE.pack_into(buf, position, part_size)
+            position += _SIZE.size
+        for part, part_size in zip(parts, sizes):
+            buf[position:position + part_size] = part
+            position += part_size
+        self._offset = offset + size
+        self._index.write(_INDEX_ENTRY.pack(frame, self._segment, len(parts), offset))
+        self.frames += 1
+        self.bytes_written += size
+        if time.monotonic() - self._index_flushed >= INDEX_FLUSH_INTERVAL:
+            self._flush_index()
+
+    def close(self):
+        """Truncates the last segment and writes the index out."""
+        if self._index is None:
+            return
+        self._close_segment()
+        self._index.close()
+        self._index = None
+
+
+class RecordReader:
+    """Random access to a recording of FrameRecorder.
+
+    The index is read once; a frame is then found by its number in constant
+    time and its parts are read in place from the segments mapped in
+    memory. A frame number recorded several times (e.g. a continued
+    recording) gives its last record.
+
+    Example:
+        with RecordReader("/data/run_42") as recording:
+            header, payload = recording[7766800]
+
+    Args:
+        directory (str): Directory of the recording.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._segments = {}
+        self.index = np.fromfile(os.path.join(directory, INDEX_FILE), dtype=INDEX_DTYPE)
+        self._positions = {int(frame): position for position, frame in enumerate(self.index["frame"])}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, frame):
+        return frame in self._positions
+
+    @property
+    def frames(self):
+        """numpy.ndarray: the frame numbers in recording order."""
+        return self.index["frame"]
+
+    def _segment(self, number):
+        segment = self._segments.get(number)
+        if segment is None:
+            with open(os.path.join(self.directory, SEGMENT_FILE % number), "rb") as f:
+                segment = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._segments[number] = segment
+        return segment
+
+    def read(self, position):
+        """Parts of the record at a position of the index (recording order).
+
+        Args:
+            position (int): Position in the index.
+
+        Returns:
+            list: the message parts (memoryviews of the mapped segment).
+        """
+        _, segment, n_parts, offset = self.index[position]
+        buf = memoryview(self._segment(int(segment)))
+        offset = int(offset)
+        _, recorded_parts = _RECORD.unpack_from(buf, offset)
+        position = offset + _RECORD.size
+        sizes = struct.unpack_from("<%dQ" % recorded_parts, buf, position)
+        position += _SIZE.size * recorded_parts
+        parts = []
+        for size in sizes:
+            parts.append(buf[position:position + size])
+            position += size
+        return parts
+
+    def __getitem__(self, frame):
+        """Parts of a recorded frame (memoryviews of the mapped segment).
+
+        Raises:
+            KeyError: The frame was not recorded.
+        """
+        return self.read(self._positions[frame])
+
+    def __iter__(self):
+        """Yields (frame number, parts) in recording order."""
+        for position, frame in enumerate(self.index["frame"]):
+            yield int(frame), self.read(position)
+
+    def close(self):
+        """Unmaps the segments (the parts returned must not be used anymore)."""
+        for segment in self._segments.values():
+            try:
+                segment.close()
+            except BufferError:
+                # a part is still referenced, released with it
+                pass
+        self._segments = {}
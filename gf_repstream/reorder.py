@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+import heapq
+import time
+from collections import deque
+
+
+class ReorderBuffer:
+    """Bounded buffer that releases the received frames in frame number order.
+
+    The first frame (and the first one after a restart) is released right
+    away and sets the next expected frame number, the following frames are
+    held until the next expected frame number arrives. A frame is given up
+    as missing (gap) when a later frame has waited for longer than
+    ``max_delay`` or when the buffer holds ``max_size`` frames, so both
+    the added latency and the memory are bounded. Frames that arrive after
+    their number was released or given up are dropped as late, unless they
+    are more than ``max_size`` frames back: the numbering restarted (new
+    acquisition, or it wrapped), the held frames are released and the
+    frames are ordered from the new numbering on.
+
+    Only one thread at a time must use the buffer.
+
+    Args:
+        max_delay (float, optional): Maximum time in seconds a frame waits for the
+            missing frames before it. Defaults to 0.05.
+        max_size (int, optional): Maximum number of frames held. Defaults to 1000.
+        max_gaps (int, optional): Number of most recent gaps kept for the report.
+            Defaults to 100.
+    """
+
+    def __init__(self, max_delay=0.05, max_size=1000, max_gaps=100):
+        self._max_delay = max_delay
+        self._max_size = max_size
+        # (frame number, arrival order, frame)
+        self._heap = []
+        # (arrival time, frame number) of the held frames, in arrival order
+        self._waiting = deque()
+        self._arrivals = 0
+        self._next = None
+        self.released = 0
+        self.reordered = 0
+        self.late = 0
+        self.restarts = 0
+        self.duplicates = 0
+        self.gaps = 0
+        self.missing = 0
+        self.recent_gaps = deque(maxlen=max_gaps)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def reset(self):
+        self._heap.clear()
+        self._waiting.clear()
+        self._next = None
+
+    def add(self, data):
+        """Adds a received frame.
+
+        Args:
+            data (Frame): The envelope of the received message.
+
+        Returns:
+            list: the frames released in order (possibly empty).
+        """
+        frame = data.frame
+        released = []
+        if self._next is not None and frame < self._next:
+            if self._next - frame <= self._max_size:
+                self.late += 1
+                return []
+            # new acquisition, the frames of the previous one are released first
+            released = self.flush(force=True)
+            self._waiting.clear()
+            self._next = None
+            self.restarts += 1
+        if self._heap and frame < self._heap[0][0]:
+            self.reordered += 1
+        heapq.heappush(self._heap, (frame, self._arrivals, data))
+        self._waiting.append((time.monotonic(), frame))
+        self._arrivals += 1
+        return released + self.flush()
+
+    def flush(self, force=False):
+        """Releases the frames in order, giving up the missing frames that
+        held them back for too long.
+
+        Args:
+            force (bool, optional): Releases all the held frames, giving up
+                the missing ones. Defaults to False.
+
+        Returns:
+            list: the released frames (possibly empty).
+        """
+        released = []
+        heap = self._heap
+        now = None
+        while heap:
+            frame = heap[0][0]
+            if self._next is not None and frame < self._next:
+                # a duplicate of a frame already released
+                heapq.heappop(heap)
+                self.duplicates += 1
+                continue
+            if self._next is not None and frame != self._next:
+                if not force and len(heap) <= self._max_size:
+                    if now is None:
+                        now = time.monotonic()
+                    # the frame that waited the longest is not always the first one
+                    self._forget_released()
+                    if now - self._waiting[0][0] <= self._max_delay:
+                        break
+                self._gap(self._next, frame - 1)
+            released.append(heapq.heappop(heap)[2])
+            self._next = frame + 1
+        if released:
+            self.released += len(released)
+            self._forget_released()
+        return released
+
+    def _forget_released(self):
+        waiting = self._waiting
+        while waiting and self._next is not None and waiting[0][1] < self._next:
+            waiting.popleft()
+
+    def _gap(self, first, last):
+        self.gaps += 1
+        self.missing += last - first + 1
+        self.recent_gaps.append([first, last])
+
+    def get_stats(self):
+        """Statistics of the reorder buffer.
+
+        Returns:
+            dict: held, released, reordered, late and duplicated frames, restarts
+                of the numbering, and the number of gaps and of missing frames.
+        """
+        return {
+            "held": len(self._heap),
+            "next_frame": self._next,
+            "released": self.released,
+            "reordered": self.reordered,
+            "late": self.late,
+            "restarts": self.restarts,
+            "duplicates": self.duplicates,
+            "gaps": self.gaps,
+            "missing_frames": self.missing,
+        }
+
+    def get_gaps(self):
+        """list: the most recent gaps, as [first, last] missing frame numbers."""
+        return list(self.recent_gaps)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+import time
+
+import zmq
+
+from shm_ring import FrameRing
+
+
+class ShmReader:
+    """Client of an output stream with the shared memory transport, for
+    consumers on the same host as the repeater.
+
+    The frames are read in place from the ring of the output stream; the
+    socket of the output stream (PUB) only wakes the reader up when new
+    frames are published, so nothing goes through the network stack. Each
+    reader of an output stream uses its own index (0 to readers - 1 of the
+    output configuration) and starts from the newest frame. A reader that
+    falls behind makes the output stream drop frames, for all its readers.
+
+    Example:
+        with ShmReader("gf_repstream_preview", "ipc:///tmp/preview") as reader:
+            while True:
+                header, payload = reader.recv_multipart()
+
+    Args:
+        name (str): Name of the shared memory ring (``name`` of the ``shm`` key
+            of the output stream, gf_repstream_<output name> by default).
+        address (str): Address of the output stream socket, e.g. 'tcp://localhost:9610'.
+        reader (int, optional): Index of the reader. Defaults to 0.
+        io_threads (int, optional): The size of the zmq thread pool. Defaults to 1.
+
+    Raises:
+        FileNotFoundError: The output stream is not running.
+        ValueError: The reader index is out of range or already in use.
+    """
+
+    def __init__(self, name, address, reader=0, io_threads=1):
+        self._ring = FrameRing.attach(name, track=False)
+        try:
+            self._ring.attach_reader(reader)
+        except ValueError:
+            self._ring.detach()
+            raise
+        self._reader = reader
+        self._context = zmq.Context(io_threads=io_threads)
+        self._socket = self._context.socket(zmq.SUB)
+        # only the latest notification matters, the frames are in the ring
+        self._socket.setsockopt(zmq.CONFLATE, 1)
+        self._socket.setsockopt_string(zmq.SUBSCRIBE, u"")
+        self._socket.connect(address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def closed(self):
+        """bool: True if the output stream was stopped."""
+        return self._ring.closed
+
+    def recv(self, timeout=None):
+        """Next frame of the output stream, read in place.
+
+        Args:
+            timeout (float, optional): Maximum time in seconds to wait. Defaults
+                to None (until a frame arrives or the output stream stops).
+
+        Returns:
+            RingSlot: the frame (parts as memoryviews), to be given back with
+                release. None if no frame arrived in time or the output stream
+                was stopped.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            slot = self._ring.get(self._reader)
+            if slot is not None or self._ring.closed:
+                return slot
+            # wakes up at least every 100 ms to notice a stopped output stream
+            wait = 100 if deadline is None else min(100, max(0, int(1000 * (deadline - time.monotonic()))))
+            if self._socket.poll(wait):
+                self._socket.recv(zmq.NOBLOCK)
+            elif deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def release(self, slot):
+        """Gives back a frame returned by recv (its parts must not be used anymore).
+
+        Args:
+            slot (RingSlot): The frame.
+        """
+        self._ring.release(self._reader, slot)
+
+    def recv_multipart(self, timeout=None):
+        """Next frame of the output stream, copied out of the ring.
+
+        Args:
+            timeout (float, optional): Maximum time in seconds to wait. Defaults
+                to None (until a frame arrives or the output stream stops).
+
+        Returns:
+            list: the message parts (bytes), None if no frame arrived in time or
+                the output stream was stopped.
+        """
+        slot = self.recv(timeout)
+        if slot is None:
+            return None
+        parts = [bytes(part) for part in slot.parts]
+        self.release(slot)
+        return parts
+
+    def close(self):
+        """Detaches the reader, the output stream does not wait for it anymore."""
+        if self._ring is None:
+            return
+        if not self._ring.closed:
+            self._ring.detach_reader(self._reader)
+        self._ring.detach()
+        self._ring = None
+        self._context.destroy(linger=0)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+# control block: layout, write sequence, closed flag and the read sequence of every consumer
+_LAYOUT = struct.Struct("<QQQ")  # n_slots, slot_size, n_consumers
+_LAYOUT_OFFSET = 0
+_WRITE_SEQ_OFFSET = 64
+_CLOSED_OFFSET = 72
+_READ_SEQ_OFFSET = 128
+MAX_CONSUMERS = 64
+_CONTROL_SIZE = _READ_SEQ_OFFSET + 8 * MAX_CONSUMERS
+# slot header: sequence, frame number, target mask, number of parts, size of each part
+MAX_PARTS = 16
+_SLOT_HEADER = struct.Struct("<QqQI%dI" % MAX_PARTS)
+_SLOT_HEADER_SIZE = 128
+_U64 = struct.Struct("<Q")
+
+# sends the slot to all the consumers
+ALL_CONSUMERS = (1 << 64) - 1
+# read sequence of a consumer that is not attached, ignored by the producer
+DETACHED = (1 << 64) - 1
+# names of the rings created by this process, tracked by its resource tracker
+_created = set()
+
+
+class RingSlot:
+    """One frame read from the ring, valid until the consumer releases it.
+
+    Attributes:
+        seq (int): Sequence number of the slot.
+        frame (int): Frame number.
+        mask (int): Bit mask of the targets of the frame.
+        parts (list): memoryviews of the message parts in the shared memory.
+    """
+
+    __slots__ = ("seq", "frame", "mask", "parts")
+
+    def __init__(self, seq, frame, mask, parts):
+        self.seq = seq
+        self.frame = frame
+        self.mask = mask
+        self.parts = parts
+
+    @property
+    def nbytes(self):
+        return sum(len(part) for part in self.parts)
+
+
+class FrameRing:
+    """Ring of frame slots in POSIX shared memory, one producer and a fixed
+    number of consumers, each reading every slot at its own pace.
+
+    The producer copies the parts of a message once into the next slot and
+    publishes it by advancing the write sequence; the consumers read the
+    parts in place (memoryviews, no copy, no pickling) and advance their
+    own read sequence when they are done with the slot. The producer never
+    overwrites a slot that one of the consumers has not released yet: when
+    the ring is full it either waits or drops the new frame.
+
+    Consumers can also come and go (e.g. local clients of an output
+    stream): a detached consumer does not hold the producer back, and it
+    starts from the newest frame when it attaches.
+
+    The sequences are 8 byte aligned words written by a single process
+    each, which is enough for the ordering on x86-64.
+
+    Args:
+        shm (SharedMemory): The shared memory block.
+        owner (bool, optional): The ring was created by this process, which
+            unlinks it. Defaults to False.
+    """
+
+    def __init__(self, shm, owner=False):
+        self._shm = shm
+        self._buf = shm.buf
+        self._owner = owner
+        self.n_slots, self.slot_size, self.n_consumers = _LAYOUT.unpack_from(self._buf, _LAYOUT_OFFSET)
+        self._read_seqs = range(self.n_consumers)
+
+    @classmethod
+    def create(cls, n_slots, slot_size, n_consumers, name=None, attached=True, replace=False):
+        """Creates a new ring.
+
+        Args:
+            n_slots (int): Number of frame slots.
+            slot_size (int): Maximum size in bytes of the message of one frame.
+            n_consumers (int): Number of consumers.
+            name (str, optional): Name of the shared memory block. Defaults to
+                None (random name).
+            attached (bool, optional): The consumers are attached from the
+                start, otherwise each of them calls attach_reader. Defaults to True.
+            replace (bool, optional): Removes an existing shared memory block
+                with the same name. Defaults to False.
+
+        Returns:
+            FrameRing: the ring (owner).
+        """
+        if not 0 < n_consumers <= MAX_CONSUMERS:
+            raise ValueError(f"The number of consumers must be between 1 and {MAX_CONSUMERS}.")
+        size = _CONTROL_SIZE + n_slots * (_SLOT_HEADER_SIZE + slot_size)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            if not replace:
+                raise
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _created.add(shm._name)
+        _LAYOUT.pack_into(shm.buf, _LAYOUT_OFFSET, n_slots, slot_size, n_consumers)
+        if not attached:
+            for consumer in range(n_consumers):
+                _U64.pack_into(shm.buf, _READ_SEQ_OFFSET + 8 * consumer, DETACHED)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name, track=True):
+        """Attaches to an existing ring.
+
+        Args:
+            name (str): Name of the shared memory block.
+            track (bool, optional): False for processes that are not children of
+                the creator, so that their resource tracker does not remove the
+                ring when they exit. Defaults to True.
+
+        Returns:
+            FrameRing: the ring.
+        """
+        shm = shared_memory.SharedMemory(name=name)
+        if not track and shm._name not in _created:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def write_seq(self):
+        """int: number of slots published so far."""
+        return _U64.unpack_from(self._buf, _WRITE_SEQ_OFFSET)[0]
+
+    @property
+    def closed(self):
+        return bool(_U64.unpack_from(self._buf, _CLOSED_OFFSET)[0])
+
+    def read_seq(self, consumer):
+        """int: sequence of the next slot of a consumer."""
+        return _U64.unpack_from(self._buf, _READ_SEQ_OFFSET + 8 * consumer)[0]
+
+    def _slot_offset(self, seq):
+        return _CONTROL_SIZE + (seq % self.n_slots) * (_SLOT_HEADER_SIZE + self.slot_size)
+
+    def full(self):
+        """bool: True if the slowest consumer would be overrun by a new frame."""
+        oldest = min((self.read_seq(consumer) for consumer in self._read_seqs), default=DETACHED)
+        return oldest != DETACHED and self.write_seq - oldest >= self.n_slots
+
+    def put(self, parts, frame, mask=ALL_CONSUMERS, block=True, timeout=None, poll_interval=0.0002):
+        """Copies a message into the next slot and publishes it.
+
+        Args:
+            parts (list): Message parts (bytes like objects).
+            frame (int): Frame number.
+            mask (int, optional): Bit mask of the targets. Defaults to all.
+            block (bool, optional): Waits for the slowest consumer when the ring
+                is full, otherwise the frame is dropped. Defaults to True.
+            timeout (float, optional): Maximum time in seconds to wait. Defaults
+                to None (until there is room or the ring is closed).
+            poll_interval (float, optional): Sleep time between two checks of a
+                full ring. Defaults to 0.2 ms.
+
+        Returns:
+            bool: True if the frame was published, False if it was dropped.
+
+        Raises:
+            ValueError: The message does not fit in a slot.
+        """
+        sizes = [len(part) if not isinstance(part, memoryview) else part.nbytes for part in parts]
+        if len(sizes) > MAX_PARTS or sum(sizes) > self.slot_size:
+            raise ValueError(f"Message of {sum(sizes)} bytes in {len(sizes)} parts does not fit "
+                             f"in a slot ({self.slot_size} bytes, {MAX_PARTS} parts).")
+        if self.full():
+            if not block:
+                return False
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self.full():
+                if self.closed or (deadline is not None and time.monotonic() > deadline):
+                    return False
+                time.sleep(poll_interval)
+        seq = self.write_seq
+        offset = self._slot_offset(seq)
+        position = offset + _SLOT_HEADER_SIZE
+        for part, size in zip(parts, sizes):
+            self._buf[position:position + size] = part
+            position += size
+        _SLOT_HEADER.pack_into(self._buf, offset, seq, frame, mask, len(sizes),
+                               *(sizes + [0] * (MAX_PARTS - len(sizes))))
+        _U64.pack_into(self._buf, _WRITE_SEQ_OFFSET, seq + 1)
+        return True
+
+    def get(self, consumer):
+        """Next slot of a consumer, without waiting.
+
+        Args:
+            consumer (int): Index of the consumer.
+
+        Returns:
+            RingSlot: the slot, None if there is no new frame.
+        """
+        seq = self.read_seq(consumer)
+        if seq >= self.write_seq:
+            return None
+        offset = self._slot_offset(seq)
+        header = _SLOT_HEADER.unpack_from(self._buf, offset)
+        if header[0] != seq:
+            # overwritten while the consumer was attaching, restarts from the newest frame
+            self.skip_to_latest(consumer)
+            return None
+        n_parts = header[3]
+        parts = []
+        position = offset + _SLOT_HEADER_SIZE
+        for size in header[4:4 + n_parts]:
+            parts.append(self._buf[position:position + size])
+            position += size
+        return RingSlot(seq, header[1], header[2], parts)
+
+    def wait(self, consumer, timeout=None, poll_interval=0.00005, max_poll_interval=0.002):
+        """Next slot of a consumer, waiting for it.
+
+        The sleep between two checks doubles while the ring stays empty, so
+        idle consumers cost little CPU and busy ones react quickly.
+
+        Args:
+            consumer (int): Index of the consumer.
+            timeout (float, optional): Maximum time in seconds to wait. Defaults
+                to None (until a frame arrives or the ring is closed).
+            poll_interval (float, optional): First sleep time between two checks.
+                Defaults to 50 us.
+            max_poll_interval (float, optional): Longest sleep time between two
+                checks. Defaults to 2 ms.
+
+        Returns:
+            RingSlot: the slot, None if no frame arrived in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            slot = self.get(consumer)
+            if slot is not None or self.closed:
+                return slot
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            time.sleep(poll_interval)
+            poll_interval = min(2 * poll_interval, max_poll_interval)
+
+    def release(self, consumer, slot):
+        """Gives back a slot read by a consumer (its parts must not be used anymore).
+
+        Args:
+            consumer (int): Index of the consumer.
+            slot (RingSlot): The slot returned by get or wait.
+        """
+        for part in slot.parts:
+            part.release()
+        slot.parts = []
+        _U64.pack_into(self._buf, _READ_SEQ_OFFSET + 8 * consumer, slot.seq + 1)
+
+    def skip_to_latest(self, consumer):
+        """Moves a consumer to the newest frame (e.g. a reader that connects late)."""
+        _U64.pack_into(self._buf, _READ_SEQ_OFFSET + 8 * consumer, self.write_seq)
+
+    def attach_reader(self, consumer):
+        """Attaches a consumer, which starts reading from the newest frame.
+
+        Args:
+            consumer (int): Index of the consumer.
+
+        Raises:
+            ValueError: The consumer index is out of range or already attached.
+        """
+        if not 0 <= consumer < self.n_consumers:
+            raise ValueError(f"Reader {consumer} out of range (ring of {self.n_consumers} readers).")
+        if self.read_seq(consumer) != DETACHED:
+            raise ValueError(f"Reader {consumer} is already attached.")
+        self.skip_to_latest(consumer)
+
+    def detach_reader(self, consumer):
+        """Detaches a consumer, the producer does not wait for it anymore.
+
+        Args:
+            consumer (int): Index of the consumer.
+        """
+        _U64.pack_into(self._buf, _READ_SEQ_OFFSET + 8 * consumer, DETACHED)
+
+    def attached_readers(self):
+        """int: number of attached consumers."""
+        return sum(self.read_seq(consumer) != DETACHED for consumer in self._read_seqs)
+
+    def close(self):
+        """Marks the ring as closed, nothing waits on it anymore."""
+        _U64.pack_into(self._buf, _CLOSED_OFFSET, 1)
+
+    def detach(self):
+        """Releases the shared memory of this process (unlinks it if owner)."""
+        self._buf.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+            _created.discard(self._shm._name)
@@ -1,42 +1,75 @@
 #!/usr/bin/env python
-import json
 import logging
 import time
 import zmq
-import sys
-import json
 from systemd import journal
 
+from frame import INGRESS_TIME, RECV_START, RECEIVED, DECODED, DISPATCHED
+from frame_queue import BLOCK
+from histogram import LatencyHistogram
+from pipeline import Pipeline
+from recorder import FrameRecorder, RECORD_DEFAULTS
+from shm_ring import FrameRing
 from utils import valid_writer_config
+from writer_header import WriterHeader
 
 _logger = logging.getLogger("RestStreamRepeater")
 
+# stages of the path of a frame through the repeater
+STAGES = ["recv", "decode", "dispatch", "enqueue", "queue", "send", "total"]
+# shared memory transport defaults (name defaults to gf_repstream_<output name>)
+SHM_DEFAULTS = {"slots": 8, "slot_size": 16 * 2**20, "readers": 1}
+
 class Streamer:
     def __init__(
         self,
         name,
-        deque,
+        queue,
         sentinel,
         port,
         zmq_mode,
         io_threads,
         writer_config,
         idle_time=1,
+        zero_copy=False,
+        metrics=True,
+        inject_timestamp=False,
+        address=None,
+        shm=None,
+        pipeline=None,
+        record=None,
     ):
         """Initialize a streamer thread.
 
         Args:
             name: name of the streamer thread
-            deque: shared deque from which the data will be fetched.
+            queue: shared FrameQueue from which the data will be fetched.
             sentinel: Flag object to halt execution.
             port: Port that will be used for this thread's stream
             zmq_mode: Zmq socket mode of this thread's stream (PUB, PULL)
             io_threads: Number of threads that will be used.
             writer_config: Dictionary that contains the writer configuration parameters.
-            idle_time: idle time to wait when the queue is empty
+            idle_time: maximum time to block on an empty queue before checking the sentinel
+            zero_copy: sends the payload without copying it (the same buffer is shared by all the outputs)
+            metrics: counts the sent bytes (the frame counters are always kept)
+            inject_timestamp: adds the ingress time of the frames to the sent headers (needs the receiver timestamps)
+            address: address to bind instead of tcp://*:port (e.g. ipc:// for consumers on the same host)
+            shm: shared memory transport for consumers on the same host, dictionary with name, slots,
+                slot_size and readers (all optional): the frames are written to a ring in shared
+                memory and only their sequence number is published on the socket (always PUB)
+            pipeline: processing stages of the frames sent by the output stream (e.g. transform and
+                compression), dictionary with stages, workers, pool and max_in_flight (see Pipeline)
+            record: writes the frames to local disk instead of sending them, dictionary with directory,
+                segment_size and sync (see FrameRecorder); the frame numbers are published on the
+                socket (always PUB, inproc:// without port and address)
         """
         self._name = name
-        self._deque = deque
+        self._queue = queue
+        # enqueue-to-send latency, always recorded
+        self._latency = LatencyHistogram()
+        # latency of each stage, recorded for the frames stamped by the receiver
+        self._stage_latency = {stage: LatencyHistogram() for stage in STAGES}
+        self._inject_timestamp = inject_timestamp
         self._idle_time = idle_time
         self._last_sent_frame = -1
         self._counter = 0
@@ -45,69 +78,330 @@ class Streamer:
         self._io_threads = io_threads
         self._port = port
         self._zmq_mode = zmq_mode
+        self._address = address
+        self._shm = None
+        if shm:
+            self._shm = dict(SHM_DEFAULTS, name=f"gf_repstream_{name}")
+            self._shm.update(shm if isinstance(shm, dict) else {})
+        self._ring = None
+        self._record = None if not record else dict(RECORD_DEFAULTS, **record)
+        self._recorder = None
+        self._pipeline = None if not pipeline else Pipeline(pipeline)
+        # the frames are processed concurrently and sent in order (None: in the streamer thread)
+        self._pool = None if self._pipeline is None else self._pipeline.create_pool(f"gf_repstream-{name}")
         self._writer_config = writer_config
+        self._writer_header = None
+        self._copy = not zero_copy
+        self._metrics = metrics
+        # written only by the thread sending this output stream
+        self.bytes_sent = 0
+        self.dropped_readers = 0
+        self.dropped_record = 0
+        self.dropped_processing = 0
         _logger.debug(
             f"RepStream.Streamer with: io_threads {self._io_threads} and port {self._port} (zmq mode {self._zmq_mode})"
         )
 
-    
+    def _get_writer_header(self):
+        # prepared on the first frame, the writer config is constant for the run
+        if self._writer_header is None:
+            self._writer_header = WriterHeader(self._writer_config)
+        return self._writer_header
 
-    def add_writer_header(self, metadata):
-        metadata["image_attributes"]["image_number"] = self._counter
-        metadata["frame"] = self._counter
-        metadata["output_file"] = self._writer_config["output_file"]
-        metadata["run_id"] = self._writer_config["run_id"]
-        metadata["user_id"] = self._writer_config["user_id"]
-        metadata["n_images"] = self._writer_config["n_images"]
-        metadata["i_image"] = self._counter
-        metadata["status"] = 0
-        metadata["detector_name"] = self._writer_config["detector_name"]
-        return metadata
+    def add_writer_header(self, header):
+        # the decoded header is shared with the other output streams
+        return self._get_writer_header().metadata(header, self._counter)
 
-    def start(self):
-        """Start the streamer loop.
+    def stop(self):
+        """Closes the queue, so that neither the streamer loop nor a receiver
+        blocked by the backpressure policy keep waiting."""
+        self._queue.close()
+
+    def get_stats(self):
+        """Statistics of the output stream.
+
+        Returns:
+            dict: sent and dropped frames (queue full, too old frames or
+                memory budget exceeded), bytes in flight,
+                backpressure policy, queue depth and the p50/p99
+                enqueue-to-send latency (ms) of the sent frames.
+        """
+        stats = {
+            "sent": self._counter,
+            "bytes_sent": self.bytes_sent,
+            "dropped": self._queue.dropped + self.dropped_readers + self.dropped_processing + self.dropped_record,
+            "dropped_full": self._queue.dropped_full,
+            "dropped_stale": self._queue.dropped_stale,
+            "dropped_budget": self._queue.dropped_budget,
+            "bytes_in_flight": self._queue.bytes_in_flight,
+            "policy": self._queue.policy,
+            "queue_depth": len(self._queue),
+            "latency_p50_ms": None,
+            "latency_p99_ms": None,
+        }
+        if self._pipeline is not None:
+            stats["dropped_processing"] = self.dropped_processing
+            stats["pipeline_in_flight"] = 0 if self._pool is None else len(self._pool)
+            stats["stages"] = self._pipeline.get_stats()
+        if self._shm is not None:
+            stats["dropped_readers"] = self.dropped_readers
+            stats["shm_readers"] = 0 if self._ring is None else self._ring.attached_readers()
+        if self._record is not None:
+            stats["dropped_record"] = self.dropped_record
+            stats["record_directory"] = self._record["directory"]
+            recorder = self._recorder
+            stats["record_bytes"] = 0 if recorder is None else recorder.bytes_written
+            stats["record_segments"] = 0 if recorder is None else recorder.segments
+        if self._latency.count:
+            stats["latency_p50_ms"] = self._latency.percentile(50) / 1e6
+            stats["latency_p99_ms"] = self._latency.percentile(99) / 1e6
+        return stats
+
+    def get_latency(self):
+        """Latency histograms of the output stream.
+
+        Returns:
+            dict: summary of the enqueue-to-send latency and of each stage
+                (recv, decode, dispatch, enqueue, queue, send and total from
+                the start of the recv) of the frames stamped by the receiver.
+        """
+        latency = {"enqueue_to_send": self._latency.get_stats()}
+        for stage, histogram in self._stage_latency.items():
+            latency[stage] = histogram.get_stats()
+        return latency
+
+    def _record_latency(self, data, enqueue_time, dequeue_time):
+        sent_time = time.perf_counter()
+        self._latency.record_seconds(sent_time - enqueue_time)
+        timestamps = data.timestamps
+        if timestamps is None:
+            return
+        stages = self._stage_latency
+        stages["recv"].record_seconds(timestamps[RECEIVED] - timestamps[RECV_START])
+        stages["decode"].record_seconds(timestamps[DECODED] - timestamps[RECEIVED])
+        stages["dispatch"].record_seconds(timestamps[DISPATCHED] - timestamps[DECODED])
+        stages["enqueue"].record_seconds(enqueue_time - timestamps[DISPATCHED])
+        stages["queue"].record_seconds(dequeue_time - enqueue_time)
+        stages["send"].record_seconds(sent_time - dequeue_time)
+        stages["total"].record_seconds(sent_time - timestamps[RECV_START])
+
+    def bind(self, zmq_context):
+        """Prepares the zmq socket that sends out this output stream.
 
         Args:
-            io_threads (int): The size of the zmq thread pool to handle I/O operations.
-            address (str): The address string, e.g. 'tcp://127.0.0.1:9001'.
+            zmq_context (zmq.Context): Context in which the socket is created.
 
+        Returns:
+            zmq.Socket: the bound socket.
         """
-        _logger.debug(
-            f"RepStream.Streamer {self._name} starting to stream... "
-        )
+        address = self._address or "tcp://*:"+(str(self._port))
 
-        address = "tcp://*:"+(str(self._port))
-        
         # prepares the zmq socket to send out data PUB/SUB (bind)
-        self._sentinel.clear()
-        zmq_context = zmq.Context(io_threads=self._io_threads)
-        zmq_socket = zmq_context.socket(self._zmq_mode)
+        if self._record is not None:
+            # the frames go to disk, the socket only notifies the recorded frame numbers
+            if self._address is None and self._port is None:
+                address = f"inproc://gf_repstream-record-{self._name}"
+            self._recorder = FrameRecorder(self._record["directory"], self._record["segment_size"],
+                                           self._record["sync"])
+            zmq_socket = zmq_context.socket(zmq.PUB)
+        elif self._shm is not None:
+            # the frames go to the shared memory ring (replacing one left over by a repeater
+            # that did not stop cleanly), the socket only notifies the readers
+            self._ring = FrameRing.create(self._shm["slots"], self._shm["slot_size"], self._shm["readers"],
+                                          name=self._shm["name"], attached=False, replace=True)
+            zmq_socket = zmq_context.socket(zmq.PUB)
+        else:
+            zmq_socket = zmq_context.socket(self._zmq_mode)
         zmq_socket.setsockopt(zmq.LINGER, -1)
         try:
             zmq_socket.bind(address)
         except zmq.error.ZMQError:
             _logger.debug(f"RepStream.Streamer socket can't bind to address. {self._name} ")
             pass
-        counter = 0
+        return zmq_socket
+
+    def close(self):
+        """Removes the shared memory ring, stops the worker pool and closes the recording of the output
+        stream (if any)."""
+        if self._pool is not None:
+            # the frames still in the pool are not sent, their memory budget is released
+            for _, _, queued in self._pool.close():
+                self._queue.done(queued)
+        if self._recorder is not None:
+            # kept for the statistics
+            self._recorder.close()
+        if self._ring is not None:
+            self._ring.close()
+            self._ring.detach()
+            self._ring = None
+
+    def ready(self):
+        """bool: False if queuing a new frame would block the receiver."""
+        return not (self._queue.policy == BLOCK and self._queue.full())
+
+    def pending(self):
+        """bool: True if there are frames waiting to be sent."""
+        if self._pool is not None:
+            # the frames being processed are sent once the oldest one is done
+            return self._pool.ready() or (bool(self._queue) and not self._pool.full())
+        return bool(self._queue)
+
+    def fileno(self):
+        """int: file descriptor readable when the worker pool is done with a frame, None without pool."""
+        return None if self._pool is None else self._pool.fileno()
+
+    def clear_notifications(self):
+        """Empties the file descriptor returned by fileno."""
+        self._pool.clear()
+
+    def _drop(self, queued, err):
+        _logger.error(f"RepStream.Streamer {self._name} frame {queued.frame} skipped: {err}")
+        self._queue.done(queued)
+        self._pipeline.record_error(err)
+        self.dropped_processing += 1
+
+    def send(self, zmq_socket, entry):
+        """Sends one queued frame.
+
+        Args:
+            zmq_socket (zmq.Socket): Socket returned by bind.
+            entry (tuple): (enqueue time, Frame) as returned by the queue.
+        """
+        enqueue_time, queued = entry
+        dequeue_time = time.perf_counter()
+        processed = (queued, ())
+        if self._pipeline is not None:
+            try:
+                processed = self._pipeline.run(queued)
+            except Exception as err:
+                # a frame that can't be processed must not stop the output stream
+                self._drop(queued, err)
+                return
+        self._send(zmq_socket, queued, processed, enqueue_time, dequeue_time)
+
+    def _submit(self, entry):
+        enqueue_time, queued = entry
+        self._pool.submit(queued, (enqueue_time, time.perf_counter(), queued))
+
+    def _send_processed(self, zmq_socket):
+        (enqueue_time, dequeue_time, queued), processed, err = self._pool.pop()
+        if err is not None:
+            self._drop(queued, err)
+            return
+        self._send(zmq_socket, queued, processed, enqueue_time, dequeue_time)
+
+    def _send(self, zmq_socket, queued, processed, enqueue_time, dequeue_time):
+        data, timings = processed
+        if self._pipeline is not None:
+            # the frames processed in a worker process come back without timestamps
+            data.timestamps = queued.timestamps
+            self._pipeline.record(timings)
+        inject = self._inject_timestamp and data.timestamps is not None
+        # FIXME: adjusts to test the std-det-writer
+        if self._name == "std-det-writer":
+            header = self._get_writer_header().render(
+                data, self._counter, data.timestamps[INGRESS_TIME] if inject else None)
+            parts = [header, data.parts[1]]
+        elif inject:
+            parts = [data.header_with_ingress_time()] + data.parts[1:]
+        else:
+            #_logger.debug(f"{self._name} send frame {data.frame}")
+            parts = data.parts
+        if self._recorder is not None:
+            recorded = self._write(zmq_socket, parts, data.frame)
+            self._queue.done(queued)
+            if not recorded:
+                return
+        elif self._ring is not None:
+            published = self._publish(zmq_socket, parts, data.frame)
+            self._queue.done(queued)
+            if not published:
+                return
+        else:
+            zmq_socket.send_multipart(parts, copy=self._copy)
+            self._queue.done(queued)
+        if self._metrics:
+            self.bytes_sent += data.nbytes
+        self._record_latency(data, enqueue_time, dequeue_time)
+        self._counter += 1
+
+    def _publish(self, zmq_socket, parts, frame):
+        # never waits for the readers: a slow or vanished reader only loses frames
+        try:
+            published = self._ring.put(parts, frame, block=False)
+        except ValueError as err:
+            _logger.error(f"RepStream.Streamer {self._name} frame {frame} skipped: {err}")
+            published = False
+        if not published:
+            self.dropped_readers += 1
+            return False
+        zmq_socket.send(b"%d" % frame)
+        return True
+
+    def _write(self, zmq_socket, parts, frame):
+        # a frame that can't be written (too large, disk full) must not stop the output stream
+        try:
+            self._recorder.write(parts, frame)
+        except (ValueError, OSError) as err:
+            _logger.error(f"RepStream.Streamer {self._name} frame {frame} not recorded: {err}")
+            self.dropped_record += 1
+            return False
+        zmq_socket.send(b"%d" % frame)
+        return True
+
+    def send_next(self, zmq_socket):
+        """Sends the oldest queued frame without waiting for it.
+
+        Args:
+            zmq_socket (zmq.Socket): Socket returned by bind.
+
+        Returns:
+            bool: True if a frame was sent.
+        """
+        if self._pool is not None:
+            # keeps the workers busy, the frames are sent in order
+            while not self._pool.full():
+                entry = self._queue.get_nowait()
+                if entry is None:
+                    break
+                self._submit(entry)
+            if not self._pool.ready():
+                return False
+            self._send_processed(zmq_socket)
+            return True
+        entry = self._queue.get_nowait()
+        if entry is None:
+            return False
+        self.send(zmq_socket, entry)
+        return True
+
+    def _step_pool(self, zmq_socket):
+        # waits for a new frame only when the workers have nothing to do
+        entry = self._queue.get(timeout=self._idle_time) if not len(self._pool) else self._queue.get_nowait()
+        while entry is not None:
+            self._submit(entry)
+            if self._pool.full():
+                break
+            entry = self._queue.get_nowait()
+        if self._pool.wait(self._idle_time):
+            self._send_processed(zmq_socket)
+
+    def start(self):
+        """Start the streamer loop."""
+        _logger.debug(
+            f"RepStream.Streamer {self._name} starting to stream... "
+        )
+
+        self._sentinel.clear()
+        zmq_context = zmq.Context(io_threads=self._io_threads)
+        zmq_socket = self.bind(zmq_context)
         while not self._sentinel.is_set():
-            if self._deque:
-                data = self._deque.popleft()
-                # FIXME: adjusts to test the std-det-writer
-                if self._name == "std-det-writer":
-                    zmq_socket.send_json(
-                        self.add_writer_header(json.loads(data[0].decode())),
-                        flags=zmq.SNDMORE,
-                    )
-                    zmq_socket.send(data[1], flags=0)
-                else:
-                    #_logger.debug(f"{self._name} sent {counter}")
-                    img_frame = json.loads(data[0].decode())["frame"]
-                    #_logger.debug(f"{self._name} send frame {img_frame}")
-                    counter += 1
-                    zmq_socket.send_multipart(data)
-                self._counter += 1
-            else:
-                # nothing to stream
-                time.sleep(self._idle_time)
+            if self._pool is not None:
+                self._step_pool(zmq_socket)
+                continue
+            entry = self._queue.get(timeout=self._idle_time)
+            if entry is not None:
+                self.send(zmq_socket, entry)
         zmq_socket.close()
+        self.close()
         _logger.debug(f"RepStream.Streamer {self._name} closing thread...")
@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from os.path import abspath, dirname, join
+
+# the repstream modules are imported the same way cli.py and app.py do
+sys.path.insert(0, join(dirname(abspath(__file__)), ".."))
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from dispatch import periodic_rule
+
+# results compared by compare: (key, True if higher is better)
+COMPARED = [
+    ("throughput_fps", True),
+    ("throughput_mb_per_s", True),
+    ("latency_p99_ms", False),
+    ("cpu_us_per_frame", False),
+    ("max_rss_mb", False),
+    ("dropped", False),
+]
+# frame_block of the repeater (see SRepeater)
+FRAME_BLOCK = 15
+# time a consumer waits for its first frame (output processes of the processes engine start slowly)
+START_TIMEOUT = 30.0
+
+
+def scenario_key(scenario):
+    """str: identifies a scenario between runs."""
+    return (f"{scenario['width']}x{scenario['height']} fps={scenario['fps'] or 'max'} "
+            f"outputs={scenario['n_outputs']} {scenario['mode']}:{json.dumps(scenario['param'])} "
+            f"slow={scenario['slow']}x{scenario['slow_ms']}ms {scenario['transport']} {scenario['engine']}")
+
+
+def output_pattern(mode, param):
+    """tuple: (period, width) of an output mode, None if it depends on the time."""
+    return periodic_rule(mode, param, FRAME_BLOCK) if isinstance(param, int) else None
+
+
+def expected_frames(mode, param, n_frames):
+    """Number of frames an output stream must send, None if it depends on the time."""
+    rule = output_pattern(mode, param)
+    if rule is None:
+        return None
+    period, width = rule
+    return sum(1 for frame in range(n_frames) if frame % period < width)
+
+
+def _addresses(scenario, base_port):
+    if scenario["transport"] == "ipc":
+        prefix = f"ipc:///tmp/gf_repstream_suite_{os.getpid()}"
+        return f"{prefix}_in", [f"{prefix}_{i}" for i in range(scenario["n_outputs"])]
+    return (f"tcp://localhost:{base_port}",
+            [f"tcp://localhost:{base_port + 1 + i}" for i in range(scenario["n_outputs"])])
+
+
+def _run_source(address, shape, n_frames, fps, results):
+    # replay process: synthesized frames at the scenario rate
+    import zmq
+    from replay_stream import Replay, synthesize
+
+    context = zmq.Context()
+    socket = context.socket(zmq.PUSH)
+    socket.bind(address.replace("localhost", "*"))
+    time.sleep(0.5)
+    stats = Replay(synthesize(shape)).run(socket, n_frames, fps=fps or None)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    stats["cpu_s"] = usage.ru_utime + usage.ru_stime
+    socket.close(linger=-1)
+    context.term()
+    results.put(stats)
+
+
+def _run_consumers(addresses, expected, pattern, slow_s, drain_s, ready, results):
+    # consumers process: one thread per output stream, slow ones sleep after every frame
+    import zmq
+    from stream_stats import StreamStats
+
+    context = zmq.Context()
+    outputs = [None] * len(addresses)
+
+    def consume(index):
+        socket = context.socket(zmq.PULL)
+        socket.connect(addresses[index])
+        stats = StreamStats(pattern)
+        received = 0
+        while expected[index] is None or received < expected[index]:
+            if not socket.poll(int((drain_s if received else max(drain_s, START_TIMEOUT)) * 1000)):
+                break
+            stats.add_message(socket.recv_multipart(copy=False))
+            received += 1
+            if slow_s[index]:
+                time.sleep(slow_s[index])
+        socket.close(linger=0)
+        totals = stats.totals()
+        outputs[index] = {
+            "received": received,
+            "expected": expected[index],
+            "missing": None if expected[index] is None else expected[index] - received,
+            "gaps": totals["gaps"],
+            "duplicates": totals["duplicates"],
+            "late": totals["late"],
+            # sustained rate between the first and the last frame
+            "fps": totals["fps"],
+            "mb_per_s": totals["mb_per_s"],
+            "latency_p50_ms": totals["latency_p50_ms"],
+            "latency_p99_ms": totals["latency_p99_ms"],
+            "latency_max_ms": totals["latency_max_ms"],
+            "slow": bool(slow_s[index]),
+        }
+
+    threads = [threading.Thread(target=consume, args=(i,)) for i in range(len(addresses))]
+    for thread in threads:
+        thread.start()
+    ready.set()
+    for thread in threads:
+        thread.join()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    context.term()
+    results.put({"outputs": outputs, "cpu_s": usage.ru_utime + usage.ru_stime})
+
+
+def run_scenario(scenario, base_port=19800, drain_s=2.0):
+    """Streams a replay source through an in-process repeater to instrumented consumers.
+
+    Args:
+        scenario (dict): width, height (uint16 frames), fps (0 for as fast as
+            possible), n_outputs, mode and param (send_output_mode and
+            send_output_param of every output stream), slow and slow_ms (number
+            of consumers sleeping slow_ms after every frame), transport (tcp or
+            ipc), engine, n_frames and config (additional repeater configuration).
+        base_port (int, optional): First port of the tcp transport. Defaults to 19800.
+        drain_s (float, optional): Time a consumer waits for a frame before it
+            gives up. Defaults to 2 s.
+
+    Returns:
+        dict: the scenario, the source, repeater and per output results and
+            their summary.
+    """
+    from cli import SRepeater
+
+    in_address, out_addresses = _addresses(scenario, base_port)
+    n_outputs = scenario["n_outputs"]
+    # the processes engine has no timestamps (latency) nor memory budget
+    timed = scenario["engine"] != "processes"
+    config = {
+        "in-stream": {"name": "in", "zmq_mode": "PULL", "address": in_address},
+        "out-streams": {
+            f"out{i}": {
+                "zmq_mode": "PUSH",
+                "address": out_addresses[i].replace("localhost", "*"),
+                "send_output_mode": scenario["mode"],
+                "send_output_param": scenario["param"],
+                # the consumers measure the latency from the ingress time
+                "inject_timestamp": timed,
+            }
+            for i in range(n_outputs)
+        },
+        "engine": scenario["engine"],
+        "timestamps": timed,
+    }
+    config.update(scenario.get("config", {}))
+    if not timed:
+        config.pop("memory_budget", None)
+    with tempfile.TemporaryDirectory() as tmp:
+        config_file = join(tmp, "repstream_config.json")
+        with open(config_file, "w") as f:
+            json.dump(config, f)
+        repeater = SRepeater(config_file=config_file)
+    repeater.start()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    ready = context.Event()
+    expected = [expected_frames(scenario["mode"], scenario["param"], scenario["n_frames"])] * n_outputs
+    slow_s = [scenario["slow_ms"] / 1e3 if i < scenario["slow"] else 0 for i in range(n_outputs)]
+    consumers = context.Process(target=_run_consumers,
+                                args=(out_addresses, expected, output_pattern(scenario["mode"], scenario["param"]),
+                                      slow_s, drain_s, ready, results))
+    consumers.start()
+    ready.wait()
+    start_usage = resource.getrusage(resource.RUSAGE_SELF)
+    start_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    source = context.Process(target=_run_source,
+                             args=(in_address, [scenario["height"], scenario["width"]],
+                                   scenario["n_frames"], scenario["fps"], results))
+    source.start()
+    collected = [results.get(), results.get()]
+    source.join()
+    consumers.join()
+    source_stats = next(result for result in collected if "outputs" not in result)
+    consumer_stats = next(result for result in collected if "outputs" in result)
+    stats = repeater.get_stats()
+    repeater.stop()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # the source and the consumers are children too, the processes engine as well
+    cpu = (usage.ru_utime + usage.ru_stime - start_usage.ru_utime - start_usage.ru_stime
+           + children.ru_utime + children.ru_stime - start_children.ru_utime - start_children.ru_stime
+           - source_stats["cpu_s"] - consumer_stats["cpu_s"])
+    received = (stats.get("input") or {}).get("frames_received") or scenario["n_frames"]
+
+    outputs = {}
+    for i, output in enumerate(consumer_stats["outputs"]):
+        name = f"out{i}"
+        repeater_output = stats["outputs"].get(name, {})
+        output["dropped"] = repeater_output.get("dropped")
+        output["repeater_latency_p99_ms"] = repeater_output.get("latency_p99_ms")
+        outputs[name] = output
+    fast = [output for output in outputs.values() if not output["slow"]] or list(outputs.values())
+    result = {
+        "key": scenario_key(scenario),
+        "scenario": scenario,
+        "source": source_stats,
+        "repeater": {
+            "frames_received": received,
+            "cpu_s": cpu,
+            "max_rss_mb": usage.ru_maxrss / 1024,
+        },
+        "outputs": outputs,
+        "summary": {
+            # the slowest of the output streams with fast consumers
+            "throughput_fps": min((output["fps"] or 0) for output in fast),
+            "throughput_mb_per_s": min((output["mb_per_s"] or 0) for output in fast),
+            # None without ingress times (processes engine)
+            "latency_p99_ms": max((output["latency_p99_ms"] for output in fast
+                                   if output["latency_p99_ms"] is not None), default=None),
+            "cpu_us_per_frame": 1e6 * cpu / received,
+            "max_rss_mb": usage.ru_maxrss / 1024,
+            "dropped": sum(output["dropped"] or 0 for output in outputs.values()),
+            "missing": sum(output["missing"] or 0 for output in outputs.values()),
+        },
+    }
+    return result
+
+
+def sweep(arguments):
+    """list: the scenarios of the cartesian product of the swept parameters."""
+    scenarios = []
+    for size, fps, n_outputs, mode, slow, transport in itertools.product(
+            arguments.sizes, arguments.rates, arguments.outputs, arguments.modes, arguments.slow,
+            arguments.transports):
+        width, height = (int(value) for value in size.split("x"))
+        mode, param = mode.split(":", 1)
+        scenarios.append({
+            "width": width, "height": height, "fps": fps, "n_outputs": n_outputs,
+            "mode": mode, "param": json.loads(param), "slow": min(slow, n_outputs), "slow_ms": arguments.slow_ms,
+            "transport": transport, "engine": arguments.engine, "n_frames": arguments.n_frames,
+            "config": json.loads(arguments.config),
+        })
+    return scenarios
+
+
+def run(arguments):
+    """Runs every scenario of the sweep in its own process (own peak RSS) and writes the results."""
+    results = []
+    for scenario in sweep(arguments):
+        output = subprocess.check_output(
+            [sys.executable, abspath(__file__), "scenario", json.dumps(scenario),
+             "--port", str(arguments.port), "--drain", str(arguments.drain)])
+        result = json.loads(output.decode().splitlines()[-1])
+        summary = result["summary"]
+        # no latency without timestamps (processes engine)
+        p99 = "     n/a" if summary["latency_p99_ms"] is None else f"{summary['latency_p99_ms']:8.2f}"
+        print(f"{result['key']:<84} {summary['throughput_fps']:9.1f} fps {summary['throughput_mb_per_s']:8.1f} MB/s "
+              f"p99 {p99} ms {summary['cpu_us_per_frame']:8.0f} us cpu "
+              f"{summary['max_rss_mb']:7.0f} MB dropped {summary['dropped']}", flush=True)
+        results.append(result)
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "arguments": vars(arguments),
+        },
+        "results": results,
+    }
+    del report["meta"]["arguments"]["func"]
+    with open(arguments.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"results written to {arguments.output}")
+
+
+def compare(arguments):
+    """Compares the summaries of two result files, exits with 1 on regressions."""
+    with open(arguments.baseline) as f:
+        baseline = {result["key"]: result["summary"] for result in json.load(f)["results"]}
+    with open(arguments.current) as f:
+        current = {result["key"]: result["summary"] for result in json.load(f)["results"]}
+    regressions = 0
+    for key in baseline:
+        if key not in current:
+            print(f"{key}: missing in {arguments.current}")
+            continue
+        changes = []
+        for metric, higher_is_better in COMPARED:
+            before, after = baseline[key].get(metric), current[key].get(metric)
+            if not before and not after:
+                continue
+            if before is None or after is None:
+                # e.g. no latency without timestamps, nothing to compare
+                changes.append(f"{metric} {before} -> {after} (not compared)")
+                continue
+            change = (after - before) / before if before else float("inf")
+            worse = change < -arguments.threshold if higher_is_better else change > arguments.threshold
+            # a few frames more or less is noise for the drop counts
+            if metric == "dropped" and abs(after - before) <= arguments.drop_tolerance:
+                worse = False
+            regressions += worse
+            changes.append(f"{metric} {before:.4g} -> {after:.4g} ({100 * change:+.0f}%){' REGRESSION' if worse else ''}")
+        print(f"{key}\n    " + "\n    ".join(changes))
+    print(f"{regressions} regressions (threshold {100 * arguments.threshold:.0f}%)")
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end throughput and latency benchmark of the repeater")
+    subparsers = parser.add_subparsers(required=True)
+
+    suite = subparsers.add_parser("run", help=run.__doc__)
+    suite.add_argument("-o", "--output", default="bench_results.json", type=str, help="Result file (json)")
+    suite.add_argument("--sizes", default=["256x256", "2016x1200"], nargs="+",
+                       help="Frame sizes (WIDTHxHEIGHT, uint16)")
+    suite.add_argument("--rates", default=[0, 100], type=float, nargs="+",
+                       help="Input frame rates, 0 for as fast as possible")
+    suite.add_argument("--outputs", default=[1, 4], type=int, nargs="+", help="Numbers of output streams")
+    suite.add_argument("--modes", default=["send_every_nth:1", "strides:5"], nargs="+",
+                       help="send_output_mode:send_output_param of the output streams")
+    suite.add_argument("--slow", default=[0, 1], type=int, nargs="+", help="Numbers of slow consumers")
+    suite.add_argument("--slow-ms", default=10.0, type=float, help="Processing time of a slow consumer per frame")
+    suite.add_argument("--transports", default=["tcp"], nargs="+", help="tcp and/or ipc")
+    suite.add_argument("--engine", default="threaded", type=str, help="Repeater engine")
+    suite.add_argument("-n", "--n-frames", default=300, type=int, help="Frames per scenario")
+    suite.add_argument("--config", default='{"memory_budget": 268435456}', type=str,
+                       help="Additional repeater configuration (json)")
+    suite.add_argument("--port", default=19800, type=int, help="First port of the tcp transport")
+    suite.add_argument("--drain", default=2.0, type=float, help="Seconds a consumer waits for a frame")
+    suite.set_defaults(func=run)
+
+    scenario = subparsers.add_parser("scenario", help="Runs one scenario (json) and prints its result")
+    scenario.add_argument("scenario", type=str)
+    scenario.add_argument("--port", default=19800, type=int)
+    scenario.add_argument("--drain", default=2.0, type=float)
+    scenario.set_defaults(func=lambda arguments: print(json.dumps(
+        run_scenario(json.loads(arguments.scenario), arguments.port, arguments.drain))))
+
+    comparison = subparsers.add_parser("compare", help=compare.__doc__)
+    comparison.add_argument("baseline", type=str, help="Result file of the reference run")
+    comparison.add_argument("current", type=str, help="Result file of the run to check")
+    comparison.add_argument("-t", "--threshold", default=0.1, type=float, help="Relative change flagged (0.1 = 10%%)")
+    comparison.add_argument("--drop-tolerance", default=5, type=int, help="Dropped frames difference ignored")
+    comparison.set_defaults(func=compare)
+
+    arguments = parser.parse_args()
+    arguments.func(arguments)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,786 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from os.path import join
+
+# the repstream modules are imported the same way cli.py and app.py do
+sys.path.insert(0, join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from frame import Frame
+from frame_queue import FrameQueue
+
+TEST_DATA = join(os.path.dirname(os.path.abspath(__file__)), "test_data")
+
+
+def load_header(index=0):
+    """Reads the raw header of one of the recorded test data files."""
+    with open(join(TEST_DATA, sorted(os.listdir(TEST_DATA))[index]), "rb") as f:
+        return f.read()
+
+
+def make_parts(raw_header, frame, payload):
+    header = raw_header.replace(b'"frame":7766800', b'"frame":%d' % frame)
+    return [header, payload]
+
+
+def report(name, n_frames, elapsed):
+    print(f"{name:>24}: {n_frames / elapsed:12.0f} frames/s per core "
+          f"({elapsed / n_frames * 1e6:.2f} us/frame)")
+
+
+def bench_envelope(arguments):
+    """Header handling cost of the receiver and of every output stream,
+    decoding per output (before) versus the shared frame envelope (after)."""
+    raw_header = load_header()
+    payload = bytes(16)
+    messages = [make_parts(raw_header, i, payload) for i in range(arguments.n_frames)]
+    n_outputs = arguments.n_outputs
+
+    start = time.process_time()
+    for data in messages:
+        image_frame = json.loads(data[0].decode())["frame"]
+        for _ in range(n_outputs):
+            if image_frame % 1 == 0:
+                json.loads(data[0].decode())["frame"]
+                data[1]
+    report("decode per output", len(messages), time.process_time() - start)
+
+    start = time.process_time()
+    for data in messages:
+        envelope = Frame.from_parts(data)
+        for _ in range(n_outputs):
+            if envelope.frame % 1 == 0:
+                envelope.parts[1]
+    report("shared frame envelope", len(messages), time.process_time() - start)
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    p50 = latencies[int(0.50 * (len(latencies) - 1))]
+    p99 = latencies[int(0.99 * (len(latencies) - 1))]
+    return 1e3 * p50, 1e3 * p99
+
+
+def bench_wakeup(arguments):
+    """Enqueue-to-dequeue latency of frames arriving after a lull, sleep
+    polling of a deque (before) versus the FrameQueue (after)."""
+    n_frames, interval = arguments.n_frames, arguments.interval
+
+    def produce(put):
+        for _ in range(n_frames):
+            time.sleep(interval)
+            put((time.perf_counter(), None))
+
+    def run(name, put, get):
+        latencies = []
+        producer = threading.Thread(target=produce, args=(put,))
+        producer.start()
+        cpu = time.process_time()
+        while len(latencies) < n_frames:
+            entry = get()
+            if entry is not None:
+                latencies.append(time.perf_counter() - entry[0])
+        cpu = time.process_time() - cpu
+        producer.join()
+        p50, p99 = percentiles(latencies)
+        print(f"{name:>24}: p50 {p50:9.3f} ms  p99 {p99:9.3f} ms  cpu {cpu:6.2f} s")
+
+    legacy = deque(maxlen=arguments.n_frames)
+
+    def legacy_get():
+        if legacy:
+            return legacy.popleft()
+        time.sleep(arguments.idle_time)
+
+    run(f"sleep polling ({arguments.idle_time} s)", legacy.append, legacy_get)
+    queue = FrameQueue(maxlen=n_frames)
+    run("FrameQueue blocking", queue.put, lambda: queue.get(timeout=1)[1])
+    queue = FrameQueue(maxlen=n_frames, spin_time=2 * interval)
+    run("FrameQueue spin+block", queue.put, lambda: queue.get(timeout=1)[1])
+
+
+def write_config(path, n_outputs, in_port, out_port, in_stream={}, **config):
+    """Writes a repstream config file with n PUSH outputs forwarding every frame."""
+    config.update({
+        "in-stream": dict(name="in_backend", zmq_mode="PULL",
+                          address=f"tcp://localhost:{in_port}", **in_stream),
+        "out-streams": {
+            f"out{i}": {
+                "zmq_mode": "PUSH",
+                "port": out_port + i,
+                "send_output_mode": "send_every_nth",
+                "send_output_param": 1,
+            }
+            for i in range(n_outputs)
+        },
+    })
+    with open(path, "w") as f:
+        json.dump(config, f)
+
+
+def run_repeater(arguments):
+    """Streams frames through an in-process repeater and prints the results as json."""
+    import zmq
+    from cli import SRepeater
+
+    frame_size = 2 * arguments.width * arguments.height
+    with tempfile.TemporaryDirectory() as tmp:
+        config_file = join(tmp, "repstream_config.json")
+        write_config(config_file, arguments.n_outputs, arguments.port, arguments.port + 1,
+                     **json.loads(arguments.config))
+        repeater = SRepeater(config_file=config_file)
+    repeater.start()
+
+    context = zmq.Context()
+    received = [0] * arguments.n_outputs
+
+    def consume(idx):
+        socket = context.socket(zmq.PULL)
+        socket.connect(f"tcp://localhost:{arguments.port + 1 + idx}")
+        while received[idx] < arguments.n_frames:
+            socket.recv_multipart(copy=False)
+            received[idx] += 1
+        socket.close()
+
+    consumers = [threading.Thread(target=consume, args=(i,), daemon=True)
+                 for i in range(arguments.n_outputs)]
+    for consumer in consumers:
+        consumer.start()
+    source = context.socket(zmq.PUSH)
+    source.bind(f"tcp://*:{arguments.port}")
+    time.sleep(1)
+
+    payload = bytes(frame_size)
+    header = load_header()
+    start = time.perf_counter()
+    cpu = time.process_time()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    for i in range(arguments.n_frames):
+        source.send_multipart([make_parts(header, i, b"")[0], payload], copy=False)
+    for consumer in consumers:
+        consumer.join()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    repeater.stop()
+    # the processes engine runs in child processes, accounted once they have exited
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu += usage.ru_utime + usage.ru_stime - children.ru_utime - children.ru_stime
+    print(json.dumps({
+        "fps": arguments.n_frames / elapsed,
+        "cpu_us_per_frame": 1e6 * cpu / arguments.n_frames,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def spawn_repeater(arguments, n_outputs=None, **config):
+    """Runs run_repeater in a new process, so that each run has its own peak RSS."""
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "repeater",
+         "-n", str(arguments.n_frames),
+         "-o", str(n_outputs or arguments.n_outputs),
+         "--width", str(arguments.width), "--height", str(arguments.height),
+         "--port", str(arguments.port), "--config", json.dumps(config)])
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def bench_zerocopy(arguments):
+    """Peak RSS and frame rate of the repeater forwarding detector sized
+    frames, copying the payloads (before) versus zero copy (after)."""
+    frame_size = 2 * arguments.width * arguments.height
+    results = {}
+    for mode in ("copy", "zero-copy"):
+        results[mode] = spawn_repeater(arguments, in_stream={"zero_copy": mode == "zero-copy"})
+        print(f"{mode:>24}: {results[mode]['fps']:8.1f} frames/s  "
+              f"peak RSS {results[mode]['max_rss_mb']:8.1f} MB")
+    # one copy on receive plus one copy per output stream
+    copied = (arguments.n_outputs + 1) * frame_size * results["zero-copy"]["fps"]
+    print(f"{'memcpy saved':>24}: {copied / 1e9:8.2f} GB/s "
+          f"({arguments.n_outputs + 1} x {frame_size / 1e6:.1f} MB per frame)")
+
+
+def bench_engines(arguments):
+    """Frame rate and CPU time per frame of the thread per output engine
+    versus the single threaded reactor engine."""
+    for n_outputs in arguments.outputs:
+        for engine in ("threaded", "reactor"):
+            result = spawn_repeater(arguments, n_outputs=n_outputs, engine=engine)
+            print(f"{engine:>10} {n_outputs:3d} outputs: {result['fps']:10.1f} frames/s  "
+                  f"{result['cpu_us_per_frame']:8.1f} us cpu/frame")
+
+
+def bench_processes(arguments):
+    """Frame rate and CPU time per frame of the thread per output engine
+    versus the multi-process engine (shared memory ring of frames)."""
+    for n_outputs in arguments.outputs:
+        for engine in ("threaded", "processes"):
+            result = spawn_repeater(arguments, n_outputs=n_outputs, engine=engine)
+            print(f"{engine:>10} {n_outputs:3d} outputs: {result['fps']:10.1f} frames/s  "
+                  f"{result['cpu_us_per_frame']:8.1f} us cpu/frame")
+
+
+def bench_transport(arguments):
+    """Frame rate and CPU time per frame (sender and local consumer) of one
+    output stream over tcp loopback, ipc and the shared memory transport."""
+    import zmq
+    from shm_reader import ShmReader
+    from streamer import Streamer
+
+    payload = bytes(2 * arguments.width * arguments.height)
+    raw_header = load_header()
+    ipc_address = f"ipc:///tmp/gf_repstream_bench_{os.getpid()}"
+    shm = {"name": f"gf_repstream_bench_{os.getpid()}", "slots": 8, "slot_size": len(payload) + 4096}
+    transports = {
+        "tcp": (f"tcp://127.0.0.1:{arguments.port}", None),
+        "ipc": (ipc_address, None),
+        "shm": (ipc_address, shm),
+    }
+    for transport, (address, shm_config) in transports.items():
+        streamer = Streamer(name="bench", queue=FrameQueue(maxlen=1), sentinel=None, port=None, zmq_mode=zmq.PUSH,
+                            io_threads=1, writer_config={}, address=address, shm=shm_config)
+        context = zmq.Context()
+        out_socket = streamer.bind(context)
+        received = [0]
+        if shm_config is not None:
+            reader = ShmReader(shm_config["name"], address)
+
+            def consume():
+                while received[0] < arguments.n_frames:
+                    reader.release(reader.recv())
+                    received[0] += 1
+        else:
+            in_socket = context.socket(zmq.PULL)
+            in_socket.connect(address)
+
+            def consume():
+                while received[0] < arguments.n_frames:
+                    in_socket.recv_multipart(copy=False)
+                    received[0] += 1
+        consumer = threading.Thread(target=consume, daemon=True)
+        consumer.start()
+        time.sleep(0.5)
+        start = time.perf_counter()
+        cpu = time.process_time()
+        for frame in range(arguments.n_frames):
+            # at most as many frames in flight as ring slots, whatever the transport
+            while frame - received[0] >= shm["slots"]:
+                time.sleep(0.0001)
+            data = Frame(make_parts(raw_header, frame, payload), frame)
+            streamer.send(out_socket, (time.perf_counter(), data))
+        consumer.join()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        print(f"{transport:>6}: {arguments.n_frames / elapsed:10.1f} frames/s  "
+              f"{1e6 * cpu / arguments.n_frames:10.1f} us cpu/frame")
+        if shm_config is not None:
+            reader.close()
+        streamer.close()
+        context.destroy(linger=0)
+
+
+# transforms of the transform benchmark, e.g. for 512x512 live views
+TRANSFORMS = [
+    {"roi": [0, 512, 0, 512]},
+    {"binning": 4},
+    {"binning": 4, "bin_mode": "mean", "dtype": "uint8", "shift": 4},
+    {"roi": [0, 1024, 0, 1024], "binning": 2, "bin_mode": "mean"},
+]
+
+
+def bench_transform(arguments):
+    """CPU time per frame and size reduction of the per output stream
+    ROI crop, binning and dtype downcast of detector sized frames."""
+    import numpy as np
+    from transform import FrameTransform
+
+    image = np.random.default_rng(0).integers(0, 4096, (arguments.height, arguments.width), dtype=np.uint16)
+    header = json.loads(load_header())
+    header.update(shape=[arguments.height, arguments.width], type="uint16")
+    data = Frame([json.dumps(header).encode(), image.tobytes()], header["frame"])
+    for config in TRANSFORMS:
+        transform = FrameTransform(config)
+        best = None
+        for _ in range(arguments.repeat):
+            start = time.process_time()
+            for _ in range(arguments.n_frames):
+                transformed = transform.apply(data)
+            elapsed = time.process_time() - start
+            best = elapsed if best is None or elapsed < best else best
+        print(f"{json.dumps(config):<64}: {1e3 * best / arguments.n_frames:7.2f} ms/frame  "
+              f"{data.nbytes / transformed.nbytes:6.1f}x smaller")
+
+
+def bench_compression(arguments):
+    """Compression ratio and throughput of the output stream codecs, in the
+    calling thread and with the worker pool of the output streams."""
+    import numpy as np
+    from compression import CODECS, Compressor, codec_available
+    from workers import OrderedPool
+
+    # the test data has the headers only, the payloads are detector like
+    # frames of their shape and type: photon counts over a dark offset
+    header = json.loads(load_header())
+    shape, dtype = header["shape"], np.dtype(header["type"])
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(arguments.distinct):
+        image = (arguments.offset + rng.poisson(arguments.counts, shape)).astype(dtype)
+        frames.append(Frame([json.dumps(dict(header, frame=i)).encode(), image.tobytes()], i))
+    size = frames[0].nbytes
+    for codec in CODECS:
+        if not codec_available(codec):
+            print(f"{codec:>16}: not installed")
+            continue
+        compressor = Compressor({"codec": codec, "level": arguments.level})
+        compressed = sum(len(compressor.apply(data).parts[1]) for data in frames)
+        ratio = sum(len(data.parts[1]) for data in frames) / compressed
+        results = []
+        for workers in [0] + arguments.workers:
+            pool = None if not workers else OrderedPool(compressor.apply, workers)
+            start = time.perf_counter()
+            for i in range(arguments.n_frames):
+                data = frames[i % len(frames)]
+                if pool is None:
+                    compressor.apply(data)
+                    continue
+                if pool.full():
+                    pool.wait()
+                    pool.pop()
+                pool.submit(data)
+            while pool is not None and len(pool):
+                pool.wait()
+                pool.pop()
+            elapsed = time.perf_counter() - start
+            if pool is not None:
+                pool.close()
+            results.append(f"{workers} workers {arguments.n_frames * size / elapsed / 2**20:7.0f} MB/s")
+        print(f"{codec:>16}: ratio {ratio:5.2f}  " + "  ".join(results))
+
+
+# pipeline of the pipeline benchmark: live view of a detector stream
+PIPELINE_STAGES = [
+    {"type": "transform", "name": "bin", "binning": 2, "bin_mode": "mean"},
+    {"type": "compression", "name": "bslz4", "codec": "bitshuffle-lz4"},
+]
+
+
+def bench_pipeline(arguments):
+    """Frame rate of an output stream pipeline (2x2 binning and
+    bitshuffle-lz4) in the sending thread and on thread and process pools,
+    with the time per frame of every stage."""
+    import numpy as np
+    from pipeline import Pipeline
+
+    header = json.loads(load_header())
+    shape, dtype = header["shape"], np.dtype(header["type"])
+    rng = np.random.default_rng(0)
+    frames = [Frame([json.dumps(dict(header, frame=i)).encode(),
+                     (100 + rng.poisson(2.0, shape)).astype(dtype).tobytes()], i) for i in range(8)]
+    for pool, workers in [("thread", 0)] + [(pool, workers) for pool in ["thread", "process"]
+                                             for workers in arguments.workers]:
+        pipeline = Pipeline({"stages": PIPELINE_STAGES, "workers": workers, "pool": pool})
+        workers_pool = pipeline.create_pool("bench")
+        if workers_pool is not None:
+            # starts the workers (processes are spawned on demand)
+            for data in frames[:workers]:
+                workers_pool.submit(data)
+            while len(workers_pool):
+                workers_pool.wait()
+                workers_pool.pop()
+        start = time.perf_counter()
+        for i in range(arguments.n_frames):
+            data = frames[i % len(frames)]
+            if workers_pool is None:
+                pipeline.record(pipeline.run(data)[1])
+                continue
+            if workers_pool.full():
+                workers_pool.wait()
+                pipeline.record(workers_pool.pop()[1][1])
+            workers_pool.submit(data)
+        while workers_pool is not None and len(workers_pool):
+            workers_pool.wait()
+            pipeline.record(workers_pool.pop()[1][1])
+        elapsed = time.perf_counter() - start
+        if workers_pool is not None:
+            workers_pool.close()
+        label = "inline" if not workers else f"{pool} pool x{workers}"
+        stages = "  ".join(f"{name} {stats['mean_ms']:6.2f} ms" for name, stats in pipeline.get_stats().items())
+        print(f"{label:>16}: {arguments.n_frames / elapsed:8.1f} frames/s  {stages}")
+
+
+def bench_record(arguments):
+    """Write throughput of the recording output stream and random access
+    time by frame number of the recording."""
+    import random
+    from recorder import FrameRecorder, RecordReader
+
+    raw_header = load_header()
+    payload = os.urandom(arguments.width * arguments.height * 2)
+    directory = tempfile.mkdtemp(prefix="gf_repstream_record_", dir=arguments.directory)
+    try:
+        recorder = FrameRecorder(directory, segment_size=arguments.segment_size, sync=arguments.sync)
+        start = time.perf_counter()
+        for i in range(arguments.n_frames):
+            recorder.write(make_parts(raw_header, i, payload), i)
+        recorder.close()
+        elapsed = time.perf_counter() - start
+        print(f"{'write':>12}: {arguments.n_frames / elapsed:10.0f} frames/s  "
+              f"{recorder.bytes_written / elapsed / 2**20:8.0f} MB/s  ({recorder.segments} segments"
+              f"{', synced' if arguments.sync else ''})")
+        with RecordReader(directory) as recording:
+            frames = [random.randrange(arguments.n_frames) for _ in range(arguments.lookups)]
+            start = time.perf_counter()
+            for frame in frames:
+                recording[frame]
+            elapsed = time.perf_counter() - start
+            print(f"{'lookup':>12}: {elapsed / len(frames) * 1e6:10.2f} us/frame (random frame numbers)")
+            start = time.perf_counter()
+            size = sum(len(parts[1]) for _, parts in recording)
+            elapsed = time.perf_counter() - start
+            print(f"{'scan':>12}: {len(recording) / elapsed:10.0f} frames/s (in place, {size / 2**20:.0f} MB)")
+    finally:
+        for name in os.listdir(directory):
+            os.remove(join(directory, name))
+        os.rmdir(directory)
+
+
+class LoopbackSocket:
+    """Stands in for the zmq sockets to time the repeater hot loop alone."""
+
+    def __init__(self, messages=()):
+        self._messages = iter(messages)
+
+    def recv_multipart(self, flags=0, copy=True):
+        return list(next(self._messages))
+
+    def send_multipart(self, parts, flags=0, copy=True):
+        pass
+
+
+def bench_metrics(arguments):
+    """CPU time per frame of the receive, dispatch and send steps with the
+    data plane counters enabled and disabled."""
+    from receiver import Receiver
+    from streamer import Streamer
+
+    payload = bytes(arguments.payload_size)
+    raw_header = load_header()
+    messages = [make_parts(raw_header, i, payload) for i in range(arguments.n_frames)]
+    best = {False: None, True: None}
+    for _ in range(arguments.repeat):
+        for metrics in (False, True):
+            queues = [FrameQueue(maxlen=arguments.n_frames) for _ in range(arguments.n_outputs)]
+            receiver = Receiver(tuples_list=[(queue, ("send_every_nth", 1)) for queue in queues],
+                                sentinel=threading.Event(), zmq_mode="PULL", frame_block=15,
+                                metrics=metrics)
+            streamers = [Streamer(name=f"out{i}", queue=queue, sentinel=None, port=None,
+                                  zmq_mode=None, io_threads=1, writer_config={}, metrics=metrics)
+                         for i, queue in enumerate(queues)]
+            receiver.reset()
+            in_socket, out_socket = LoopbackSocket(messages), LoopbackSocket()
+            start = time.process_time()
+            for _ in messages:
+                receiver.dispatch(receiver.receive(in_socket))
+                for streamer in streamers:
+                    streamer.send_next(out_socket)
+            elapsed = time.process_time() - start
+            if best[metrics] is None or elapsed < best[metrics]:
+                best[metrics] = elapsed
+    report("metrics off", len(messages), best[False])
+    report("metrics on", len(messages), best[True])
+
+
+# output modes of the dispatch benchmark, assigned round robin to the outputs
+DISPATCH_MODES = [("send_every_nth", 1), ("send_every_nth", 5), ("strides", 3),
+                  ("send_every_nth_frame", 10)]
+
+
+class LegacyDispatch:
+    """Per frame string matching of the output modes, as the receiver did
+    before the dispatch schedule (deterministic modes only)."""
+
+    def __init__(self, tuples_list, frame_block):
+        self._streamer_tuples = tuples_list
+        self._frame_block = frame_block
+        self._send_flag = [False] * len(tuples_list)
+        self._frame_counter = 0
+        self._stride_counter = 0
+
+    def targets(self, data):
+        image_frame = data.frame
+        send_flag = self._send_flag
+        targets = []
+        for idx, stream in enumerate(self._streamer_tuples):
+            stream_mode = stream[1][0]
+            stream_param = stream[1][1]
+            if stream_mode == "send_every_nth":
+                if image_frame % stream_param == 0:
+                    targets.append(stream[0])
+            elif stream_mode == "strides":
+                if send_flag[idx]:
+                    self._stride_counter += 1
+                    if self._stride_counter <= stream_param:
+                        targets.append(stream[0])
+                    elif self._stride_counter == 2 * stream_param:
+                        send_flag[idx] = False
+                else:
+                    if image_frame % stream_param == 0:
+                        send_flag[idx] = True
+                        self._stride_counter = 1
+                        targets.append(stream[0])
+            elif stream_mode == "send_every_nth_frame":
+                if send_flag[idx]:
+                    self._frame_counter += 1
+                    targets.append(stream[0])
+                    if self._frame_counter == self._frame_block:
+                        send_flag[idx] = False
+                        self._frame_counter = 0
+                else:
+                    if image_frame % stream_param == 0:
+                        send_flag[idx] = True
+                        self._frame_counter = 1
+                        targets.append(stream[0])
+        return targets
+
+
+def bench_dispatch(arguments):
+    """Cost of choosing the output streams of a frame versus the number of
+    outputs: per frame string matching versus the precompiled schedule."""
+    from dispatch import DispatchSchedule
+
+    raw_header = load_header()
+    frames = [Frame.from_parts(make_parts(raw_header, i, b"")) for i in range(arguments.n_frames)]
+    for n_outputs in arguments.outputs:
+        tuples_list = [(f"out{i}", DISPATCH_MODES[i % len(DISPATCH_MODES)]) for i in range(n_outputs)]
+        for name, schedule in (("string matching", LegacyDispatch(tuples_list, 15)),
+                               ("schedule", DispatchSchedule(tuples_list, 15))):
+            targets = schedule.targets
+            start = time.perf_counter()
+            for data in frames:
+                targets(data)
+            report(f"{name} {n_outputs:3d} outputs", len(frames), time.perf_counter() - start)
+
+
+WRITER_CONFIG = {"output_file": "/tmp/gf_repstream_benchmark.h5", "run_id": 1, "user_id": 0,
+                 "n_images": 100000, "detector_name": "gigafrost"}
+
+
+def legacy_writer_header(header, writer_config, counter):
+    """std-det-writer header as the streamer built it for every frame
+    before the header template (decode, copy, mutate, encode)."""
+    metadata = json.loads(header.decode())
+    metadata["image_attributes"]["image_number"] = counter
+    metadata["frame"] = counter
+    metadata["output_file"] = writer_config["output_file"]
+    metadata["run_id"] = writer_config["run_id"]
+    metadata["user_id"] = writer_config["user_id"]
+    metadata["n_images"] = writer_config["n_images"]
+    metadata["i_image"] = counter
+    metadata["status"] = 0
+    metadata["detector_name"] = writer_config["detector_name"]
+    return json.dumps(metadata).encode()
+
+
+def bench_writer(arguments):
+    """CPU time per frame of the std-det-writer header, decoded and encoded
+    for every frame versus the header template prepared once per run."""
+    from writer_header import WriterHeader
+
+    raw_header = load_header()
+    frames = [Frame.from_parts(make_parts(raw_header, i, b"")) for i in range(arguments.n_frames)]
+    template = WriterHeader(WRITER_CONFIG)
+    # both paths produce the same header
+    for counter, data in enumerate(frames[:100]):
+        expected = json.loads(legacy_writer_header(data.raw_header, WRITER_CONFIG, counter))
+        assert json.loads(template.render(data, counter)) == expected
+    best = {}
+    for _ in range(arguments.repeat):
+        for name, render in (("json", lambda data, counter: legacy_writer_header(
+                                  data.raw_header, WRITER_CONFIG, counter)),
+                             ("template", template.render)):
+            start = time.process_time()
+            for counter, data in enumerate(frames):
+                render(data, counter)
+            elapsed = time.process_time() - start
+            best[name] = min(best.get(name, elapsed), elapsed)
+    for name, elapsed in best.items():
+        report(f"writer header {name}", len(frames), elapsed)
+
+
+def bench_gfheader(arguments):
+    """Decoding rate of GigaFRoST packet headers: ctypes and dict per packet
+    versus the structured dtype decoding whole batches into columns (the
+    round trip of the encoder and the decoders is tested by test_protocol.py)."""
+    import numpy as np
+    from protocol import GF_HEADER_SIZE, GFHeader, decode_headers, encode_headers
+
+    n = arguments.n_packets
+    rng = np.random.default_rng(0)
+    # the packets of consecutive frames, 64 packets of 2 rows per frame
+    packets = np.arange(n)
+    raw = encode_headers({"protocol_id": 0xCB, "scan_id": 1, "frame_number": packets // 64,
+                          "starting_row": packets % 64 * 2,
+                          "timestamp": rng.integers(0, 2**40, n, dtype=np.uint64)}).tobytes()
+
+    def per_packet():
+        view = memoryview(raw)
+        for i in range(0, len(raw), GF_HEADER_SIZE):
+            GFHeader.from_buffer_copy(view[i:i + GF_HEADER_SIZE]).as_dict()
+
+    def batches():
+        batch = arguments.batch * GF_HEADER_SIZE
+        for i in range(0, len(raw), batch):
+            decode_headers(raw[i:i + batch])
+
+    def assembly_fields():
+        batch = arguments.batch * GF_HEADER_SIZE
+        for i in range(0, len(raw), batch):
+            # the fields used by the udp input
+            for values in decode_headers(raw[i:i + batch], ["frame_number", "starting_row", "scan_id"]).values():
+                values.tolist()
+
+    for name, decode in (("ctypes as_dict", per_packet),
+                         (f"dtype batches of {arguments.batch}", batches),
+                         (f"udp fields, batches of {arguments.batch}", assembly_fields),
+                         ("dtype one batch", lambda: decode_headers(raw))):
+        start = time.process_time()
+        decode()
+        elapsed = time.process_time() - start
+        print(f"{name:>28}: {n / elapsed:14.0f} packets/s per core ({elapsed / n * 1e9:8.1f} ns/packet)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GF repstream micro benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark")
+    subparsers.required = True
+
+    envelope = subparsers.add_parser("envelope", help=bench_envelope.__doc__)
+    envelope.add_argument("-n", "--n-frames", default=100000, type=int,
+                          help="Number of frames to process")
+    envelope.add_argument("-o", "--n-outputs", default=5, type=int,
+                          help="Number of output streams")
+    envelope.set_defaults(func=bench_envelope)
+
+    wakeup = subparsers.add_parser("wakeup", help=bench_wakeup.__doc__)
+    wakeup.add_argument("-n", "--n-frames", default=200, type=int,
+                        help="Number of frames to send")
+    wakeup.add_argument("-i", "--interval", default=0.005, type=float,
+                        help="Time between two frames in seconds")
+    wakeup.add_argument("--idle-time", default=1.0, type=float,
+                        help="Sleep time of the polling streamer in seconds")
+    wakeup.set_defaults(func=bench_wakeup)
+
+    def add_repeater_arguments(subparser, n_frames, n_outputs, width, height):
+        subparser.add_argument("-n", "--n-frames", default=n_frames, type=int,
+                               help="Number of frames to stream")
+        subparser.add_argument("-o", "--n-outputs", default=n_outputs, type=int,
+                               help="Number of output streams")
+        subparser.add_argument("--width", default=width, type=int, help="Frame width (uint16)")
+        subparser.add_argument("--height", default=height, type=int, help="Frame height (uint16)")
+        subparser.add_argument("--port", default=19900, type=int,
+                               help="Input port, the outputs use the following ports")
+
+    repeater = subparsers.add_parser("repeater", help=run_repeater.__doc__)
+    add_repeater_arguments(repeater, 1000, 4, 2016, 2016)
+    repeater.add_argument("--config", default="{}", type=str,
+                          help="Json with extra config file entries")
+    repeater.set_defaults(func=run_repeater)
+
+    zerocopy = subparsers.add_parser("zerocopy", help=bench_zerocopy.__doc__)
+    add_repeater_arguments(zerocopy, 500, 4, 2016, 2016)
+    zerocopy.set_defaults(func=bench_zerocopy)
+
+    metrics = subparsers.add_parser("metrics", help=bench_metrics.__doc__)
+    metrics.add_argument("-n", "--n-frames", default=100000, type=int,
+                         help="Number of frames to process")
+    metrics.add_argument("-o", "--n-outputs", default=5, type=int,
+                         help="Number of output streams")
+    metrics.add_argument("--payload-size", default=1024, type=int,
+                         help="Size of the payload in bytes")
+    metrics.add_argument("-r", "--repeat", default=5, type=int,
+                         help="Number of rounds, the fastest one is reported")
+    metrics.set_defaults(func=bench_metrics)
+
+    engines = subparsers.add_parser("engines", help=bench_engines.__doc__)
+    add_repeater_arguments(engines, 20000, 0, 64, 64)
+    engines.add_argument("--outputs", default=[1, 5, 10, 16], type=int, nargs="+",
+                         help="Numbers of output streams to compare")
+    engines.set_defaults(func=bench_engines)
+
+    processes = subparsers.add_parser("processes", help=bench_processes.__doc__)
+    add_repeater_arguments(processes, 2000, 0, 512, 512)
+    processes.add_argument("--outputs", default=[1, 5, 10, 16], type=int, nargs="+",
+                           help="Numbers of output streams to compare")
+    processes.set_defaults(func=bench_processes)
+
+    transport = subparsers.add_parser("transport", help=bench_transport.__doc__)
+    add_repeater_arguments(transport, 500, 1, 2016, 2016)
+    transport.set_defaults(func=bench_transport)
+
+    transform = subparsers.add_parser("transform", help=bench_transform.__doc__)
+    transform.add_argument("-n", "--n-frames", default=50, type=int, help="Number of frames to process")
+    transform.add_argument("-r", "--repeat", default=3, type=int,
+                           help="Number of rounds, the fastest one is reported")
+    transform.add_argument("--width", default=2016, type=int, help="Frame width (uint16)")
+    transform.add_argument("--height", default=2016, type=int, help="Frame height (uint16)")
+    transform.set_defaults(func=bench_transform)
+
+    compression = subparsers.add_parser("compression", help=bench_compression.__doc__)
+    compression.add_argument("-n", "--n-frames", default=100, type=int, help="Number of frames to compress")
+    compression.add_argument("--distinct", default=8, type=int, help="Number of different frames")
+    compression.add_argument("--counts", default=2.0, type=float, help="Mean photon counts per pixel")
+    compression.add_argument("--offset", default=100, type=int, help="Dark offset of the pixels")
+    compression.add_argument("-l", "--level", default=1, type=int, help="Compression level (zstd)")
+    compression.add_argument("-w", "--workers", default=[2, 4], type=int, nargs="+",
+                             help="Sizes of the worker pool to compare")
+    compression.set_defaults(func=bench_compression)
+
+    pipeline = subparsers.add_parser("pipeline", help=bench_pipeline.__doc__)
+    pipeline.add_argument("-n", "--n-frames", default=100, type=int, help="Number of frames to process")
+    pipeline.add_argument("-w", "--workers", default=[1, 2, 4], type=int, nargs="+",
+                          help="Sizes of the worker pools to compare")
+    pipeline.set_defaults(func=bench_pipeline)
+
+    record = subparsers.add_parser("record", help=bench_record.__doc__)
+    record.add_argument("-n", "--n-frames", default=500, type=int, help="Number of frames to record")
+    record.add_argument("-d", "--directory", default=None, type=str,
+                        help="Directory on the disk to test (default: the temporary directory)")
+    record.add_argument("--segment-size", default=2**30, type=int, help="Size of the segments (bytes)")
+    record.add_argument("--sync", action="store_true", help="Waits for every segment to be on disk")
+    record.add_argument("--lookups", default=10000, type=int, help="Number of random frame lookups")
+    record.add_argument("--width", default=2016, type=int, help="Frame width (uint16)")
+    record.add_argument("--height", default=1200, type=int, help="Frame height (uint16)")
+    record.set_defaults(func=bench_record)
+
+    dispatch = subparsers.add_parser("dispatch", help=bench_dispatch.__doc__)
+    dispatch.add_argument("-n", "--n-frames", default=100000, type=int,
+                          help="Number of frames to dispatch")
+    dispatch.add_argument("--outputs", default=[1, 4, 16, 64], type=int, nargs="+",
+                          help="Numbers of output streams to compare")
+    dispatch.set_defaults(func=bench_dispatch)
+
+    writer = subparsers.add_parser("writer", help=bench_writer.__doc__)
+    writer.add_argument("-n", "--n-frames", default=100000, type=int,
+                        help="Number of frames to process")
+    writer.add_argument("-r", "--repeat", default=5, type=int,
+                        help="Number of rounds, the fastest one is reported")
+    writer.set_defaults(func=bench_writer)
+
+    gfheader = subparsers.add_parser("gfheader", help=bench_gfheader.__doc__)
+    gfheader.add_argument("-n", "--n-packets", default=200000, type=int, help="Number of packet headers")
+    gfheader.add_argument("-b", "--batch", default=64, type=int, help="Packets per batch (udp batch)")
+    gfheader.set_defaults(func=bench_gfheader)
+
+    arguments = parser.parse_args()
+    arguments.func(arguments)
+
+
+if __name__ == "__main__":
+    main()
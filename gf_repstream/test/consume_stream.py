@@ -4,8 +4,49 @@ import sys
 import time
 import zmq
 import argparse
+from os.path import abspath, dirname, join
 #from gf_repstream.protocol import TestMetadata
 
+# the repstream modules are imported the same way cli.py and app.py do
+sys.path.insert(0, join(dirname(abspath(__file__)), ".."))
+
+from shm_reader import ShmReader
+from decompress_stream import decompress_parts
+from dispatch import periodic_rule
+from stream_stats import StreamStats, format_summary
+
+
+def consume_stats(socket, arguments):
+    """Receives with zero copy and prints a summary every interval instead of the headers."""
+    pattern = None
+    if arguments.send_mode is not None:
+        pattern = periodic_rule(arguments.send_mode, arguments.send_param, arguments.frame_block)
+        if pattern is None:
+            print(f"Output mode {arguments.send_mode} is not deterministic, the gaps are not checked against it.")
+    stats = StreamStats(pattern)
+    interval = arguments.stats
+    next_report = time.monotonic() + interval
+    try:
+        while True:
+            timeout = max(0.0, next_report - time.monotonic())
+            if arguments.shm is not None:
+                slot = socket.recv(timeout)
+                if slot is None and socket.closed:
+                    break
+                if slot is not None:
+                    # read in place, given back at once
+                    stats.add_message(decompress_parts(slot.parts) if arguments.decompress else slot.parts)
+                    socket.release(slot)
+            elif socket.poll(int(1000 * timeout)):
+                data = socket.recv_multipart(copy=False)
+                stats.add_message(decompress_parts(data) if arguments.decompress else data)
+            if time.monotonic() >= next_report:
+                print(format_summary(stats.interval()), flush=True)
+                next_report += interval
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(stats.totals()))
+
 
 def main():
 
@@ -17,35 +58,64 @@ def main():
                         help='Communication mode - either pull (default) or sub')
     parser.add_argument('-f', '--format', default='file', type=str,
                         help='Incoming header data.')
+    parser.add_argument('-s', '--shm', default=None, type=str,
+                        help='Name of the shared memory ring of an output stream with the shm transport '
+                             '(the address is then the one of its notification socket)')
+    parser.add_argument('-r', '--reader', default=0, type=int,
+                        help='Reader index of the shared memory ring (default: 0)')
+    parser.add_argument('-d', '--decompress', action='store_true',
+                        help='Decompresses the payloads of an output stream with compression')
+    parser.add_argument('--stats', default=None, type=float,
+                        help='Prints a summary (rate, gaps, latency) every so many seconds instead of the headers')
+    parser.add_argument('--send-mode', default=None, type=str,
+                        help='send_output_mode of the output stream, the gaps are checked against its pattern')
+    parser.add_argument('--send-param', default=1, type=int, help='send_output_param of the output stream')
+    parser.add_argument('--frame-block', default=15, type=int, help='frame_block of the repeater (default: 15)')
 
     arguments = parser.parse_args()
 
     in_address = arguments.address
     mode = arguments.mode
-    header = arguments.format 
 
     # Socket to talk to server
     context = zmq.Context(io_threads=1)
-    if mode.upper() == "SUB":
+    if arguments.shm is not None:
+        socket = ShmReader(arguments.shm, in_address, reader=arguments.reader)
+    elif mode.upper() == "SUB":
         socket = context.socket(zmq.SUB)
         socket.setsockopt_string(zmq.SUBSCRIBE, u"")
     elif mode.upper() == "PULL":
         socket = context.socket(zmq.PULL)
     else:
         raise RuntimeError("Mode not recognized (SUB or PULL). Halting executing...")
-    socket.connect(in_address)
+    if arguments.shm is None:
+        socket.connect(in_address)
+
+    if arguments.stats:
+        consume_stats(socket, arguments)
+        if arguments.shm is not None:
+            socket.close()
+        return
 
     total_recvs = 0
     
     try:
         while True:
             data = socket.recv_multipart()
+            if data is None:
+                # the shared memory output stream was stopped
+                break
+            if arguments.decompress:
+                data = decompress_parts(data)
             metadata = json.loads(data[0].decode())
             total_recvs += 1
             print("Total recvs: ",total_recvs)
             print(json.dumps(metadata, sort_keys=False, indent=4))
     except KeyboardInterrupt:
         pass
+    finally:
+        if arguments.shm is not None:
+            socket.close()
         
 
 if __name__ == "__main__":
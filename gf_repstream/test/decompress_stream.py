@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+import json
+import sys
+from os.path import abspath, dirname, join
+
+# the repstream modules are imported the same way cli.py and app.py do
+sys.path.insert(0, join(dirname(abspath(__file__)), ".."))
+
+from compression import CODEC_KEY, SIZE_KEY, decompress, element_type
+
+
+def decompress_parts(parts):
+    """Restores a frame sent by an output stream with compression.
+
+    The codec and the size of the payload are taken from the header
+    (``compression`` and ``uncompressed_size``), the element type of
+    bitshuffle-lz4 from its ``type`` (or the one of its ``image_attributes``).
+    Frames without these entries are returned as they are.
+
+    Example:
+        parts = decompress_parts(socket.recv_multipart())
+
+    Args:
+        parts (list): The message parts (header and payload first).
+
+    Returns:
+        list: the parts with the header without the compression entries and
+            the decompressed payload.
+    """
+    metadata = json.loads(bytes(parts[0]).decode())
+    if CODEC_KEY not in metadata:
+        return parts
+    codec = metadata.pop(CODEC_KEY)
+    size = metadata.pop(SIZE_KEY)
+    payload = decompress(codec, parts[1], size, element_type(metadata))
+    return [json.dumps(metadata).encode(), payload] + list(parts[2:])
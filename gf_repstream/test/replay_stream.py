@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from os.path import abspath, dirname, isdir, isfile, join
+
+import numpy as np
+import zmq
+
+# the repstream modules are imported the same way cli.py and app.py do
+sys.path.insert(0, join(dirname(abspath(__file__)), ".."))
+
+from recorder import INDEX_FILE, RecordReader
+
+# <message>_<part>.raw files of a recorded dataset (see test_data)
+_RAW_FILE = re.compile(r"^(\d+)_(\d+)\.raw$")
+# below this time to wait, the pacing spins instead of sleeping
+_SPIN_TIME = 0.001
+
+
+class HeaderTemplate:
+    """Renders the header of a frame with a new frame number (``frame`` and
+    ``image_attributes.image_number``) without encoding json per frame.
+
+    Args:
+        header (dict): The decoded header.
+    """
+
+    def __init__(self, header):
+        header = dict(header, frame="@FRAME@")
+        if "image_attributes" in header:
+            header["image_attributes"] = dict(header["image_attributes"], image_number="@FRAME@")
+        self._template = json.dumps(header).encode().replace(b"%", b"%%").replace(b'"@FRAME@"', b"%d")
+        self._count = self._template.count(b"%d")
+
+    def render(self, frame):
+        """bytes: the encoded header of the frame."""
+        return self._template % ((frame,) * self._count)
+
+
+def load_raw_folder(folder):
+    """Reads a folder of .raw files once (<message>_<part>.raw, header first).
+
+    Args:
+        folder (str): The folder.
+
+    Returns:
+        list: the messages, each a list of parts (bytes).
+    """
+    files = {}
+    for name in os.listdir(folder):
+        match = _RAW_FILE.match(name)
+        if match is not None and isfile(join(folder, name)):
+            files.setdefault(int(match.group(1)), []).append((int(match.group(2)), name))
+    messages = []
+    for message in sorted(files):
+        parts = []
+        for _, name in sorted(files[message]):
+            with open(join(folder, name), "rb") as f:
+                parts.append(f.read())
+        messages.append(parts)
+    return messages
+
+
+def synthesize(shape, dtype="uint16", distinct=8, counts=2.0, offset=100, seed=0):
+    """Detector like frames: Poisson distributed photon counts over a dark offset.
+
+    Args:
+        shape (list): Image shape.
+        dtype (str, optional): Image type. Defaults to uint16.
+        distinct (int, optional): Number of different images. Defaults to 8.
+        counts (float, optional): Mean photon counts per pixel. Defaults to 2.
+        offset (int, optional): Dark offset of the pixels. Defaults to 100.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        list: the messages, each a header (bytes) and a payload.
+    """
+    rng = np.random.default_rng(seed)
+    messages = []
+    for i in range(distinct):
+        image = (offset + rng.poisson(counts, shape)).astype(dtype)
+        header = {"htype": ["array-1.0"], "frame": i, "shape": list(shape), "type": np.dtype(dtype).name,
+                  "endianess": "little", "source": "gf_repstream-replay", "image_attributes": {"image_number": i}}
+        messages.append([json.dumps(header).encode(), image.tobytes()])
+    return messages
+
+
+def header_time(header, key):
+    """Value of a (dotted) header key, None if the header does not have it."""
+    value = header
+    for name in key.split("."):
+        if not isinstance(value, dict) or name not in value:
+            return None
+        value = value[name]
+    return value
+
+
+class Replay:
+    """Streams a dataset loaded once in memory (or mapped, see RecordReader)
+    at a given pace, looping over it.
+
+    Every sent frame gets a new frame number (the dataset is looped), the
+    payloads are sent without copying them. The pace is either a frame
+    rate, a data rate or the recorded inter-arrival times of the frames;
+    the send times follow an absolute schedule, so a late frame is sent
+    at once and the average rate is kept.
+
+    Args:
+        messages (list): The messages of the dataset (header first).
+        times (list, optional): Recorded arrival time (s) of each message.
+    """
+
+    def __init__(self, messages, times=None):
+        if not messages:
+            raise ValueError("The dataset has no message.")
+        self._messages = messages
+        self._headers = [HeaderTemplate(json.loads(bytes(parts[0]))) for parts in messages]
+        self._sizes = [sum(len(part) for part in parts) for parts in messages]
+        self._intervals = None
+        if times is not None:
+            times = np.asarray(times, dtype=float)
+            intervals = np.diff(times)
+            # the loop goes back to the first message after the mean interval
+            self._intervals = np.append(intervals, intervals.mean() if len(intervals) else 0).clip(min=0)
+
+    def __len__(self):
+        return len(self._messages)
+
+    @property
+    def nbytes(self):
+        """int: size of the dataset."""
+        return sum(self._sizes)
+
+    def run(self, zmq_socket, n_frames, fps=None, mb_per_s=None, recorded=False, first_frame=0,
+            report_interval=None, stop_event=None):
+        """Sends frames.
+
+        Args:
+            zmq_socket (zmq.Socket): Bound or connected socket (PUSH or PUB).
+            n_frames (int): Number of frames to send, None for ever.
+            fps (float, optional): Frame rate. Defaults to None.
+            mb_per_s (float, optional): Data rate in MB/s (2**20 bytes). Defaults to None.
+            recorded (bool, optional): Follows the recorded inter-arrival times. Defaults to False.
+            first_frame (int, optional): Number of the first frame. Defaults to 0.
+            report_interval (float, optional): Prints the achieved rate every so many
+                seconds. Defaults to None (no report).
+            stop_event (optional): Event that stops the replay.
+
+        Returns:
+            dict: frames and bytes sent, elapsed time (s), achieved fps and MB/s and
+                the largest delay behind the schedule (ms).
+        """
+        n_messages = len(self._messages)
+        start = time.perf_counter()
+        deadline = start
+        last_report = start
+        reported_frames = reported_bytes = 0
+        sent_bytes = 0
+        max_lag = 0.0
+        i = 0
+        while n_frames is None or i < n_frames:
+            if stop_event is not None and stop_event.is_set():
+                break
+            index = i % n_messages
+            if fps or mb_per_s or recorded:
+                now = time.perf_counter()
+                if deadline > now:
+                    # sleeps most of the wait, spins the end of it
+                    if deadline - now > _SPIN_TIME:
+                        time.sleep(deadline - now - _SPIN_TIME)
+                    while time.perf_counter() < deadline:
+                        pass
+                else:
+                    max_lag = max(max_lag, now - deadline)
+            parts = self._messages[index]
+            zmq_socket.send_multipart([self._headers[index].render(first_frame + i)] + list(parts[1:]), copy=False)
+            sent_bytes += self._sizes[index]
+            i += 1
+            if recorded and self._intervals is not None:
+                deadline += self._intervals[index]
+            elif fps:
+                deadline = start + i / fps
+            elif mb_per_s:
+                deadline = start + sent_bytes / (mb_per_s * 2**20)
+            if report_interval is not None:
+                now = time.perf_counter()
+                if now - last_report >= report_interval:
+                    print(f"sent {i} frames: {(i - reported_frames) / (now - last_report):.1f} frames/s "
+                          f"{(sent_bytes - reported_bytes) / (now - last_report) / 2**20:.1f} MB/s", flush=True)
+                    last_report, reported_frames, reported_bytes = now, i, sent_bytes
+        elapsed = time.perf_counter() - start
+        return {
+            "frames": i,
+            "bytes": sent_bytes,
+            "elapsed_s": elapsed,
+            "fps": i / elapsed if elapsed else None,
+            "mb_per_s": sent_bytes / elapsed / 2**20 if elapsed else None,
+            "max_lag_ms": max_lag * 1e3,
+        }
+
+
+def load_dataset(folder=None, shape=None, dtype="uint16", distinct=8, time_key=None, time_scale=1.0):
+    """Messages and recorded times of a dataset.
+
+    Args:
+        folder (str, optional): Folder of .raw files or directory of a recording
+            of a record output stream (mapped, not read). Defaults to None.
+        shape (list, optional): Shape of the synthesized images (without folder).
+        dtype (str, optional): Type of the synthesized images. Defaults to uint16.
+        distinct (int, optional): Number of synthesized images. Defaults to 8.
+        time_key (str, optional): Header key (dotted for nested keys) of the
+            arrival time of the frames. Defaults to None (no recorded times).
+        time_scale (float, optional): Seconds per unit of the time key. Defaults to 1.
+
+    Returns:
+        tuple: the messages and their times (None without time key).
+
+    Raises:
+        RuntimeError: The folder does not exist or the time key is missing.
+    """
+    if folder:
+        if not isdir(folder):
+            raise RuntimeError(f"Folder {folder} doesn't exist.")
+        if isfile(join(folder, INDEX_FILE)):
+            # the recording stays mapped for the life of the process
+            messages = [parts for _, parts in RecordReader(folder)]
+        else:
+            messages = load_raw_folder(folder)
+    else:
+        messages = synthesize(shape or [1200, 2016], dtype, distinct)
+    times = None
+    if time_key:
+        times = [header_time(json.loads(bytes(parts[0])), time_key) for parts in messages]
+        if any(value is None for value in times):
+            raise RuntimeError(f"Header key {time_key} missing in the dataset.")
+        times = [value * time_scale for value in times]
+    return messages, times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays a recorded or synthesized GF stream at a given rate")
+    parser.add_argument("-f", "--folder", default=None, type=str,
+                        help="Folder of .raw files or directory of a recording (default: synthesized frames)")
+    parser.add_argument("-a", "--address", default="tcp://*:9609", type=str,
+                        help='Address - format "tcp://<address>:<port>" (default: "tcp://*:9609")')
+    parser.add_argument("-m", "--mode", default="push", type=str, help="Communication mode - push (default) or pub")
+    parser.add_argument("-n", "--n-frames", default=1000, type=int, help="Number of frames to send, 0 for ever")
+    parser.add_argument("--fps", default=None, type=float, help="Frame rate (default: as fast as possible)")
+    parser.add_argument("--mb-per-s", default=None, type=float, help="Data rate in MB/s")
+    parser.add_argument("--time-key", default=None, type=str,
+                        help="Follows the recorded timing of this header key, e.g. repstream_ingress_time")
+    parser.add_argument("--time-scale", default=1.0, type=float, help="Seconds per unit of the time key")
+    parser.add_argument("--shape", default=[1200, 2016], type=int, nargs="+", help="Shape of the synthesized frames")
+    parser.add_argument("--dtype", default="uint16", type=str, help="Type of the synthesized frames")
+    parser.add_argument("--distinct", default=8, type=int, help="Number of different synthesized frames")
+    parser.add_argument("--first-frame", default=0, type=int, help="Number of the first frame")
+    parser.add_argument("--report", default=1.0, type=float, help="Seconds between the rate reports, 0 for none")
+    parser.add_argument("--wait", default=1.0, type=float, help="Seconds given to the consumers to connect")
+    arguments = parser.parse_args()
+
+    messages, times = load_dataset(arguments.folder, arguments.shape, arguments.dtype, arguments.distinct,
+                                   arguments.time_key, arguments.time_scale)
+    replay = Replay(messages, times)
+    print(f"Replaying {len(replay)} messages ({replay.nbytes / 2**20:.1f} MB) to {arguments.address}")
+
+    context = zmq.Context()
+    if arguments.mode.upper() == "PUSH":
+        zmq_socket = context.socket(zmq.PUSH)
+    elif arguments.mode.upper() == "PUB":
+        zmq_socket = context.socket(zmq.PUB)
+    else:
+        raise RuntimeError("Mode not recognized (PUSH or PUB). Halting executing...")
+    zmq_socket.bind(arguments.address)
+    time.sleep(arguments.wait)
+    try:
+        stats = replay.run(zmq_socket, arguments.n_frames or None, fps=arguments.fps,
+                           mb_per_s=arguments.mb_per_s, recorded=arguments.time_key is not None,
+                           first_frame=arguments.first_frame, report_interval=arguments.report or None)
+        print(json.dumps(stats))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        zmq_socket.close(linger=-1)
+        context.term()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+import json
+import sys
+import time
+from collections import deque
+from os.path import abspath, dirname, join
+
+# the repstream modules are imported the same way cli.py and app.py do
+sys.path.insert(0, join(dirname(abspath(__file__)), ".."))
+
+from frame import INGRESS_TIME_KEY
+from histogram import LatencyHistogram
+
+# counters of a summary, totals and per interval
+_COUNTERS = ["frames", "bytes", "gaps", "missing", "duplicates", "late", "unexpected"]
+
+
+class StreamStats:
+    """Frame rate, continuity and latency of a received output stream.
+
+    Every frame costs a few integer operations, so the consumer is not the
+    bottleneck of what it measures. The frame numbers are checked against
+    the pattern of the output mode of the stream (see dispatch.periodic_rule):
+    a jump over frames the pattern sends is a gap, a frame received again
+    (among the last ``window`` ones) a duplicate, an older frame that was not
+    received yet is late (it fills a gap) and a frame outside the pattern is
+    unexpected. The latency is the wall clock time since the ingress time
+    injected in the header by the repeater (``inject_timestamp``), so the
+    clocks of the hosts must be synchronized.
+
+    Args:
+        pattern (tuple, optional): (period, width) of the output mode, a frame
+            is sent when ``frame % period < width``. Defaults to None (every frame).
+        window (int, optional): Number of recent frame numbers kept to tell
+            duplicates from late frames. Defaults to 4096.
+    """
+
+    def __init__(self, pattern=None, window=4096):
+        self._pattern = pattern
+        self._recent = set()
+        self._order = deque()
+        self._window = window
+        self.last_frame = None
+        self._totals = dict.fromkeys(_COUNTERS, 0)
+        self._reported = dict(self._totals)
+        self._latency = LatencyHistogram()
+        self._interval_latency = LatencyHistogram()
+        self._last_report = time.monotonic()
+        self._first = self._last = None
+
+    def _expected(self, frame):
+        # number of frames the pattern sends before this one
+        if self._pattern is None:
+            return frame
+        period, width = self._pattern
+        return frame // period * width + min(frame % period, width)
+
+    def add(self, frame, nbytes, ingress_time=None):
+        """Counts a received frame.
+
+        Args:
+            frame (int): Frame number.
+            nbytes (int): Size of the message.
+            ingress_time (float, optional): Ingress time (time.time()) of the frame.
+        """
+        totals = self._totals
+        self._last = time.monotonic()
+        if self._first is None:
+            self._first = self._last
+        totals["frames"] += 1
+        totals["bytes"] += nbytes
+        if ingress_time is not None:
+            latency = time.time() - ingress_time
+            self._latency.record_seconds(latency)
+            self._interval_latency.record_seconds(latency)
+        expected = self._pattern is None or frame % self._pattern[0] < self._pattern[1]
+        if not expected:
+            totals["unexpected"] += 1
+        last = self.last_frame
+        if last is None or frame > last:
+            if last is not None:
+                missing = self._expected(frame) - self._expected(last + 1)
+                if missing > 0:
+                    totals["gaps"] += 1
+                    totals["missing"] += missing
+            self.last_frame = frame
+        elif frame in self._recent:
+            totals["duplicates"] += 1
+            return
+        else:
+            totals["late"] += 1
+            if expected:
+                totals["missing"] -= 1
+        self._recent.add(frame)
+        self._order.append(frame)
+        if len(self._order) > self._window:
+            self._recent.discard(self._order.popleft())
+
+    def add_message(self, parts):
+        """Counts a received message (header first, zero copy parts accepted).
+
+        Returns:
+            dict: the decoded header.
+        """
+        header = json.loads(bytes(parts[0]))
+        self.add(header["frame"], sum(len(part) for part in parts), header.get(INGRESS_TIME_KEY))
+        return header
+
+    def _summary(self, counters, elapsed, latency):
+        summary = dict(counters)
+        summary["elapsed_s"] = elapsed
+        summary["fps"] = counters["frames"] / elapsed if elapsed else None
+        summary["mb_per_s"] = counters["bytes"] / elapsed / 2**20 if elapsed else None
+        summary["latency_p50_ms"] = summary["latency_p99_ms"] = summary["latency_max_ms"] = None
+        if latency.count:
+            summary["latency_p50_ms"] = latency.percentile(50) / 1e6
+            summary["latency_p99_ms"] = latency.percentile(99) / 1e6
+            summary["latency_max_ms"] = latency.max / 1e6
+        return summary
+
+    def interval(self):
+        """Summary since the previous call (or the start) and starts a new interval.
+
+        Returns:
+            dict: frames, bytes, gaps, missing, duplicate, late and unexpected
+                frames, elapsed time (s), fps, MB/s and latency p50, p99 and
+                max (ms, None without ingress times).
+        """
+        now = time.monotonic()
+        counters = {key: self._totals[key] - self._reported[key] for key in _COUNTERS}
+        summary = self._summary(counters, now - self._last_report, self._interval_latency)
+        self._reported = dict(self._totals)
+        self._last_report = now
+        self._interval_latency = LatencyHistogram()
+        return summary
+
+    def totals(self):
+        """dict: summary from the first to the last frame (see interval)."""
+        elapsed = self._last - self._first if self._first is not None else 0.0
+        return self._summary(self._totals, elapsed, self._latency)
+
+
+def format_summary(summary):
+    """str: one line report of a summary of StreamStats."""
+    line = (f"{summary['frames']} frames {summary['fps'] or 0:.1f} fps {summary['mb_per_s'] or 0:.1f} MB/s "
+            f"gaps {summary['gaps']} (missing {summary['missing']}) duplicates {summary['duplicates']} "
+            f"late {summary['late']} unexpected {summary['unexpected']}")
+    if summary["latency_p99_ms"] is not None:
+        line += (f" latency p50 {summary['latency_p50_ms']:.2f} p99 {summary['latency_p99_ms']:.2f} "
+                 f"max {summary['latency_max_ms']:.2f} ms")
+    return line
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+import ctypes
+import sys
+from os.path import abspath, dirname, join
+
+import numpy as np
+import pytest
+
+# the repstream modules are imported the same way cli.py and app.py do
+sys.path.insert(0, join(dirname(abspath(__file__)), ".."))
+
+from protocol import (GF_BIT_FIELDS, GF_FIELDS, GF_HEADER_DTYPE, GF_HEADER_SIZE, GF_SPLIT_FIELDS, GFHeader,
+                      decode_headers, encode_headers)
+
+
+def random_header_columns(n, seed=0):
+    """Random values of every GFHeader field, within the range of the field."""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name in GF_FIELDS:
+        if name in GF_BIT_FIELDS:
+            bits = GF_BIT_FIELDS[name][2]
+        elif name in GF_SPLIT_FIELDS:
+            low, bits, high = GF_SPLIT_FIELDS[name]
+            bits += 8 * GF_HEADER_DTYPE[high].itemsize
+        else:
+            bits = 8 * GF_HEADER_DTYPE[name].itemsize
+        columns[name] = rng.integers(0, 2**bits, n, dtype=np.uint64)
+    return columns
+
+
+def ctypes_columns(header):
+    """Fields of a ctypes GFHeader, with the split fields combined as decode_headers does."""
+    fields = header.as_dict()
+    fields["timestamp"] = fields.pop("timestamp0") | fields.pop("timestamp1") << 32
+    fields["exposure_time"] = fields.pop("exptime0") | fields.pop("exptime1") << 8
+    return fields
+
+
+def test_header_size():
+    assert GF_HEADER_SIZE == 32
+    assert ctypes.sizeof(GFHeader) == GF_HEADER_SIZE
+
+
+def test_round_trip():
+    columns = random_header_columns(10000)
+    raw = encode_headers(columns).tobytes()
+    assert len(raw) == 10000 * GF_HEADER_SIZE
+    decoded = decode_headers(raw)
+    assert list(decoded) == GF_FIELDS
+    for name in GF_FIELDS:
+        np.testing.assert_array_equal(decoded[name], columns[name], err_msg=name)
+
+
+def test_decode_packets():
+    # headers followed by their payload, one packet per row of a receive buffer
+    columns = random_header_columns(100, seed=1)
+    packets = np.full((100, GF_HEADER_SIZE + 64), 0xFF, dtype=np.uint8)
+    packets[:, :GF_HEADER_SIZE] = encode_headers(columns).view(np.uint8).reshape(100, GF_HEADER_SIZE)
+    decoded = decode_headers(packets)
+    for name in GF_FIELDS:
+        np.testing.assert_array_equal(decoded[name], columns[name], err_msg=name)
+    # the columns are copies, the buffer can be reused
+    packets[:] = 0
+    np.testing.assert_array_equal(decoded["frame_number"], columns["frame_number"])
+
+
+def test_decode_fields():
+    columns = random_header_columns(10, seed=2)
+    decoded = decode_headers(encode_headers(columns).tobytes(), ["frame_number", "starting_row", "scan_id"])
+    assert list(decoded) == ["frame_number", "starting_row", "scan_id"]
+    np.testing.assert_array_equal(decoded["starting_row"], columns["starting_row"])
+
+
+def test_ctypes_header():
+    columns = random_header_columns(1000, seed=3)
+    raw = encode_headers(columns).tobytes()
+    for i in range(1000):
+        header = GFHeader.from_buffer_copy(raw, i * GF_HEADER_SIZE)
+        assert ctypes_columns(header) == {name: int(values[i]) for name, values in columns.items()}
+
+
+def test_ctypes_to_decode_headers():
+    header = GFHeader(protocol_id=0xCB, row_length=0x80, rpfpq=0x55, swap=1, correction_mode=5, rpf=2,
+                      scan_id=7, frame_number=123456, trigger=1, status4=0xA5, starting_row=62,
+                      timestamp0=0xDEADBEEF, timestamp1=0x12, exptime0=0x34, exptime1=0x5678,
+                      sync_time=9, scan_time=10)
+    decoded = decode_headers(bytes(header))
+    expected = ctypes_columns(header)
+    assert expected["timestamp"] == 0x12DEADBEEF and expected["exposure_time"] == 0x567834
+    assert {name: int(values[0]) for name, values in decoded.items()} == expected
+
+
+def test_encode_scalars():
+    headers = encode_headers({"protocol_id": 0xCB, "scan_id": 3, "starting_row": [0, 2, 4]})
+    decoded = decode_headers(headers.tobytes())
+    assert decoded["protocol_id"].tolist() == [0xCB] * 3
+    assert decoded["scan_id"].tolist() == [3] * 3
+    assert decoded["starting_row"].tolist() == [0, 2, 4]
+    assert len(encode_headers({"frame_number": 1}, n=5)) == 5
+
+
+def test_encode_unknown_field():
+    with pytest.raises(KeyError):
+        encode_headers({"geometry": [1]})
+    with pytest.raises(KeyError):
+        encode_headers({"row_legth": [1]})
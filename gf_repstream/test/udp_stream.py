@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+import argparse
+import json
+import random
+import socket
+import sys
+import time
+from os.path import abspath, dirname, join
+
+import numpy as np
+
+# the repstream modules are imported the same way cli.py and app.py do
+sys.path.insert(0, join(dirname(abspath(__file__)), ".."))
+
+from protocol import GF_HEADER_SIZE, encode_headers
+
+# protocol_id of the GigaFRoST packets
+PROTOCOL_ID = 0xCB
+
+
+def module_rows(n_modules, rows, row_size, seed=0):
+    """Payload of every module, random uint16 pixels (a frame repeats them)."""
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 4096, rows * row_size // 2, dtype=np.uint16).tobytes() for _ in range(n_modules)]
+
+
+def send_frames(sockets, n_frames, rows, row_size, rows_per_packet, fps=None, drop=0.0, shuffle=False,
+                first_frame=0, scan_id=0, seed=0):
+    """Sends frames as GigaFRoST packets, one socket per module.
+
+    Args:
+        sockets (list): Connected UDP sockets, one per module.
+        n_frames (int): Number of frames.
+        rows (int): Rows of a module per frame.
+        row_size (int): Bytes per row.
+        rows_per_packet (int): Rows per packet.
+        fps (float, optional): Frame rate. Defaults to None (as fast as possible).
+        drop (float, optional): Probability of not sending a packet. Defaults to 0.
+        shuffle (bool, optional): Sends the packets of a frame in random order. Defaults to False.
+        first_frame (int, optional): Number of the first frame. Defaults to 0.
+        scan_id (int, optional): Scan id of the packets. Defaults to 0.
+        seed (int, optional): Seed of the payloads and of the drops. Defaults to 0.
+
+    Returns:
+        dict: frames, packets and bytes sent, dropped packets, elapsed time (s) and frame rate.
+    """
+    payloads = [memoryview(payload) for payload in module_rows(len(sockets), rows, row_size, seed)]
+    randomness = random.Random(seed)
+    packets = [(module, row) for module in range(len(sockets)) for row in range(0, rows, rows_per_packet)]
+    # the headers of all the packets of a frame, only the frame number changes
+    template = encode_headers({"protocol_id": PROTOCOL_ID, "row_length": (row_size // 16) & 0xFF,
+                               "scan_id": scan_id, "starting_row": [row for _, row in packets]})
+    sent = sent_bytes = dropped = 0
+    start = time.perf_counter()
+    for i in range(n_frames):
+        if fps:
+            deadline = start + i / fps
+            while time.perf_counter() < deadline:
+                time.sleep(min(0.001, max(0.0, deadline - time.perf_counter())))
+        frame = first_frame + i
+        template["frame_number"] = frame
+        headers = template.tobytes()
+        order = randomness.sample(range(len(packets)), len(packets)) if shuffle else range(len(packets))
+        for index in order:
+            module, row = packets[index]
+            if drop and randomness.random() < drop:
+                dropped += 1
+                continue
+            n = min(rows_per_packet, rows - row)
+            header = headers[index * GF_HEADER_SIZE:(index + 1) * GF_HEADER_SIZE]
+            sockets[module].send(header + payloads[module][row * row_size:(row + n) * row_size])
+            sent += 1
+            sent_bytes += len(header) + n * row_size
+    elapsed = time.perf_counter() - start
+    return {"frames": n_frames, "packets": sent, "bytes": sent_bytes, "dropped_packets": dropped,
+            "elapsed_s": elapsed, "fps": n_frames / elapsed if elapsed else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local GigaFRoST UDP packet generator (tests the udp input)")
+    parser.add_argument("-a", "--address", default="127.0.0.1", type=str, help="Destination host")
+    parser.add_argument("-p", "--ports", default=[51000], type=int, nargs="+", help="UDP ports, one per module")
+    parser.add_argument("-n", "--n-frames", default=100, type=int, help="Number of frames")
+    parser.add_argument("--rows", default=64, type=int, help="Rows of a module per frame (udp rows)")
+    parser.add_argument("--row-size", default=4096, type=int, help="Bytes per row (udp row_size)")
+    parser.add_argument("--rows-per-packet", default=2, type=int, help="Rows per packet")
+    parser.add_argument("--fps", default=10, type=float, help="Frame rate, 0 for as fast as possible")
+    parser.add_argument("--drop", default=0.0, type=float, help="Probability of not sending a packet")
+    parser.add_argument("--shuffle", action="store_true", help="Sends the packets of a frame in random order")
+    parser.add_argument("--first-frame", default=0, type=int, help="Number of the first frame")
+    parser.add_argument("--scan-id", default=0, type=int, help="Scan id of the packets")
+    arguments = parser.parse_args()
+
+    sockets = []
+    for port in arguments.ports:
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_socket.connect((arguments.address, port))
+        sockets.append(udp_socket)
+    try:
+        stats = send_frames(sockets, arguments.n_frames, arguments.rows, arguments.row_size,
+                            arguments.rows_per_packet, fps=arguments.fps or None, drop=arguments.drop,
+                            shuffle=arguments.shuffle, first_frame=arguments.first_frame,
+                            scan_id=arguments.scan_id)
+        print(json.dumps(stats))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for udp_socket in sockets:
+            udp_socket.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+import json
+
+import numpy as np
+
+from frame import Frame
+
+# keys of the transform of an output stream
+TRANSFORM_KEYS = ["roi", "binning", "bin_mode", "dtype", "shift"]
+BIN_MODES = ["sum", "mean"]
+
+
+def valid_transform(config):
+    """Checks the transform configuration of an output stream.
+
+    Args:
+        config (dict): roi ([row_start, row_end, col_start, col_end]), binning (N),
+            bin_mode (sum or mean), dtype (numpy type name) and shift (bits),
+            all optional.
+
+    Returns:
+        bool: True if the configuration is valid.
+    """
+    if not isinstance(config, dict) or not config or any(key not in TRANSFORM_KEYS for key in config):
+        return False
+    roi = config.get("roi")
+    if roi is not None and not (isinstance(roi, list) and len(roi) == 4
+                                and all(isinstance(value, int) and value >= 0 for value in roi)
+                                and roi[0] < roi[1] and roi[2] < roi[3]):
+        return False
+    binning = config.get("binning", 1)
+    if not isinstance(binning, int) or binning < 1:
+        return False
+    if config.get("bin_mode", "sum") not in BIN_MODES:
+        return False
+    shift = config.get("shift", 0)
+    if not isinstance(shift, int) or shift < 0:
+        return False
+    try:
+        np.dtype(config.get("dtype", "uint16"))
+    except TypeError:
+        return False
+    return True
+
+
+class FrameTransform:
+    """Reduces the image of a frame for an output stream: ROI crop, NxN
+    binning and dtype downcast, vectorized with numpy.
+
+    The payload is interpreted with the ``shape`` and ``type`` of the header
+    (or of its ``image_attributes``), the sent header is rewritten with the
+    new shape and type. The crop is a view, the binning sums the NxN blocks
+    (in a wide enough integer type, or averaged back to the input type) and
+    the downcast shifts the values right by ``shift`` bits and clips them to
+    the range of the new type.
+
+    Args:
+        config (dict): roi ([row_start, row_end, col_start, col_end]), binning (N),
+            bin_mode (sum or mean, defaults to sum), dtype (numpy type name) and
+            shift (bits, defaults to 0), all optional.
+    """
+
+    def __init__(self, config):
+        self._roi = config.get("roi")
+        self._binning = config.get("binning", 1)
+        self._mean = config.get("bin_mode", "sum") == "mean"
+        self._dtype = np.dtype(config["dtype"]) if "dtype" in config else None
+        self._shift = config.get("shift", 0)
+
+    @staticmethod
+    def _image_format(header):
+        attributes = header.get("image_attributes") or {}
+        shape = header.get("shape", attributes.get("shape"))
+        dtype = header.get("type", attributes.get("type"))
+        if shape is None or dtype is None:
+            raise ValueError("The header has no image shape or type.")
+        return shape, np.dtype(dtype)
+
+    def image(self, image):
+        """Transforms an image.
+
+        Args:
+            image (numpy.ndarray): The 2d image.
+
+        Returns:
+            numpy.ndarray: the transformed image.
+        """
+        if self._roi is not None:
+            row_start, row_end, col_start, col_end = self._roi
+            image = image[row_start:row_end, col_start:col_end]
+        n = self._binning
+        if n > 1:
+            rows, cols = image.shape[0] // n, image.shape[1] // n
+            blocks = image[:rows * n, :cols * n].reshape(rows, n, cols, n)
+            accumulator = image.dtype
+            if image.dtype.kind in "ui":
+                # smallest integer type that holds the sum of N*N values
+                accumulator = np.result_type(image.dtype,
+                                             np.min_scalar_type(int(np.iinfo(image.dtype).max) * n * n))
+            # n rows then n columns of slices added in place, much faster than
+            # reducing the small axes of the blocks
+            rows_sum = blocks[:, 0].astype(accumulator)
+            for i in range(1, n):
+                rows_sum += blocks[:, i]
+            binned = rows_sum[:, :, 0].copy()
+            for j in range(1, n):
+                binned += rows_sum[:, :, j]
+            if self._mean:
+                if binned.dtype.kind in "ui":
+                    binned += (n * n) // 2
+                    binned //= n * n
+                else:
+                    binned /= n * n
+                binned = binned.astype(image.dtype)
+            image = binned
+        if self._shift:
+            image = image >> self._shift
+        if self._dtype is not None and self._dtype != image.dtype:
+            if self._dtype.kind in "ui":
+                # saturates instead of wrapping around
+                limits = np.iinfo(self._dtype)
+                if image.dtype.kind in "ui":
+                    current = np.iinfo(image.dtype)
+                    if limits.max < current.max:
+                        image = np.minimum(image, image.dtype.type(limits.max))
+                    if limits.min > current.min:
+                        image = np.maximum(image, image.dtype.type(limits.min))
+                else:
+                    image = np.clip(image, limits.min, limits.max)
+            image = image.astype(self._dtype)
+        return image
+
+    def apply(self, data):
+        """Transforms the image of a frame.
+
+        Args:
+            data (Frame): The envelope of the received message (not modified).
+
+        Returns:
+            Frame: a new envelope with the rewritten header and the transformed payload.
+
+        Raises:
+            ValueError: The payload does not match the shape and type of the header.
+        """
+        header = data.header
+        shape, dtype = self._image_format(header)
+        payload = memoryview(data.parts[1])
+        if payload.nbytes != dtype.itemsize * int(np.prod(shape)):
+            raise ValueError(f"Payload of {payload.nbytes} bytes does not match {shape} {dtype}.")
+        image = self.image(np.frombuffer(payload, dtype=dtype).reshape(shape))
+        metadata = dict(header)
+        new_shape = list(image.shape)
+        if "shape" in header or "type" in header:
+            metadata["shape"] = new_shape
+            metadata["type"] = image.dtype.name
+        if "shape" in (header.get("image_attributes") or {}):
+            metadata["image_attributes"] = dict(header["image_attributes"], shape=new_shape,
+                                                type=image.dtype.name)
+        transformed = Frame([json.dumps(metadata).encode(), np.ascontiguousarray(image).tobytes()]
+                            + data.parts[2:], data.frame, metadata)
+        transformed.timestamps = data.timestamps
+        return transformed
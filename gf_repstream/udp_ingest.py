@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+import json
+import logging
+import math
+import socket
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import zmq
+
+from frame import Frame
+from protocol import GF_HEADER_SIZE, decode_headers
+
+_logger = logging.getLogger("RestStreamRepeater")
+
+# optional parameters of the udp input (see valid_udp), ports, rows and row_size are required
+UDP_DEFAULTS = {
+    "host": "0.0.0.0",
+    "packet_size": 9000,
+    "timeout_ms": 100,
+    "window": 32,
+    "batch": 64,
+    "rcvbuf": 64 * 2**20,
+    "shape": None,
+    "type": "uint16",
+    "send_incomplete": False,
+}
+UDP_REQUIRED = ["ports", "rows", "row_size"]
+
+
+def valid_udp(config):
+    """Checks the udp input configuration.
+
+    Args:
+        config (dict): ports (one UDP port per detector module, the modules
+            are placed one after the other in the frame), rows (rows of a
+            module per frame), row_size (bytes per row) and the optional
+            UDP_DEFAULTS: host (bind address), packet_size (largest datagram),
+            timeout_ms (time a frame waits for its missing packets), window
+            (frames older than the newest minus the window are given up),
+            batch (packets received per socket and wake up), rcvbuf (socket
+            receive buffer, bytes), shape and type of the frame (header of
+            the assembled messages) and send_incomplete (dispatches the given
+            up frames with their missing rows zeroed instead of dropping them).
+
+    Returns:
+        str: the problem of the configuration, None if it is valid.
+    """
+    if not isinstance(config, dict) or any(key not in UDP_DEFAULTS and key not in UDP_REQUIRED for key in config):
+        return f"Udp parameters must be {', '.join(UDP_REQUIRED + list(UDP_DEFAULTS))}."
+    if any(key not in config for key in UDP_REQUIRED):
+        return f"Udp input needs {', '.join(UDP_REQUIRED)}."
+    ports = config["ports"]
+    if (not isinstance(ports, list) or not ports or len(set(ports)) != len(ports)
+            or not all(isinstance(port, int) and 0 < port < 65536 for port in ports)):
+        return "Udp ports must be a list of distinct port numbers."
+    params = dict(UDP_DEFAULTS, **config)
+    for key in ["rows", "row_size", "packet_size", "window", "batch", "rcvbuf"]:
+        if not isinstance(params[key], int) or params[key] < 1:
+            return f"Udp {key} must be a positive integer."
+    if params["packet_size"] < GF_HEADER_SIZE + params["row_size"]:
+        return f"Udp packet size must hold the {GF_HEADER_SIZE} bytes header and a row."
+    if not isinstance(params["timeout_ms"], (int, float)) or params["timeout_ms"] <= 0:
+        return "Udp timeout must be a positive number (ms)."
+    if not isinstance(params["host"], str) or not isinstance(params["send_incomplete"], bool):
+        return "Udp host must be a string and send_incomplete a boolean."
+    try:
+        itemsize = np.dtype(params["type"]).itemsize
+    except TypeError:
+        return f"Udp type {params['type']} is not a numpy type."
+    shape = params["shape"]
+    if shape is not None and (not isinstance(shape, list) or not all(isinstance(n, int) and n > 0 for n in shape)
+                              or math.prod(shape) * itemsize != len(ports) * params["rows"] * params["row_size"]):
+        return "Udp shape must be a list of positive integers matching the frame size."
+    return None
+
+
+def udp_shape(config):
+    """list: shape of the assembled frames, the modules stacked row by row by default."""
+    params = dict(UDP_DEFAULTS, **config)
+    if params["shape"] is not None:
+        return params["shape"]
+    return [len(params["ports"]) * params["rows"], params["row_size"] // np.dtype(params["type"]).itemsize]
+
+
+class FrameAssembler:
+    """Assembles the frames of a detector sending its rows in UDP packets.
+
+    Every packet carries a run of rows of one module, placed in the frame
+    at the position of the module and its starting row. A frame is
+    complete when all the rows of all the modules arrived; the frames
+    missing packets are given up when they waited longer than the timeout
+    or fall out of the window (newest frame minus the window). Packets of
+    frames already completed or given up are late, packets repeating rows
+    are duplicates and packets that don't fit the frame are bad. A frame
+    number further back than the window (the detector restarted its
+    numbering, or it wrapped) or a new scan id starts a new acquisition:
+    the pending frames are given up and the numbering starts over.
+
+    Args:
+        n_modules (int): Number of modules (UDP ports) of a frame.
+        rows (int): Rows of a module per frame.
+        row_size (int): Bytes per row.
+        window (int, optional): Frames held while waiting for packets. Defaults to 32.
+        timeout (float, optional): Time (s) a frame waits for its missing packets. Defaults to 0.1.
+        send_incomplete (bool, optional): Releases the given up frames with their
+            missing rows zeroed. Defaults to False (dropped).
+    """
+
+    def __init__(self, n_modules, rows, row_size, window=32, timeout=0.1, send_incomplete=False):
+        self._rows = rows
+        self._row_size = row_size
+        self._n_rows = n_modules * rows
+        self._window = window
+        self._timeout = timeout
+        self._send_incomplete = send_incomplete
+        self._ones = memoryview(b"\x01" * rows)
+        # frame number -> [arrival time, stamp, frame buffer, received rows mask, received rows]
+        self._pending = OrderedDict()
+        self._done = set()
+        self._done_order = deque()
+        self._newest = None
+        self._scan_id = None
+        self.frames = 0
+        self.restarts = 0
+        self.incomplete = 0
+        self.dropped = 0
+        self.missing_rows = 0
+        self.late_packets = 0
+        self.duplicate_packets = 0
+        self.bad_packets = 0
+
+    @property
+    def pending(self):
+        """int: frames waiting for packets."""
+        return len(self._pending)
+
+    def reset(self):
+        self._pending.clear()
+        self._done.clear()
+        self._done_order.clear()
+        self._newest = None
+        self._scan_id = None
+
+    def add(self, module, frame, starting_row, payload, stamp=None, scan_id=None):
+        """Adds the rows of a packet.
+
+        Args:
+            module (int): Index of the module (UDP port).
+            frame (int): Frame number of the packet.
+            starting_row (int): First row of the packet in the module.
+            payload (memoryview): The rows.
+            stamp (optional): Kept with the frame from its first packet (e.g. timestamps).
+            scan_id (int, optional): Scan id of the packet, a new one starts a
+                new acquisition. Defaults to None (not checked).
+
+        Returns:
+            list: the released frames, as (frame number, buffer, missing rows, stamp).
+        """
+        n = len(payload) // self._row_size
+        if n == 0 or len(payload) % self._row_size or starting_row + n > self._rows:
+            self.bad_packets += 1
+            return []
+        released = []
+        if self._newest is not None and (frame < self._newest - self._window
+                                         or (scan_id is not None and self._scan_id not in (None, scan_id))):
+            self._restart(frame, scan_id, released)
+        elif frame in self._done or (self._newest is not None and frame == self._newest - self._window):
+            self.late_packets += 1
+            return []
+        if scan_id is not None:
+            self._scan_id = scan_id
+        entry = self._pending.get(frame)
+        if entry is None:
+            entry = self._pending[frame] = [time.monotonic(), stamp, bytearray(self._n_rows * self._row_size),
+                                            bytearray(self._n_rows), 0]
+            if self._newest is None or frame > self._newest:
+                self._newest = frame
+                self._give_up(lambda number, arrival: number <= frame - self._window, released)
+        first = module * self._rows + starting_row
+        mask = entry[3]
+        if mask.count(1, first, first + n):
+            self.duplicate_packets += 1
+            return released
+        mask[first:first + n] = self._ones[:n]
+        entry[2][first * self._row_size:(first + n) * self._row_size] = payload
+        entry[4] += n
+        if entry[4] == self._n_rows:
+            del self._pending[frame]
+            self._finish(frame)
+            self.frames += 1
+            released.append((frame, entry[2], 0, entry[1]))
+        return released
+
+    def expire(self, now=None):
+        """Gives up the frames that waited longer than the timeout.
+
+        Returns:
+            list: the released frames (send_incomplete), as in add.
+        """
+        limit = (time.monotonic() if now is None else now) - self._timeout
+        released = []
+        self._give_up(lambda number, arrival: arrival < limit, released)
+        return released
+
+    def _restart(self, frame, scan_id, released):
+        _logger.info(f"RepStream.FrameAssembler new acquisition (frame {frame} after {self._newest}, "
+                     f"scan id {scan_id} after {self._scan_id})...")
+        self._give_up(lambda number, arrival: True, released)
+        self.reset()
+        self.restarts += 1
+
+    def _give_up(self, condition, released):
+        # the pending frames are in arrival order of their first packet
+        while self._pending:
+            number, entry = next(iter(self._pending.items()))
+            if not condition(number, entry[0]):
+                break
+            del self._pending[number]
+            self._finish(number)
+            missing = self._n_rows - entry[4]
+            self.incomplete += 1
+            self.missing_rows += missing
+            _logger.debug(f"RepStream.FrameAssembler frame {number} incomplete ({missing} rows missing)...")
+            if self._send_incomplete:
+                self.frames += 1
+                released.append((number, entry[2], missing, entry[1]))
+            else:
+                self.dropped += 1
+
+    def _finish(self, frame):
+        self._done.add(frame)
+        self._done_order.append(frame)
+        if len(self._done_order) > 4 * self._window:
+            self._done.discard(self._done_order.popleft())
+
+
+class UdpIngest:
+    def __init__(self, receiver, config, sentinel, timestamps=False, poll_timeout=100):
+        """Initialize the UDP input of a detector (GigaFRoST packets).
+
+        The UDP ports of the detector modules are bound by this repeater,
+        instead of receiving the frames from an upstream zmq stream. The
+        packets are received in batches (up to ``batch`` per socket and
+        wake up, into a preallocated buffer), assembled into frames by
+        FrameAssembler from the frame number and starting row of their
+        GFHeader (decoded for the whole batch), and the frames are dispatched by the receiver to the
+        output streams (reorder buffer included).
+
+        The assembled message has a json header (frame, shape, type, source
+        and, for an incomplete frame, missing_rows) and one payload with the
+        rows of all the modules.
+
+        Args:
+            receiver: Receiver object that dispatches the frames to the output streams.
+            config (dict): The udp configuration (see valid_udp).
+            sentinel: Flag object to halt execution.
+            timestamps: Stamps every frame with the ingress time of its first packet.
+            poll_timeout: Maximum time (ms) between two checks of the sentinel.
+        """
+        _logger.debug("RepStreamer.UdpIngest __init__ ...")
+        self._receiver = receiver
+        self._config = dict(UDP_DEFAULTS, **config)
+        self._sentinel = sentinel
+        self._timestamps = timestamps
+        self._poll_timeout = min(poll_timeout, self._config["timeout_ms"])
+        self._assembler = FrameAssembler(len(self._config["ports"]), self._config["rows"],
+                                         self._config["row_size"], self._config["window"],
+                                         self._config["timeout_ms"] / 1000, self._config["send_incomplete"])
+        self._shape = udp_shape(self._config)
+        self._type = np.dtype(self._config["type"]).name
+        self._sockets = []
+        self._batch = np.empty((self._config["batch"], self._config["packet_size"]), dtype=np.uint8)
+        self._slots = [memoryview(row) for row in self._batch]
+        self._sizes = [0] * self._config["batch"]
+        self._header_fields = ["frame_number", "starting_row", "scan_id"]
+        self.packets = 0
+        self.bytes_received = 0
+        self.rcvbuf = None
+
+    def bind(self):
+        """Binds the UDP ports (non blocking sockets).
+
+        Raises:
+            OSError: A port can't be bound.
+        """
+        self.close()
+        for port in self._config["ports"]:
+            udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self._config["rcvbuf"])
+            udp_socket.bind((self._config["host"], port))
+            udp_socket.setblocking(False)
+            self._sockets.append(udp_socket)
+        # the kernel caps the buffer (net.core.rmem_max) and reports twice the usable size
+        self.rcvbuf = self._sockets[0].getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+    def close(self):
+        for udp_socket in self._sockets:
+            udp_socket.close()
+        self._sockets = []
+
+    def receive(self, module):
+        """Receives a batch of packets of a module and assembles them.
+
+        Args:
+            module (int): Index of the module (UDP port).
+
+        Returns:
+            int: the number of packets received.
+        """
+        udp_socket = self._sockets[module]
+        slots = self._slots
+        sizes = self._sizes
+        n = 0
+        while n < len(slots):
+            try:
+                sizes[n] = udp_socket.recv_into(slots[n])
+            except BlockingIOError:
+                break
+            n += 1
+        if n == 0:
+            return 0
+        stamp = (time.time(), time.perf_counter()) if self._timestamps else None
+        self.packets += n
+        self.bytes_received += sum(sizes[:n])
+        # the headers of the batch are decoded at once
+        columns = decode_headers(self._batch[:n], self._header_fields)
+        frames = columns["frame_number"].tolist()
+        starting_rows = columns["starting_row"].tolist()
+        scan_ids = columns["scan_id"].tolist()
+        assembler = self._assembler
+        for i in range(n):
+            if sizes[i] < GF_HEADER_SIZE:
+                assembler.bad_packets += 1
+                continue
+            for released in assembler.add(module, frames[i], starting_rows[i], slots[i][GF_HEADER_SIZE:sizes[i]],
+                                          stamp, scan_ids[i]):
+                self._dispatch(*released)
+        return n
+
+    def _dispatch(self, frame, buffer, missing_rows, stamp):
+        header = {"frame": frame, "shape": self._shape, "type": self._type, "source": "gf_repstream-udp"}
+        if missing_rows:
+            header["missing_rows"] = missing_rows
+        data = Frame([json.dumps(header).encode(), buffer], frame, header)
+        if stamp is not None:
+            # ingress at the first packet of the frame, received and decoded once assembled
+            assembled = time.perf_counter()
+            data.timestamps = [stamp[0], stamp[1], assembled, assembled]
+        self._receiver.dispatch(data)
+
+    def expire(self):
+        """Gives up the frames missing packets for longer than the timeout."""
+        for released in self._assembler.expire():
+            self._dispatch(*released)
+        self._receiver.flush()
+
+    def get_stats(self):
+        """Statistics of the udp input.
+
+        Returns:
+            dict: dispatched frames, received bytes and packets, bad packets
+                (as decode errors), frames given up incomplete and dropped,
+                missing rows, late and duplicated packets, frames waiting for
+                packets, restarts of the frame numbering (new acquisitions) and
+                the socket receive buffer size.
+        """
+        assembler = self._assembler
+        stats = {
+            "frames_received": assembler.frames,
+            "bytes_received": self.bytes_received,
+            "decode_errors": assembler.bad_packets,
+            "packets_received": self.packets,
+            "frames_incomplete": assembler.incomplete,
+            "frames_dropped": assembler.dropped,
+            "missing_rows": assembler.missing_rows,
+            "packets_late": assembler.late_packets,
+            "packets_duplicate": assembler.duplicate_packets,
+            "pending": assembler.pending,
+            "acquisitions_restarted": assembler.restarts,
+            "rcvbuf": self.rcvbuf,
+        }
+        receiver_stats = self._receiver.get_stats()
+        if "reorder" in receiver_stats:
+            stats["reorder"] = receiver_stats["reorder"]
+        return stats
+
+    def start(self):
+        """Receives the UDP ports (bound first if needed) until the end signal."""
+        _logger.debug(f"RepStream.UdpIngest start (ports {self._config['ports']})")
+        if not self._sockets:
+            self.bind()
+        self._receiver.reset()
+        self._assembler.reset()
+        poller = zmq.Poller()
+        modules = {}
+        for module, udp_socket in enumerate(self._sockets):
+            poller.register(udp_socket.fileno(), zmq.POLLIN)
+            modules[udp_socket.fileno()] = module
+        try:
+            while not self._sentinel.is_set():
+                for fd, _ in poller.poll(self._poll_timeout):
+                    self.receive(modules[fd])
+                self.expire()
+        finally:
+            self.close()
+        _logger.debug("RepStream.UdpIngest end signal received... finishing udp ingest...")
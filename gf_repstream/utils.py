@@ -4,7 +4,7 @@ import re
 import zmq 
 
 def validate_zmq_mode(zmq_mode):
-    if zmq_mode.upper() in ['PULL', 'PUB']:
+    if isinstance(zmq_mode, str) and zmq_mode.upper() in ['PULL', 'SUB', 'PUB']:
         return True
     return False
 
@@ -62,6 +62,10 @@ def validate_network_address(network_address, protocol='tcp'):
         connection_pattern = protocol_pattern + ip_pattern + port_pattern
         if bool(re.match(connection_pattern, network_address)):
             return network_address
+    # otherwise the address is given with a host name
+    connection_pattern = protocol_pattern + hostname_pattern + port_pattern + "$"
+    if bool(re.match(connection_pattern, network_address)):
+        return network_address
 
 def valid_writer_config(writer_dict):
     mandatory_keys = ["output_file", "run_id","n_images", "detector_name"]
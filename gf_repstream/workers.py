@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+
+class OrderedPool:
+    """Bounded pool of worker threads (or processes) whose results come out
+    in the order the items were submitted.
+
+    Meant for per frame work that releases the GIL (numpy, compression
+    codecs), or that holds it with a process pool (the items and results
+    are pickled): up to ``max_in_flight`` items are processed concurrently and
+    the owner stops submitting while the pool is full (backpressure). A
+    byte is written to a pipe every time an item is done, so a poller loop
+    can wait on ``fileno()`` (and then ``clear`` it) instead of polling the
+    pool.
+
+    Only one thread at a time must submit and pop.
+
+    Args:
+        function (callable): Function applied to every item.
+        workers (int): Number of worker threads.
+        max_in_flight (int, optional): Maximum number of items submitted and
+            not popped yet. Defaults to twice the number of workers.
+        name (str, optional): Prefix of the names of the worker threads.
+        processes (bool, optional): Runs the function in worker processes (spawned),
+            it must then be a module level function. Defaults to False.
+        initializer (callable, optional): Called with initargs at the start of
+            every worker process.
+        initargs (tuple, optional): Arguments of the initializer.
+        prepare (callable, optional): Applied to every item in the submitting
+            thread, e.g. to make it picklable.
+    """
+
+    def __init__(self, function, workers, max_in_flight=None, name="worker", processes=False,
+                 initializer=None, initargs=(), prepare=None):
+        self._function = function
+        self._prepare = prepare
+        if processes:
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=initializer, initargs=initargs)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._max_in_flight = max_in_flight or 2 * workers
+        # (context, future) in submission order
+        self._in_flight = deque()
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        # a full pipe (nobody clears it) must not block the workers
+        os.set_blocking(self._write_fd, False)
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    def fileno(self):
+        """int: file descriptor readable when items are done."""
+        return self._read_fd
+
+    def full(self):
+        """bool: True if no item can be submitted before the oldest one is popped."""
+        return len(self._in_flight) >= self._max_in_flight
+
+    def ready(self):
+        """bool: True if the oldest item is done."""
+        return bool(self._in_flight) and self._in_flight[0][1].done()
+
+    def submit(self, item, context=None):
+        """Processes an item on the pool.
+
+        Args:
+            item: Argument of the function.
+            context (optional): Returned with the result by pop.
+        """
+        if self._prepare is not None:
+            item = self._prepare(item)
+        future = self._executor.submit(self._function, item)
+        future.add_done_callback(self._notify)
+        self._in_flight.append((context, future))
+
+    def _notify(self, future):
+        try:
+            os.write(self._write_fd, b"x")
+        except OSError:
+            # full pipe or closed pool
+            pass
+
+    def wait(self, timeout=None):
+        """Waits until the oldest item is done.
+
+        Args:
+            timeout (float, optional): Maximum time in seconds to wait. Defaults to None.
+
+        Returns:
+            bool: True if the oldest item is done.
+        """
+        if not self._in_flight:
+            return False
+        wait([self._in_flight[0][1]], timeout=timeout)
+        return self._in_flight[0][1].done()
+
+    def pop(self):
+        """Oldest item, once it is done (see ready and wait).
+
+        Returns:
+            tuple: (context, result, exception), exception is None if the function
+                returned and result is None if it raised.
+        """
+        context, future = self._in_flight.popleft()
+        exception = future.exception()
+        return context, None if exception is not None else future.result(), exception
+
+    def clear(self):
+        """Empties the pipe of fileno, the state of the items is given by ready."""
+        try:
+            while os.read(self._read_fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        """Waits for the items in flight and stops the workers.
+
+        Returns:
+            list: the contexts of the items that were not popped, in submission order.
+        """
+        self._executor.shutdown(wait=True)
+        contexts = [context for context, _ in self._in_flight]
+        self._in_flight.clear()
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+        return contexts
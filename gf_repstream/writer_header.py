@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+import json
+import re
+
+from frame import INGRESS_TIME_KEY
+
+# keys of the std-det-writer header that are added to the received header
+_WRITER_KEYS = ["output_file", "run_id", "user_id", "n_images", "status", "detector_name", "i_image"]
+# per frame counters of the std-det-writer header (and writer keys, which must not be there)
+_KEYS_PATTERN = re.compile(rb'"(frame|image_number|%s)"\s*:\s*(-?\d+)?'
+                           % b"|".join(key.encode() for key in _WRITER_KEYS))
+# key and opening brace of the image attributes of the received header
+_ATTRIBUTES_PATTERN = re.compile(rb'"image_attributes"\s*:\s*\{')
+# json header whose strings have no brackets nor escaped characters
+_PLAIN_STRINGS_PATTERN = re.compile(rb'[^"]*(?:"[^"\[\]{}\\]*"[^"]*)*')
+_BRACKETS_PATTERN = re.compile(rb"[\[\]{}]")
+
+
+def _level(raw_header, end):
+    # nesting level at end of a json header with plain strings
+    return (raw_header.count(b"{", 0, end) + raw_header.count(b"[", 0, end)
+            - raw_header.count(b"}", 0, end) - raw_header.count(b"]", 0, end))
+
+
+def _patchable(raw_header, matches):
+    # True if the two counters are the top level frame and the image number
+    # directly in the top level image attributes
+    if (len(matches) != 2 or {matches[0][1], matches[1][1]} != {b"frame", b"image_number"}
+            or None in (matches[0][2], matches[1][2]) or not raw_header.endswith(b"}")):
+        return False
+    frame, image_number = matches if matches[0][1] == b"frame" else matches[::-1]
+    attributes = raw_header.rfind(b'"image_attributes"', 0, image_number.start())
+    opening = _ATTRIBUTES_PATTERN.match(raw_header, attributes) if attributes >= 0 else None
+    # the brackets are only counted in headers where none of them is in a string
+    if opening is None or _PLAIN_STRINGS_PATTERN.fullmatch(raw_header) is None:
+        return False
+    # no bracket between the opening of the image attributes and the image number
+    return (_level(raw_header, frame.start()) == 1 and _level(raw_header, attributes) == 1
+            and _BRACKETS_PATTERN.search(raw_header, opening.end(), image_number.start()) is None)
+
+
+class WriterHeader:
+    """Header of the std-det-writer output stream, prepared once per run.
+
+    The writer header is the received header with the frame and image
+    number replaced by the counter of the output stream, followed by the
+    writer configuration (constant for the whole run) and the image index.
+    The constant part is serialized once; for every frame only the two
+    counters are patched into the raw received header, which is then
+    concatenated with the constant part, without decoding or encoding json.
+    Headers that can't be patched safely (counters missing, repeated or
+    not at their place, writer keys already present, brackets or escaped
+    characters in strings) go through the json path.
+
+    Args:
+        writer_config (dict): Writer configuration (output_file, run_id, user_id,
+            n_images, detector_name).
+    """
+
+    def __init__(self, writer_config):
+        self._constants = {
+            "output_file": writer_config["output_file"],
+            "run_id": writer_config["run_id"],
+            "user_id": writer_config["user_id"],
+            "n_images": writer_config["n_images"],
+            "status": 0,
+            "detector_name": writer_config["detector_name"],
+        }
+        # ', "output_file": ..., "detector_name": ..., "i_image": '
+        self._suffix = b", " + json.dumps(self._constants)[1:-1].encode() + b', "i_image": '
+
+    def metadata(self, header, counter):
+        """Writer header as a dictionary (json path).
+
+        Args:
+            header (dict): The decoded received header (not modified).
+            counter (int): Index of the frame in the output stream.
+
+        Returns:
+            dict: the writer header.
+        """
+        metadata = dict(header)
+        metadata["image_attributes"] = dict(header["image_attributes"])
+        metadata["image_attributes"]["image_number"] = counter
+        metadata["frame"] = counter
+        metadata.update(self._constants)
+        metadata["i_image"] = counter
+        return metadata
+
+    def render(self, data, counter, ingress_time=None):
+        """Serialized writer header of a frame.
+
+        Args:
+            data (Frame): The envelope of the received message.
+            counter (int): Index of the frame in the output stream.
+            ingress_time (float, optional): Ingress time to add to the header.
+                Defaults to None.
+
+        Returns:
+            bytes: the json writer header.
+        """
+        raw_header = data.raw_header.rstrip()
+        matches = list(_KEYS_PATTERN.finditer(raw_header))
+        if not _patchable(raw_header, matches):
+            metadata = self.metadata(data.header, counter)
+            if ingress_time is not None:
+                metadata[INGRESS_TIME_KEY] = ingress_time
+            return json.dumps(metadata).encode()
+        value = b"%d" % counter
+        first, second = matches[0].span(2), matches[1].span(2)
+        header = b"".join((
+            raw_header[:first[0]], value,
+            raw_header[first[1]:second[0]], value,
+            raw_header[second[1]:-1], self._suffix, value,
+        ))
+        if ingress_time is not None:
+            header += b', "%s": %.6f' % (INGRESS_TIME_KEY.encode(), ingress_time)
+        return header + b"}"